@@ -0,0 +1,57 @@
+"""Moves of many chats, one Game at a time against one play_batch call
+
+One at a time is what lib.App does per update, from_bytes, the move and
+to_bytes, each a crossing into the extension with the GIL held.
+
+python bench/batch.py [games] [players] [iterations]
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from monopoly import Game, play_batch  # noqa: E402
+
+
+def one_at_a_time(moves: list[tuple[bytes, str, int, None]]) -> list[bytes]:
+    result: list[bytes] = []
+    for data, _action, caller_id, _arg in moves:
+        game, _maybe_auction = Game.from_bytes(data)
+        game.roll(caller_id)
+        result.append(game.to_bytes())
+    return result
+
+
+def batched(moves: list[tuple[bytes, str, int, None]]) -> list[bytes]:
+    return [data for data, _output, _result, _maybe_auction in play_batch(moves)]
+
+
+def main(games: int, players: int, iterations: int) -> None:
+    moves: list[tuple[bytes, str, int, None]] = [
+        (
+            Game([(id_, f"user{id_}") for id_ in range(players)], seed).to_bytes(),
+            "roll",
+            0,
+            None,
+        )
+        for seed in range(games)
+    ]
+    assert one_at_a_time(moves) == batched(moves)
+
+    print(f"{games} games of {players} players")
+    for name, call in (
+        ("one at a time", lambda: one_at_a_time(moves)),
+        ("play_batch", lambda: batched(moves)),
+    ):
+        seconds: float = min(timeit.repeat(call, number=iterations, repeat=5))
+        print(f"{name:>16}: {seconds / iterations / games * 1e6:.2f} us per move")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 64,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 1000,
+    )
@@ -0,0 +1,143 @@
+"""Round trip and server time of a move, DO blocks against prepared statements
+
+Runs against the database from src/secret.txt on a scratch chat that is
+removed afterwards. Server time is read from pg_stat_statements if the
+extension is installed and visible to the user.
+
+python bench/db_writes.py [iterations]
+"""
+
+import sys
+import time
+import asyncio
+from pathlib import Path
+from statistics import median, quantiles
+from typing import Optional
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from psycopg import AsyncConnection, Error, sql  # noqa: E402
+
+import db  # noqa: E402
+
+
+CHAT_ID: int = -(2**62)
+USER_IDS: tuple[int, int] = (-1, -2)
+# Version of the scratch game the next prepared move is made on
+VERSIONS: dict[int, int] = dict()
+
+
+async def legacy_roll_user(
+    conn: AsyncConnection, chat_id: int, user_id: int, position: int, money: int
+) -> None:
+    # What db.roll_user used to send, a new text for every move
+    query: sql.Composed = sql.SQL(
+        """DO $$
+BEGIN
+    UPDATE chat 
+    SET 
+        "position" = {position}, 
+        money = {money}, 
+        is_jailed = {is_jailed}, 
+        streak = {streak}
+    WHERE player_id = (
+        SELECT player_id FROM chat
+        WHERE user_id = {user_id} AND chat_id = {chat_id}
+    );
+
+    UPDATE game SET status = {status}
+    WHERE chat_id = {chat_id};
+END $$;"""
+    ).format(
+        position=position,
+        money=money,
+        is_jailed=False,
+        streak=0,
+        user_id=user_id,
+        chat_id=chat_id,
+        status="roll",
+    )
+    await conn.execute(query)
+    await conn.execute(
+        "UPDATE game SET version = version + 1 WHERE chat_id = %s RETURNING version;",
+        (chat_id,),
+    )
+    await conn.commit()
+
+
+async def prepared_roll_user(
+    conn: AsyncConnection, chat_id: int, user_id: int, position: int, money: int
+) -> None:
+    version: Optional[int] = await db.roll_user(
+        conn, chat_id, user_id, position, money, False, 0, False, 0, VERSIONS[chat_id]
+    )
+    assert version is not None
+    VERSIONS[chat_id] = version
+
+
+async def server_time_ms(conn: AsyncConnection) -> Optional[float]:
+    try:
+        row = await (
+            await conn.execute(
+                """SELECT sum(total_plan_time + total_exec_time) AS total
+FROM pg_stat_statements
+WHERE query NOT LIKE '%%pg_stat_statements%%';"""
+            )
+        ).fetchone()
+    except Error:
+        await conn.rollback()
+        return None
+    await conn.commit()
+    return row["total"] if row is not None else None
+
+
+async def reset_stats(conn: AsyncConnection) -> None:
+    try:
+        await conn.execute("SELECT pg_stat_statements_reset();")
+    except Error:
+        await conn.rollback()
+        return
+    await conn.commit()
+
+
+async def run(conn: AsyncConnection, name: str, move, iterations: int) -> None:
+    await reset_stats(conn)
+    timings: list[float] = []
+    for i in range(iterations):
+        start: float = time.perf_counter()
+        await move(conn, CHAT_ID, USER_IDS[0], i % 40, 1500 + i)
+        timings.append((time.perf_counter() - start) * 1000)
+    server_ms: Optional[float] = await server_time_ms(conn)
+
+    p99: float = quantiles(timings, n=100)[98]
+    server: str = (
+        f"{server_ms / iterations:.3f} ms server"
+        if server_ms is not None
+        else "no pg_stat_statements"
+    )
+    print(f"{name:>10}: p50 {median(timings):.3f} ms, p99 {p99:.3f} ms, {server}")
+
+
+async def main(iterations: int) -> None:
+    conn: AsyncConnection = await db.connect_to_db(None)
+    try:
+        for user_id in USER_IDS:
+            await db.add_user(conn, CHAT_ID, user_id, None)
+        await db.begin_game(conn, CHAT_ID, USER_IDS, 0)
+
+        await run(conn, "DO block", legacy_roll_user, iterations)
+        # Moved on by the DO blocks
+        version: Optional[int] = await db.fetch_version(conn, CHAT_ID)
+        assert version is not None
+        VERSIONS[CHAT_ID] = version
+        await conn.commit()
+        await run(conn, "prepared", prepared_roll_user, iterations)
+    finally:
+        await db.finish_game(conn, CHAT_ID)
+        await conn.execute("DELETE FROM meta WHERE user_id = ANY(%s);", (USER_IDS,))
+        await conn.commit()
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,64 @@
+"""Game state to storage and back, SerGame through JSON against Game.to_bytes
+
+The SerGame path is what the compact store did before the binary format,
+every player is a tuple and every field a Python object on the way.
+
+python bench/serialize.py [players] [iterations]
+"""
+
+import sys
+import json
+import random
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+import compact  # noqa: E402
+from monopoly import Game  # noqa: E402
+
+
+def played_game(players: int, moves: int = 400) -> Game:
+    rng = random.Random(0)
+    user_ids: list[int] = list(range(10**9, 10**9 + players))
+    game = Game([(id_, f"user{id_}") for id_ in user_ids])
+    for _ in range(moves):
+        user_id: int = rng.choice(user_ids)
+        game.roll(user_id)
+        game.buy(user_id)
+        game.build(user_id, rng.randrange(40))
+    return game
+
+
+def ser_game_dump(game: Game) -> str:
+    return json.dumps(compact.encode(game.serialize()))
+
+
+def ser_game_load(data: str) -> Game:
+    return Game.deserialize(compact.decode(json.loads(data)))[0]
+
+
+def report(name: str, seconds: float, iterations: int) -> None:
+    print(f"{name:>16}: {seconds / iterations * 1e6:.2f} us")
+
+
+def main(players: int, iterations: int) -> None:
+    game: Game = played_game(players)
+    as_json: str = ser_game_dump(game)
+    as_bytes: bytes = game.to_bytes()
+    print(f"{players} players, {len(as_json)} bytes JSON, {len(as_bytes)} bytes binary")
+
+    for name, call in (
+        ("SerGame dump", lambda: ser_game_dump(game)),
+        ("to_bytes", game.to_bytes),
+        ("SerGame load", lambda: ser_game_load(as_json)),
+        ("from_bytes", lambda: Game.from_bytes(as_bytes)),
+    ):
+        report(name, min(timeit.repeat(call, number=iterations, repeat=5)), iterations)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10000,
+    )
@@ -0,0 +1,39 @@
+"""Whole games in the engine without Python in between, see monopoly.simulate
+
+python bench/simulate.py [games] [players] [policy]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from monopoly import SimStats, simulate  # noqa: E402
+
+
+def main(games: int, players: int, policy: str) -> None:
+    start: float = time.perf_counter()
+    stats: SimStats = simulate(games, players, policy)
+    seconds: float = time.perf_counter() - start
+
+    print(f"{stats.games} games of {players} players, {policy} policy")
+    print(f"{stats.finished} finished, {stats.bankruptcies} bankruptcies")
+    print(f"{stats.turns / stats.games:.1f} turns per game")
+    print(f"{stats.turns / seconds:,.0f} turns per second")
+
+    # Most and least visited tiles, jail gets every "go to jail" too
+    total: int = sum(stats.landings) or 1
+    by_count: list[tuple[int, int]] = sorted(
+        enumerate(stats.landings), key=lambda item: item[1], reverse=True
+    )
+    for tile_id, count in by_count[:3] + by_count[-3:]:
+        print(f"tile {tile_id:>2}: {count / total:.2%}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+        sys.argv[3] if len(sys.argv) > 3 else "random",
+    )
@@ -0,0 +1,300 @@
+"""Latency and throughput of whole updates through index.handler, per command
+
+Each update goes the way a queue message does: the body is parsed, the
+handler dispatched, the game read and written in Postgres, the engine
+called and the reply sent. Replies go to a stand-in of the Bot API on a
+thread of its own that answers every method at once. Games live in a
+scratch schema of a disposable database, never the one of src/secret.txt.
+
+BENCH_DSN=postgresql://... python bench/updates.py [chats] [rounds] [batch]
+
+batch is how many chats share one invocation, 1 measures single updates.
+Exits with 1 when a phase is slower than its budget in BUDGETS_MS, scaled
+by BENCH_BUDGET_SCALE for slower machines
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from statistics import median, quantiles
+from typing import Any, Callable
+from urllib.parse import parse_qs
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email.policy import HTTP
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+SCHEMA: str = "bench_updates"
+# The schema is dropped, so there's no default to drop it from by mistake
+DSN: str = os.environ.get("BENCH_DSN", "")
+if DSN == "":
+    sys.exit("BENCH_DSN is not set, give the bench a database of its own")
+# p50 and p99 of an invocation in ms, with room for shared CI runners
+BUDGETS_MS: dict[str, tuple[float, float]] = {
+    "cold start": (3000.0, 3000.0),
+    "/start": (150.0, 500.0),
+    "/begin": (150.0, 500.0),
+    "/roll": (100.0, 400.0),
+    "/buy": (100.0, 400.0),
+    "roll button": (100.0, 400.0),
+    "/rent": (100.0, 400.0),
+    "/status": (100.0, 400.0),
+    "/map": (300.0, 2000.0),
+    "chatter": (1.0, 5.0),
+}
+BUDGET_SCALE: float = float(os.environ.get("BENCH_BUDGET_SCALE", "1"))
+# Read by lib and db on import and on connect
+os.environ["DB_DSN"] = DSN
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+os.environ.setdefault("GAME_SEED", "0")
+# The stand-in has no limits, Telegram's would make this a bench of waiting
+os.environ.setdefault("REPLY_CHAT_PER_MIN", "1000000")
+os.environ.setdefault("REPLY_GLOBAL_PER_SEC", "1000000")
+# A JSON line per update would bury the results, TRACE_UPDATES=1 to time them
+os.environ.setdefault("TRACE_UPDATES", "0")
+os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA}"
+
+import psycopg  # noqa: E402
+
+from migrate import migrate  # noqa: E402
+
+
+class BotApi(BaseHTTPRequestHandler):
+    """Answers like the Bot API would, without ever leaving the machine"""
+
+    # Keeps the connections of the bot's pool open like the real one does
+    protocol_version: str = "HTTP/1.1"
+    # Headers and body are separate writes, Nagle would hold the body back
+    disable_nagle_algorithm: bool = True
+    calls: int = 0
+    # Photos sent as files instead of a file_id
+    uploads: int = 0
+    message_id: int = 0
+
+    def do_POST(self) -> None:
+        length: int = int(self.headers.get("Content-Length", 0))
+        body: bytes = self.rfile.read(length)
+        fields: dict[str, str]
+        if self.headers.get_content_type() == "multipart/form-data":
+            # Uploads, board images drawn by /map
+            form: EmailMessage = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+            )
+            fields = {
+                part.get_param("name", header="content-disposition"): part.get_content()
+                for part in form.iter_parts()
+            }
+        else:
+            fields = {
+                name: values[0] for name, values in parse_qs(body.decode()).items()
+            }
+        method: str = self.path.rsplit("/", 1)[-1]
+        BotApi.calls += 1
+        BotApi.message_id += 1
+
+        result: Any
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "b"}
+        elif method in ("sendMessage", "sendPhoto"):
+            result = {
+                "message_id": BotApi.message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(fields["chat_id"]), "type": "group"},
+            }
+            if method == "sendPhoto":
+                BotApi.uploads += isinstance(fields["photo"], bytes)
+                file_id: str = f"photo{BotApi.message_id}"
+                result["photo"] = [
+                    {
+                        "file_id": file_id,
+                        "file_unique_id": file_id,
+                        "width": 704,
+                        "height": 704,
+                    }
+                ]
+        else:
+            result = True
+        answer: bytes = json.dumps({"ok": True, "result": result}).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(answer)))
+        self.end_headers()
+        self.wfile.write(answer)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class BotApiServer(ThreadingHTTPServer):
+    # The default of 5 drops connects of a batch, each costing a second to retry
+    request_queue_size: int = 128
+
+
+def start_bot_api() -> BotApiServer:
+    server: BotApiServer = BotApiServer(("127.0.0.1", 0), BotApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["BOT_API_URL"] = f"http://127.0.0.1:{server.server_port}/bot"
+    return server
+
+
+def user(user_id: int) -> dict[str, Any]:
+    return {
+        "id": user_id,
+        "is_bot": False,
+        "first_name": "P",
+        "username": f"p{user_id}",
+    }
+
+
+def message(update_id: int, chat_id: int, user_id: int, text: str) -> dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group"},
+            "from": user(user_id),
+            "text": text,
+        },
+    }
+
+
+def command(update_id: int, chat_id: int, user_id: int, text: str) -> dict[str, Any]:
+    update: dict[str, Any] = message(update_id, chat_id, user_id, text)
+    update["message"]["entities"] = [
+        {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+    ]
+    return update
+
+
+def button(update_id: int, chat_id: int, user_id: int, data: str) -> dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user(user_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "group"},
+            },
+        },
+    }
+
+
+# A name and the updates of one chat for it, both players send every move
+# so whoever's turn it is makes it
+PHASES: tuple[tuple[str, Callable[[int, int, int], dict]], ...] = (
+    ("/start", lambda u, c, p: command(u, c, p, "/start")),
+    ("/begin", lambda u, c, p: command(u, c, p, "/begin")),
+    ("/roll", lambda u, c, p: command(u, c, p, "/roll")),
+    ("/buy", lambda u, c, p: command(u, c, p, "/buy")),
+    ("roll button", lambda u, c, p: button(u, c, p, "4")),
+    ("/rent", lambda u, c, p: command(u, c, p, "/rent")),
+    ("/status", lambda u, c, p: command(u, c, p, "/status")),
+    ("/map", lambda u, c, p: command(u, c, p, "/map")),
+    # Talk between moves, the game ignores it
+    ("chatter", lambda u, c, p: message(u, c, p, "your turn")),
+)
+PHASE_ONCE: frozenset[str] = frozenset(("/start", "/begin"))
+
+
+def event(updates: list[dict]) -> dict[str, Any]:
+    return {
+        "messages": [
+            {"details": {"message": {"body": json.dumps(update)}}} for update in updates
+        ]
+    }
+
+
+def over_budget(name: str, p50: float, p99: float) -> bool:
+    p50_budget, p99_budget = (ms * BUDGET_SCALE for ms in BUDGETS_MS[name])
+    if p50 <= p50_budget and p99 <= p99_budget:
+        return False
+    print(f"{name:>12}: over the budget of p50 {p50_budget} ms, p99 {p99_budget} ms")
+    return True
+
+
+async def run(chats: int, rounds: int, batch: int) -> list[str]:
+    """Names of the phases over their budget"""
+    over: list[str] = []
+    update_id: int = 0
+    print(f"{chats} chats of 2 players, {batch} chats per invocation")
+    # Imports and App.start of the first invocation, kept out of /start
+    start: float = time.perf_counter()
+    # Only now, lib reads BOT_API_URL of the stand-in on import
+    from index import handler
+    from lib import App
+
+    await App().start(None)
+    cold_ms: float = (time.perf_counter() - start) * 1000
+    print(f"{'cold start':>12}: {cold_ms:.3f} ms")
+    if over_budget("cold start", cold_ms, cold_ms):
+        over.append("cold start")
+    for name, make in PHASES:
+        timings: list[float] = []
+        calls_before: int = BotApi.calls
+        uploads_before: int = BotApi.uploads
+        updates: int = 0
+        for _round in range(1 if name in PHASE_ONCE else rounds):
+            for player in (1, 2):
+                for first in range(0, chats, batch):
+                    bodies: list[dict] = []
+                    for chat_id in range(first + 1, min(first + batch, chats) + 1):
+                        update_id += 1
+                        bodies.append(make(update_id, chat_id, chat_id * 10 + player))
+                    start: float = time.perf_counter()
+                    await handler(event(bodies), None)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    updates += len(bodies)
+
+        seconds: float = sum(timings) / 1000
+        p50: float = median(timings)
+        p99: float = quantiles(timings, n=100)[98] if len(timings) > 1 else timings[0]
+        print(
+            f"{name:>12}: p50 {p50:.3f} ms, p99 {p99:.3f} ms,"
+            f" {updates / seconds:.0f} updates/s,"
+            f" {(BotApi.calls - calls_before) / updates:.2f} API calls per update,"
+            f" {BotApi.uploads - uploads_before} uploads"
+        )
+        if over_budget(name, p50, p99):
+            over.append(name)
+    await App().stop()
+    return over
+
+
+def main(chats: int, rounds: int, batch: int) -> int:
+    server: BotApiServer = start_bot_api()
+    conn: psycopg.Connection = psycopg.connect(DSN)
+    try:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.execute(f"CREATE SCHEMA {SCHEMA};")
+        conn.commit()
+        migrate(conn)
+        over: list[str] = asyncio.run(run(chats, rounds, batch))
+    finally:
+        conn.rollback()
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.commit()
+        conn.close()
+        server.shutdown()
+    return 1 if len(over) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+            int(sys.argv[3]) if len(sys.argv) > 3 else 1,
+        )
+    )
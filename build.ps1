@@ -7,6 +7,13 @@ if (!(Test-Path -Path $linuxPath) -or !(Test-Path -Path $winPath))
     Exit 1
 }
 
+python src\migrate.py
+if ($LASTEXITCODE -ne 0)
+{
+    echo "Migrations failed"
+    Exit 1
+}
+
 .\clear.ps1
 mkdir build | Out-Null
 
@@ -15,9 +22,15 @@ cp $linuxPath "build\monopoly.cpython-312-x86_64-linux-gnu.so"
 cp "src\__init__.py" build
 cp "src\lib.py" build
 cp "src\db.py" build
+cp "src\cache.py" build
+cp "src\compact.py" build
+cp "src\render.py" build
+cp "src\outbox.py" build
+cp "src\board.py" build
+cp "src\routes.py" build
+cp "src\metrics.py" build
 cp "src\secret.py" build
 cp "src\begin_game.sql" build
-cp "src\begin_user.sql" build
 cp "src\select.sql" build
 
 cp requirements.txt build
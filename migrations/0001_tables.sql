@@ -0,0 +1,42 @@
+CREATE TABLE IF NOT EXISTS chat
+(
+    player_id serial NOT NULL,
+    chat_id bigint NOT NULL,
+    user_id bigint NOT NULL,
+    "position" smallint NOT NULL,
+    money integer NOT NULL,
+    is_jailed boolean NOT NULL DEFAULT FALSE,
+    streak smallint NOT NULL DEFAULT 0,
+    PRIMARY KEY (player_id)
+);
+
+CREATE TABLE IF NOT EXISTS game
+(
+    chat_id bigint NOT NULL,
+    status character varying(10) NOT NULL,
+    current_player smallint NOT NULL,
+    biggest_bid integer NOT NULL DEFAULT 0,
+    bid_time_sec bigint NOT NULL DEFAULT 0,
+    bidder_id bigint NOT NULL DEFAULT 0,
+    version bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id)
+);
+
+CREATE TABLE IF NOT EXISTS meta
+(
+    user_id bigint NOT NULL,
+    username character varying(32) NOT NULL,
+    PRIMARY KEY (user_id)
+);
+
+CREATE TABLE IF NOT EXISTS player
+(
+    id serial NOT NULL,
+    player_id integer NOT NULL,
+    tile_id smallint NOT NULL,
+    house_count smallint NOT NULL,
+    PRIMARY KEY (id)
+);
+
+-- Tables created from these notes before the game cache existed
+ALTER TABLE game ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT 0;
@@ -0,0 +1,30 @@
+-- Every query looks players up by (chat_id, user_id) or by chat_id alone
+
+-- Players registered twice before add_user could rely on a conflict
+DELETE FROM chat AS duplicate
+USING chat AS original
+WHERE duplicate.chat_id = original.chat_id
+    AND duplicate.user_id = original.user_id
+    AND duplicate.player_id > original.player_id;
+
+CREATE UNIQUE INDEX chat_chat_id_user_id_key ON chat (chat_id, user_id);
+
+-- Ownership of players that no longer exist
+DELETE FROM player
+WHERE NOT EXISTS (
+    SELECT FROM chat WHERE chat.player_id = player.player_id
+);
+
+DELETE FROM player AS duplicate
+USING player AS original
+WHERE duplicate.player_id = original.player_id
+    AND duplicate.tile_id = original.tile_id
+    AND duplicate.id > original.id;
+
+-- Covers the join in select.sql without visiting the table
+CREATE UNIQUE INDEX player_player_id_tile_id_key
+ON player (player_id, tile_id) INCLUDE (house_count);
+
+ALTER TABLE player
+ADD CONSTRAINT player_player_id_fkey FOREIGN KEY (player_id)
+REFERENCES chat (player_id) ON DELETE CASCADE;
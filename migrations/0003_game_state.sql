@@ -0,0 +1,8 @@
+-- One row per chat for GAME_STORE=compact, see src/compact.py for the layout
+CREATE TABLE IF NOT EXISTS game_state
+(
+    chat_id bigint NOT NULL,
+    version bigint NOT NULL DEFAULT 0,
+    state jsonb NOT NULL,
+    PRIMARY KEY (chat_id)
+);
@@ -0,0 +1,4 @@
+-- Games are stored as Game.to_bytes(), state only keeps the lobby
+-- Rows with a game in state are still read and are converted on their next move
+ALTER TABLE game_state ADD COLUMN IF NOT EXISTS game bytea;
+ALTER TABLE game_state ALTER COLUMN state DROP NOT NULL;
@@ -0,0 +1,2 @@
+-- Dice and card state of the game, games without one get a random state on load
+ALTER TABLE game ADD COLUMN IF NOT EXISTS rng_state bigint;
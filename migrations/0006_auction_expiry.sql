@@ -0,0 +1,14 @@
+-- Auctions by the time of their last bid, the sweeper only reads expired ones
+CREATE INDEX IF NOT EXISTS game_auction_bid_time_sec_idx
+ON game (bid_time_sec) WHERE status = 'auction';
+
+-- Game.get_bid_time_sec() of the saved game, NULL unless it's in an auction
+ALTER TABLE game_state ADD COLUMN IF NOT EXISTS bid_time_sec bigint;
+
+-- Rows already in bytes settle on their next move instead
+UPDATE game_state
+SET bid_time_sec = (state -> 'game' ->> 'bid_time_sec')::bigint
+WHERE state -> 'game' ->> 'status' = 'auction';
+
+CREATE INDEX IF NOT EXISTS game_state_bid_time_sec_idx
+ON game_state (bid_time_sec) WHERE bid_time_sec IS NOT NULL;
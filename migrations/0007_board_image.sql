@@ -0,0 +1,8 @@
+-- Board images uploaded to Telegram by board.Board.key() of what they show
+-- A board drawn once is sent by file_id from then on, by any instance
+CREATE TABLE IF NOT EXISTS board_image
+(
+    board_key character(32) NOT NULL,
+    file_id text NOT NULL,
+    PRIMARY KEY (board_key)
+);
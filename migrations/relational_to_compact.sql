@@ -0,0 +1,48 @@
+-- One-off copy of every chat from the relational tables into game_state
+-- Run with `python src/migrate.py --to-compact` before switching GAME_STORE
+INSERT INTO game_state (chat_id, version, bid_time_sec, state)
+SELECT
+    chat.chat_id,
+    COALESCE(game.version, 0),
+    CASE WHEN game.status = 'auction' THEN game.bid_time_sec END,
+    CASE WHEN game.chat_id IS NULL THEN jsonb_build_object(
+        'ready', jsonb_agg(
+            jsonb_build_array(chat.user_id, meta.username) ORDER BY chat.player_id
+        )
+    ) ELSE jsonb_build_object('game', jsonb_build_object(
+        'current_player', game.current_player,
+        'status', game.status,
+        'players', jsonb_agg(
+            jsonb_build_array(
+                chat.user_id,
+                meta.username,
+                ownership.tiles,
+                chat."position",
+                chat.money,
+                chat.is_jailed,
+                chat.streak
+            ) ORDER BY chat.player_id
+        ),
+        'biggest_bid', game.biggest_bid,
+        'bid_time_sec', game.bid_time_sec,
+        'bidder_id', game.bidder_id,
+        'rng_state', game.rng_state
+    )) END
+FROM chat
+LEFT JOIN meta ON meta.user_id = chat.user_id
+LEFT JOIN game ON game.chat_id = chat.chat_id
+CROSS JOIN LATERAL (
+    SELECT COALESCE(
+        jsonb_agg(jsonb_build_array(tile_id, house_count) ORDER BY tile_id),
+        '[]'::jsonb
+    ) AS tiles
+    FROM player
+    WHERE player.player_id = chat.player_id
+) AS ownership
+GROUP BY chat.chat_id, game.chat_id
+ON CONFLICT (chat_id) DO UPDATE
+SET
+    state = EXCLUDED.state,
+    game = NULL,
+    bid_time_sec = EXCLUDED.bid_time_sec,
+    version = game_state.version + 1;
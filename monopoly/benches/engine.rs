@@ -0,0 +1,32 @@
+//! cargo bench --no-default-features
+//!
+//! Whole games through simulate, lobbies grow past what a table fits to show
+//! lookups by user_id and tile_id don't get slower with more players
+
+use criterion::{criterion_group, criterion_main, BenchmarkId, Criterion, Throughput};
+use monopoly::{simulate_games, Policy, SimStats};
+
+const GAMES: u64 = 64;
+const MAX_TURNS: u64 = 500;
+
+fn lobbies(c: &mut Criterion) {
+    let mut group = c.benchmark_group("simulate");
+    for n_players in [2, 4, 8, 32, 128] {
+        // Turns are counted once up front, the same seed plays the same games
+        let turns: u64 = simulate_games(GAMES, n_players, Policy::Buy, 0, MAX_TURNS).turns;
+        group.throughput(Throughput::Elements(turns));
+        group.bench_with_input(
+            BenchmarkId::from_parameter(n_players),
+            &n_players,
+            |b, &n_players: &usize| {
+                b.iter(|| -> SimStats {
+                    simulate_games(GAMES, n_players, Policy::Buy, 0, MAX_TURNS)
+                });
+            },
+        );
+    }
+    group.finish();
+}
+
+criterion_group!(benches, lobbies);
+criterion_main!(benches);
@@ -0,0 +1,101 @@
+//! Moves of many games in one call, nothing in here touches Python
+
+use pyo3::prelude::{IntoPy, PyObject, Python};
+
+use crate::game::{DecodeError, Event, Game, RollResult, BOARD};
+
+pub enum Action {
+    Roll,
+    Buy,
+    Auction,
+    Bid(isize),
+    Rent,
+    Build(usize),
+}
+
+impl Action {
+    /// arg is the price of a bid and the tile_id of a build, ignored otherwise
+    pub fn parse(name: &str, arg: Option<isize>) -> Result<Self, String> {
+        match (name, arg) {
+            ("roll", _) => Ok(Self::Roll),
+            ("buy", _) => Ok(Self::Buy),
+            ("auction", _) => Ok(Self::Auction),
+            ("bid", Some(price)) => Ok(Self::Bid(price)),
+            ("rent", _) => Ok(Self::Rent),
+            ("build", Some(tile_id)) => usize::try_from(tile_id)
+                .ok()
+                .filter(|&tile_id: &usize| tile_id < BOARD.len())
+                .map(Self::Build)
+                .ok_or_else(|| format!("No tile {tile_id}")),
+            ("bid" | "build", None) => Err(format!("{name} needs an argument")),
+            _ => Err(format!("Unknown action {name}")),
+        }
+    }
+}
+
+/// The second item of what the Game method of the action returns
+pub enum Outcome {
+    Roll(Option<RollResult>),
+    Buy(Option<(isize, usize)>),
+    /// Auction and bid, Some(bid_time_sec)
+    Bid(Option<usize>),
+    Rent(Option<(isize, usize, isize)>),
+    Build(Option<isize>),
+}
+
+impl IntoPy<PyObject> for Outcome {
+    fn into_py(self, py: Python<'_>) -> PyObject {
+        match self {
+            Self::Roll(result) => result.into_py(py),
+            Self::Buy(result) => result.into_py(py),
+            Self::Bid(result) => result.into_py(py),
+            Self::Rent(result) => result.into_py(py),
+            Self::Build(result) => result.into_py(py),
+        }
+    }
+}
+
+pub struct Played {
+    /// to_bytes after the move, whether it did anything or not
+    pub game: Vec<u8>,
+    pub events: Vec<Event>,
+    pub outcome: Outcome,
+    /// Settled while loading, same as from_bytes
+    pub maybe_auction: Option<(isize, usize)>,
+}
+
+pub fn play(data: &[u8], action: &Action, caller_id: usize) -> Result<Played, DecodeError> {
+    let (mut game, maybe_auction) = Game::from_bytes(data)?;
+    let (events, outcome): (Vec<Event>, Outcome) = match *action {
+        Action::Roll => {
+            let (events, result) = game.roll(caller_id);
+            (events, Outcome::Roll(result))
+        }
+        Action::Buy => {
+            let (events, result) = game.buy(caller_id);
+            (events, Outcome::Buy(result))
+        }
+        Action::Auction => {
+            let (events, result) = game.auction(caller_id);
+            (events, Outcome::Bid(result))
+        }
+        Action::Bid(price) => {
+            let (events, result) = game.bid(caller_id, price);
+            (events, Outcome::Bid(result))
+        }
+        Action::Rent => {
+            let (events, result) = game.rent(caller_id);
+            (events, Outcome::Rent(result))
+        }
+        Action::Build(tile_id) => {
+            let (events, result) = game.build(caller_id, tile_id);
+            (events, Outcome::Build(result))
+        }
+    };
+    Ok(Played {
+        game: game.to_bytes(),
+        events,
+        outcome,
+        maybe_auction,
+    })
+}
@@ -1,25 +1,37 @@
 mod board;
+mod codec;
+mod event;
+mod ownership;
+mod rng;
+mod sim;
+
+pub use board::BOARD;
+pub use codec::DecodeError;
+pub use event::{render, Event};
+pub use ownership::{Ownership, Slots};
+pub use sim::{simulate, Policy};
 
 use joinery::JoinableIterator;
 use lazy_format::lazy_format;
 use rand::{
     distributions::{Distribution, Uniform},
-    rngs::ThreadRng,
-    thread_rng,
+    Rng,
 };
 use std::{
     collections::HashMap,
     fmt::Display,
+    sync::Arc,
     time::{SystemTime, UNIX_EPOCH},
 };
 
 use crate::{
     game::board::{
         chance_roll, chest_roll, Card, CardEffect, Colour, GetCost, Railroad, Tile, TileType,
-        Utility, BOARD, COLOUR_BROWN, COLOUR_DARK_BLUE, COLOUR_GREEN, COLOUR_LIGHT_BLUE,
-        COLOUR_ORANGE, COLOUR_PINK, COLOUR_RED, COLOUR_YELLOW,
+        Utility, COLOUR_BROWN, COLOUR_DARK_BLUE, COLOUR_GREEN, COLOUR_LIGHT_BLUE, COLOUR_ORANGE,
+        COLOUR_PINK, COLOUR_RED, COLOUR_YELLOW,
     },
-    io::{PoorOut, SerGame, SerPlayer},
+    game::{event::Name, rng::GameRng},
+    io::{SerGame, SerPlayer, TileSlots},
 };
 
 /// Status is defined by waiting for the next action
@@ -53,9 +65,9 @@ impl Status {
 
 pub struct Player {
     user_id: usize,
-    username: Option<String>,
+    username: Name,
     // tile id to number of houses built
-    ownership: HashMap<usize, u8>,
+    ownership: Ownership,
     pub position: usize,
     pub money: isize,
     pub is_jailed: bool,
@@ -66,8 +78,8 @@ impl Player {
     pub fn new(user_id: usize, username: Option<String>) -> Self {
         Self {
             user_id,
-            username,
-            ownership: HashMap::new(),
+            username: username.map(Arc::from),
+            ownership: Ownership::new(),
             position: 0,
             money: 1500,
             is_jailed: false,
@@ -77,8 +89,8 @@ impl Player {
     pub fn serialize(&self) -> SerPlayer {
         (
             self.user_id,
-            self.username.clone(),
-            self.ownership.clone(),
+            self.username.as_deref().map(str::to_owned),
+            TileSlots(self.ownership.to_slots()),
             self.position,
             self.money,
             self.is_jailed,
@@ -88,37 +100,38 @@ impl Player {
     pub fn deserialize(player: &SerPlayer) -> Self {
         Self {
             user_id: player.0,
-            username: player.1.clone(),
-            ownership: player.2.clone(),
+            username: player.1.as_deref().map(Arc::from),
+            ownership: Ownership::from_slots(&player.2 .0).expect("TileSlots are checked"),
             position: player.3,
             money: player.4,
             is_jailed: player.5,
             streak: player.6,
         }
     }
-    pub fn try_buying(&mut self, name: &str, prop: impl GetCost) -> (PoorOut, bool) {
+    pub fn try_buying(&mut self, prop: impl GetCost) -> (Event, bool) {
         let cost: isize = prop.get_cost();
-        let (out, success) = if self.money < cost {
-            (
-                format!(
-                    "Not enough money. \n{} in the bank. {} costs {}",
-                    self.money, name, cost
-                ),
-                false,
-            )
+        if self.money < cost {
+            let event: Event = Event::CantAffordTile {
+                user_id: self.user_id,
+                money: self.money,
+                tile_id: self.position,
+                cost,
+            };
+            (event, false)
         } else {
             self.money -= cost;
             self.ownership.insert(self.position, 0);
-            (
-                format!("Purchased {}. \n{} in the bank.", name, self.money),
-                true,
-            )
-        };
-
-        (PoorOut::new(out, String::new()), success)
+            let event: Event = Event::Purchased {
+                user_id: self.user_id,
+                tile_id: self.position,
+                cost,
+                money: self.money,
+            };
+            (event, true)
+        }
     }
     fn win_bid(&mut self, tile_id: usize) {
-        let _: Option<u8> = self.ownership.insert(tile_id, 0);
+        self.ownership.insert(tile_id, 0);
         let cost = match BOARD[tile_id].inner {
             TileType::Street(prop) => prop.get_cost(),
             TileType::Railroad(prop) => prop.get_cost(),
@@ -139,11 +152,11 @@ impl Player {
         self.is_jailed = true;
         self.position = 10;
     }
-    fn roll_card<const IS_CHANCE: bool>(&mut self) -> &'static str {
+    fn roll_card<const IS_CHANCE: bool>(&mut self, rng: &mut impl Rng) -> &'static str {
         let card: Card = if IS_CHANCE {
-            chance_roll()
+            chance_roll(rng)
         } else {
-            chest_roll()
+            chest_roll(rng)
         };
         match card.effect {
             CardEffect::Assession => {
@@ -216,35 +229,13 @@ impl Player {
     }
 }
 
-fn roll_dice() -> (usize, usize) {
-    let mut rng: ThreadRng = thread_rng();
+fn roll_dice(rng: &mut impl Rng) -> (usize, usize) {
     let side: Uniform<usize> = Uniform::new(1, 7);
-    (side.sample(&mut rng), side.sample(&mut rng))
-}
-
-fn check_owner(players: &[Player], position: &usize) -> bool {
-    players
-        .iter()
-        .any(|player: &Player| -> bool { player.ownership.contains_key(position) })
-}
-
-fn find_owner<'game>(players: &'game [Player], position: &usize) -> Option<&'game Player> {
-    players
-        .iter()
-        .find(|player: &&'game Player| -> bool { player.ownership.contains_key(position) })
+    (side.sample(rng), side.sample(rng))
 }
 
-fn find_by_id_mut(players: &mut [Player], user_id: usize) -> Option<&mut Player> {
-    players
-        .iter_mut()
-        .find(|player: &&mut Player| player.user_id == user_id)
-}
-
-fn find_by_id(players: &[Player], user_id: usize) -> Option<&Player> {
-    players
-        .iter()
-        .find(|player: &&Player| player.user_id == user_id)
-}
+/// An auction closes this long after the last bid
+pub const AUCTION_SEC: usize = 10;
 
 fn get_now_sec() -> usize {
     let now = SystemTime::now();
@@ -256,8 +247,8 @@ fn get_now_sec() -> usize {
     .expect("No overflow from timestamp")
 }
 
-fn format_ownership(row: (&usize, &u8)) -> impl Display {
-    let (&tile_id, &house_count) = row;
+fn format_ownership(row: (usize, u8)) -> impl Display {
+    let (tile_id, house_count) = row;
     let name: &'static str = BOARD[tile_id].name;
     lazy_format!("{tile_id}. {name} - {house_count} house(s)")
 }
@@ -269,13 +260,24 @@ pub struct Game {
     biggest_bid: isize, // 0 means None
     bid_time_sec: usize,
     bidder_id: usize,
+    // Dice and cards, saved with the game so a replay rolls the same
+    rng: GameRng,
+    // Derived from players and never saved, see reindex
+    // Order in players of the owner of every tile
+    owners: [Option<usize>; BOARD.len()],
+    // user_id to order in players
+    orders: HashMap<usize, usize>,
 }
 
+/// user_id, money and tile_id of who won an auction
+pub type Settled = (usize, isize, usize);
+
 /// position, money, is_jailed, streak, game.status == "buy"
 pub type RollResult = (usize, isize, bool, u8, bool);
 
 impl Game {
-    pub fn new(info: Vec<(usize, Option<String>)>) -> Self {
+    /// Without a seed the rolls are random
+    pub fn new(info: Vec<(usize, Option<String>)>, seed: Option<u64>) -> Self {
         let players: Vec<Player> = info
             .into_iter()
             .map(|(user_id, username)| Player::new(user_id, username))
@@ -287,7 +289,11 @@ impl Game {
             biggest_bid: 0,
             bid_time_sec: 0,
             bidder_id: 0,
+            rng: seed.map_or_else(GameRng::from_entropy, GameRng::new),
+            owners: [None; BOARD.len()],
+            orders: HashMap::new(),
         }
+        .indexed()
     }
     pub fn serialize(&self) -> SerGame {
         // I could serialize into JSON or something in Rust but Python would have to deserialize anyway
@@ -302,63 +308,125 @@ impl Game {
             self.biggest_bid,
             self.bid_time_sec,
             self.bidder_id,
+            Some(self.get_rng_state()),
         )
     }
     /// If an auction ends during deserialization, returns Some((money, tile_id))
     /// bidder_id can be got from ser_game
     pub fn deserialize(game: &SerGame) -> (Self, Option<(isize, usize)>) {
-        let mut status: Status = Status::deserialize(&game.status);
-        let mut current_player: usize = game.current_player;
-        let mut players: Vec<Player> = game.players.iter().map(Player::deserialize).collect();
-        let bid_time_sec: usize = game.bid_time_sec;
-
-        let maybe_auction: Option<(isize, usize)> = (matches!(status, Status::Auction)
-            && (get_now_sec() - bid_time_sec > 10))
-            .then(|| -> (isize, usize) {
-                // 10 seconds passed, the biggest bid gets the purchase
-                status = Status::Roll;
-
-                let player: &Player = &players[current_player];
-                let tile_id: usize = player.position;
-
-                if current_player + 1 < players.len() {
-                    current_player += 1;
-                } else {
-                    current_player = 0;
-                }
+        let mut result: Self = Self::load(game);
+        let (_events, maybe_settled) = result.settle_auction();
+        (
+            result,
+            maybe_settled.map(|(_user_id, money, tile_id)| (money, tile_id)),
+        )
+    }
+    /// The game as saved, an auction past its time stays open, see settle_auction
+    pub fn load(game: &SerGame) -> Self {
+        Self {
+            current_player: game.current_player,
+            players: game.players.iter().map(Player::deserialize).collect(),
+            status: Status::deserialize(&game.status),
+            biggest_bid: game.biggest_bid,
+            bid_time_sec: game.bid_time_sec,
+            bidder_id: game.bidder_id,
+            // Games saved before seeds existed carry on with a random one
+            rng: game
+                .rng_state
+                .map_or_else(GameRng::from_entropy, |state: i64| {
+                    GameRng::new(state as u64)
+                }),
+            owners: [None; BOARD.len()],
+            orders: HashMap::new(),
+        }
+        .indexed()
+    }
+    /// Rebuilds owners and orders, needed whenever players are added or removed
+    fn reindex(&mut self) {
+        self.owners = [None; BOARD.len()];
+        self.orders.clear();
+        for (order, player) in self.players.iter().enumerate() {
+            self.orders.insert(player.user_id, order);
+            for (tile_id, _house_count) in player.ownership.iter() {
+                self.owners[tile_id] = Some(order);
+            }
+        }
+    }
+    fn indexed(mut self) -> Self {
+        self.reindex();
+        self
+    }
+    fn order_of(&self, user_id: usize) -> Option<usize> {
+        self.orders.get(&user_id).copied()
+    }
+    fn player_by_id(&self, user_id: usize) -> Option<&Player> {
+        Some(&self.players[self.order_of(user_id)?])
+    }
+    fn owner_of(&self, tile_id: usize) -> Option<&Player> {
+        Some(&self.players[self.owners[tile_id]?])
+    }
+    /// If the auction has ended, closes it and returns Some(Settled)
+    pub fn settle_auction(&mut self) -> (Vec<Event>, Option<Settled>) {
+        if !matches!(self.status, Status::Auction)
+            || get_now_sec().saturating_sub(self.bid_time_sec) <= AUCTION_SEC
+        {
+            return (Vec::new(), None);
+        }
+        let (money, tile_id) = self.close_auction();
+        let winner: &Player = self
+            .player_by_id(self.bidder_id)
+            .expect("bid won't allow invalid players");
+        let event: Event = Event::AuctionWon {
+            user_id: winner.user_id,
+            name: winner.username.clone(),
+            tile_id,
+            money,
+        };
+        (vec![event], Some((self.bidder_id, money, tile_id)))
+    }
+    /// Some(bid_time_sec) of the last bid while there's an auction
+    pub const fn get_bid_time_sec(&self) -> Option<usize> {
+        if matches!(self.status, Status::Auction) {
+            Some(self.bid_time_sec)
+        } else {
+            None
+        }
+    }
+    /// The biggest bid gets the purchase, returns (money, tile_id) of the bidder
+    fn close_auction(&mut self) -> (isize, usize) {
+        self.status = Status::Roll;
 
-                let bidder: &mut Player = find_by_id_mut(&mut players, game.bidder_id)
-                    .expect("bid won't allow invalid players");
-                bidder.win_bid(tile_id);
+        let player: &Player = &self.players[self.current_player];
+        let tile_id: usize = player.position;
 
-                (bidder.money, tile_id)
-            });
+        if self.current_player + 1 < self.players.len() {
+            self.current_player += 1;
+        } else {
+            self.current_player = 0;
+        }
 
-        (
-            Self {
-                current_player,
-                players,
-                status,
-                biggest_bid: game.biggest_bid,
-                bid_time_sec,
-                bidder_id: game.bidder_id,
-            },
-            maybe_auction,
-        )
+        let order: usize = self
+            .order_of(self.bidder_id)
+            .expect("bid won't allow invalid players");
+        self.owners[tile_id] = Some(order);
+        let bidder: &mut Player = &mut self.players[order];
+        bidder.win_bid(tile_id);
+
+        (bidder.money, tile_id)
     }
-    /// Returns result and Some((position, money, is_jailed, streak, game.status == "buy")) if changed
-    pub fn roll(&mut self, caller_id: usize) -> (PoorOut, Option<RollResult>) {
+    /// Returns events and Some((position, money, is_jailed, streak, game.status == "buy")) if changed
+    pub fn roll(&mut self, caller_id: usize) -> (Vec<Event>, Option<RollResult>) {
         if !matches!(self.status, Status::Roll) {
             // Do nothing if it's not the time to roll
-            return (PoorOut::empty(), None);
+            return (Vec::new(), None);
         } else if self.players[self.current_player].user_id != caller_id {
             // Do nothing if it's not the callers turn to roll
-            return (PoorOut::empty(), None);
+            return (Vec::new(), None);
         }
 
         let player_count: usize = self.players.len();
 
-        let (roll_1, roll_2) = roll_dice();
+        let (roll_1, roll_2) = roll_dice(&mut self.rng);
         let rolled_double: bool = roll_1 == roll_2;
 
         let move_to: usize = roll_1 + roll_2 + self.players[self.current_player].position;
@@ -369,72 +437,107 @@ impl Game {
             (false, move_to)
         };
 
-        let has_owner: bool = check_owner(&self.players, &position);
+        let owner: Option<usize> = self.owners[position];
 
         let player: &mut Player = &mut self.players[self.current_player];
 
         let landed_on: Tile = BOARD[position];
 
-        let mut output: PoorOut = PoorOut::new(
-            format!(
-                "{:?} has rolled {} and {}, now on {}.",
-                player.username.as_deref().unwrap_or("None"),
-                roll_1,
-                roll_2,
-                landed_on.name,
-            ),
-            String::new(),
-        );
+        // Roll, passing GO, what the tile did and the balance at most
+        let mut events: Vec<Event> = Vec::with_capacity(4);
+        events.push(Event::Rolled {
+            user_id: caller_id,
+            name: player.username.clone(),
+            dice: (roll_1, roll_2),
+            tile_id: position,
+        });
 
         if looped {
             player.money += 200;
-            output = output.merge_out("Passed GO.");
+            events.push(Event::PassedGo { user_id: caller_id });
         }
         player.position = position;
 
         if rolled_double && player.streak >= 2 {
-            output = output.merge_out("Rolled double 3 times in a row, go to jail.");
+            events.push(Event::Jailed {
+                user_id: caller_id,
+                three_doubles: true,
+            });
             player.go_to_jail();
-            return (output, Some((10, player.money, true, 0, false)));
+            return (events, Some((10, player.money, true, 0, false)));
         } else if rolled_double {
             player.streak += 1;
         } else {
             player.streak = 0;
         }
 
-        if player.ownership.contains_key(&position) {
+        if owner == Some(self.current_player) {
             return (
-                output,
+                events,
                 Some((position, player.money, false, player.streak, false)),
             );
         }
 
         // TODO
         match landed_on.inner {
-            TileType::Street(prop) if !has_owner => {
+            TileType::Street(prop) if owner.is_none() => {
                 self.status = Status::Buy;
-                output =
-                    output.merge_out(&format!("Buy for {} or start an auction.", prop.get_cost()));
+                events.push(Event::Offered {
+                    tile_id: position,
+                    cost: prop.get_cost(),
+                });
             }
-            TileType::Railroad(prop) if !has_owner => {
+            TileType::Railroad(prop) if owner.is_none() => {
                 self.status = Status::Buy;
-                output =
-                    output.merge_out(&format!("Buy for {} or start an auction.", prop.get_cost()));
+                events.push(Event::Offered {
+                    tile_id: position,
+                    cost: prop.get_cost(),
+                });
             }
-            TileType::Utility(prop) if !has_owner => {
+            TileType::Utility(prop) if owner.is_none() => {
                 self.status = Status::Buy;
-                output =
-                    output.merge_out(&format!("Buy for {} or start an auction.", prop.get_cost()));
+                events.push(Event::Offered {
+                    tile_id: position,
+                    cost: prop.get_cost(),
+                });
+            }
+            TileType::Chance => {
+                events.push(Event::CardDrawn {
+                    user_id: caller_id,
+                    is_chance: true,
+                    note: player.roll_card::<true>(&mut self.rng),
+                });
+            }
+            TileType::Chest => {
+                events.push(Event::CardDrawn {
+                    user_id: caller_id,
+                    is_chance: false,
+                    note: player.roll_card::<false>(&mut self.rng),
+                });
             }
-            TileType::Chance => output = output.merge_out(player.roll_card::<true>()),
-            TileType::Chest => output = output.merge_out(player.roll_card::<false>()),
             TileType::GoToJail => {
+                events.push(Event::Jailed {
+                    user_id: caller_id,
+                    three_doubles: false,
+                });
                 player.go_to_jail();
-                return (output, Some((10, player.money, true, 0, false)));
+                return (events, Some((10, player.money, true, 0, false)));
             }
             // TODO bankruptcy
-            TileType::TaxIncome => player.money -= 200,
-            TileType::TaxLuxury => player.money -= 100,
+            TileType::TaxIncome => {
+                player.money -= 200;
+                events.push(Event::Taxed {
+                    user_id: caller_id,
+                    amount: 200,
+                });
+            }
+            TileType::TaxLuxury => {
+                player.money -= 100;
+                events.push(Event::Taxed {
+                    user_id: caller_id,
+                    amount: 100,
+                });
+            }
             TileType::Street(_)
             | TileType::Railroad(_)
             | TileType::Utility(_)
@@ -452,18 +555,20 @@ impl Game {
                 0
             };
         }
-        output = output.merge_out(&format!("{} in the bank.", player.money));
+        events.push(Event::Balance {
+            user_id: caller_id,
+            money: player.money,
+        });
 
         (
-            output,
+            events,
             Some((position, player.money, false, player.streak, !is_roll)),
         )
     }
-    /// Returns result and money with tile_id if successful
-    pub fn buy(&mut self, caller_id: usize) -> (PoorOut, Option<(isize, usize)>) {
+    pub fn buy(&mut self, caller_id: usize) -> (Vec<Event>, Option<(isize, usize)>) {
         if !matches!(self.status, Status::Buy) {
             // Do nothing if it's not the time to buy
-            return (PoorOut::empty(), None);
+            return (Vec::new(), None);
         }
 
         let player: &Player = self
@@ -478,18 +583,13 @@ impl Game {
         // Is non-purchasable
         if player.user_id != caller_id {
             // Do nothing if it's not the caller's turn to buy
-            return (PoorOut::empty(), None);
-        } else if let Some(owner) = find_owner(&self.players, &player.position) {
-            return (
-                PoorOut::new(
-                    format!(
-                        "This property is already owned by {}",
-                        owner.username.as_deref().unwrap_or("None")
-                    ),
-                    String::new(),
-                ),
-                None,
-            );
+            return (Vec::new(), None);
+        } else if let Some(owner) = self.owner_of(player.position) {
+            let event: Event = Event::AlreadyOwned {
+                owner_id: owner.user_id,
+                owner_name: owner.username.clone(),
+            };
+            return (vec![event], None);
         }
 
         let tile: Tile = BOARD[player.position];
@@ -498,10 +598,10 @@ impl Game {
             .get_mut(self.current_player)
             .expect("pointers have been tracked accurately");
 
-        let (output, success) = match tile.inner {
-            TileType::Street(prop) => player.try_buying(tile.name, prop),
-            TileType::Railroad(prop) => player.try_buying(tile.name, prop),
-            TileType::Utility(prop) => player.try_buying(tile.name, prop),
+        let (event, success) = match tile.inner {
+            TileType::Street(prop) => player.try_buying(prop),
+            TileType::Railroad(prop) => player.try_buying(prop),
+            TileType::Utility(prop) => player.try_buying(prop),
             TileType::Chance
             | TileType::Chest
             | TileType::Free
@@ -510,119 +610,138 @@ impl Game {
             | TileType::JailVisit
             | TileType::TaxIncome
             | TileType::TaxLuxury => (
-                PoorOut::new("Non-purchasable tile".to_owned(), String::new()),
+                Event::NotPurchasable {
+                    tile_id: player.position,
+                },
                 false,
             ),
         };
         if success {
             self.status = Status::Roll;
-            (output, Some((player.money, player.position)))
+            self.owners[player.position] = Some(self.current_player);
+            (vec![event], Some((player.money, player.position)))
         } else {
-            (output, None)
+            (vec![event], None)
         }
     }
     /// Returns Some(bid_time_sec) if auction starts successfully
-    pub fn auction(&mut self, caller_id: usize) -> (PoorOut, Option<usize>) {
+    pub fn auction(&mut self, caller_id: usize) -> (Vec<Event>, Option<usize>) {
         if !matches!(self.status, Status::Buy) {
             // Do nothing if it's not the time to start auctions
-            return (PoorOut::empty(), None);
+            return (Vec::new(), None);
         }
 
         let player: &Player = &self.players[self.current_player];
         let tile = BOARD[player.position];
         if player.user_id != caller_id {
             // Do nothing if it's not the caller's turn to start auctions
-            return (PoorOut::empty(), None);
-        } else if let Some(owner) = find_owner(&self.players, &player.position) {
-            return (
-                PoorOut::new(
-                    format!(
-                        "This property is already owned by {}",
-                        owner.username.as_deref().unwrap_or("None")
-                    ),
-                    String::new(),
-                ),
-                None,
-            );
+            return (Vec::new(), None);
+        } else if let Some(owner) = self.owner_of(player.position) {
+            let event: Event = Event::AlreadyOwned {
+                owner_id: owner.user_id,
+                owner_name: owner.username.clone(),
+            };
+            return (vec![event], None);
         } else if !matches!(
             tile.inner,
             TileType::Street(_) | TileType::Railroad(_) | TileType::Utility(_)
         ) {
-            return (
-                PoorOut::new("Non-purchasable tile".to_owned(), String::new()),
-                None,
-            );
+            let event: Event = Event::NotPurchasable {
+                tile_id: player.position,
+            };
+            return (vec![event], None);
         } else if player.money < 40 {
-            return (
-                PoorOut::new(
-                    "You don't have enough money to start a bid.".to_owned(),
-                    String::new(),
-                ),
-                None,
-            );
+            let event: Event = Event::CantStartAuction {
+                user_id: caller_id,
+                money: player.money,
+            };
+            return (vec![event], None);
         }
+        let tile_id: usize = player.position;
 
         self.status = Status::Auction;
         self.bidder_id = caller_id;
         self.bid_time_sec = get_now_sec();
         self.biggest_bid = 40;
 
-        (
-            PoorOut::new(
-                "Starting an auction. Starting bid is 40. \n10 seconds to make a bid".to_owned(),
-                String::new(),
-            ),
-            Some(self.bid_time_sec),
-        )
+        let event: Event = Event::AuctionStarted {
+            user_id: caller_id,
+            tile_id,
+            starting_bid: self.biggest_bid,
+        };
+        (vec![event], Some(self.bid_time_sec))
     }
     /// Returns Some(bid_time_sec) if bid is accepted
-    pub fn bid(&mut self, caller_id: usize, price: isize) -> (PoorOut, Option<usize>) {
+    pub fn bid(&mut self, caller_id: usize, price: isize) -> (Vec<Event>, Option<usize>) {
         if !matches!(self.status, Status::Auction) {
             // Do nothing if it's not the time to make bids
-            return (PoorOut::empty(), None);
+            return (Vec::new(), None);
         } else if self.biggest_bid >= price {
-            return (
-                PoorOut::new("Enter a bigger bid".to_owned(), String::new()),
-                None,
-            );
+            let event: Event = Event::BidTooLow {
+                price,
+                biggest_bid: self.biggest_bid,
+            };
+            return (vec![event], None);
         }
 
         self.biggest_bid = price;
         self.bidder_id = caller_id;
         self.bid_time_sec = get_now_sec();
 
-        (
-            PoorOut::new(format!("Biggest bid {}", self.biggest_bid), String::new()),
-            Some(self.bid_time_sec),
-        )
+        let event: Event = Event::BidPlaced {
+            user_id: caller_id,
+            price,
+        };
+        (vec![event], Some(self.bid_time_sec))
     }
     /// Returns Some(caller.money, rentee.user_id, rentee.money) if successful
-    pub fn rent(&mut self, caller_id: usize) -> (PoorOut, Option<(isize, usize, isize)>) {
+    pub fn rent(&mut self, caller_id: usize) -> (Vec<Event>, Option<(isize, usize, isize)>) {
         let rentee: &Player = &self.players[self.current_player];
         if rentee.user_id == caller_id {
-            return (
-                PoorOut::new("Can't ask rent from yourself".to_owned(), String::new()),
-                None,
-            );
+            return (vec![Event::RentFromSelf], None);
         }
-        let Some((caller_order, caller)) = self
-            .players
-            .iter()
-            .enumerate()
-            .find(|(_order, player)| player.user_id == caller_id)
-        else {
+        let Some(caller_order) = self.order_of(caller_id) else {
             // check here if caller is even a player
-            return (PoorOut::empty(), None);
+            return (Vec::new(), None);
         };
-        let Some(&house_count) = caller.ownership.get(&rentee.position) else {
+        let tile_id: usize = rentee.position;
+        if self.owners[tile_id] != Some(caller_order) {
             // Caller isn't an owner
-            return (PoorOut::empty(), None);
+            return (Vec::new(), None);
+        }
+        let caller: &Player = &self.players[caller_order];
+        let house_count: u8 = caller.ownership.get(tile_id).expect("owners is in sync");
+
+        let result: Option<(isize, usize, isize)> =
+            Some((caller.money, rentee.user_id, rentee.money));
+
+        let rent: isize = self.rent_owed(caller_order, tile_id, house_count);
+        self.players[caller_order].money += rent;
+        self.players[self.current_player].money -= rent;
+
+        let (caller, rentee) = (
+            &self.players[caller_order],
+            &self.players[self.current_player],
+        );
+        let event: Event = Event::RentPaid {
+            owner_id: caller_id,
+            owner_name: caller.username.clone(),
+            rentee_id: rentee.user_id,
+            rentee_name: rentee.username.clone(),
+            tile_id,
+            amount: rent,
+            owner_money: caller.money,
+            rentee_money: rentee.money,
         };
-        let property: Tile = BOARD[rentee.position];
-        let rent: isize = match property.inner {
+        (vec![event], result)
+    }
+    /// Rent for landing on tile_id, owned by the player at owner_order
+    fn rent_owed(&mut self, owner_order: usize, tile_id: usize, house_count: u8) -> isize {
+        let owner: &Player = &self.players[owner_order];
+        match BOARD[tile_id].inner {
             TileType::Street(prop) => prop.rent_prices[usize::from(house_count)],
-            TileType::Railroad(_) => Railroad::calculate_rent(caller),
-            TileType::Utility(_) => Utility::calculate_rent(caller),
+            TileType::Railroad(_) => Railroad::calculate_rent(owner),
+            TileType::Utility(_) => Utility::calculate_rent(owner, &mut self.rng),
             TileType::Chance
             | TileType::Chest
             | TileType::Free
@@ -631,21 +750,7 @@ impl Game {
             | TileType::JailVisit
             | TileType::TaxIncome
             | TileType::TaxLuxury => unreachable!(),
-        };
-
-        let caller_name: &str = caller.username.as_deref().unwrap_or("None");
-        let rentee_name: &str = rentee.username.as_deref().unwrap_or("None");
-        let out: String = format!(
-            "{} collected rent from {}. {} now has {}, {} now has {}.",
-            caller_name, rentee_name, caller_name, caller.money, rentee_name, rentee.money,
-        );
-        let result: Option<(isize, usize, isize)> =
-            Some((caller.money, rentee.user_id, rentee.money));
-
-        self.players[caller_order].money += rent;
-        self.players[self.current_player].money -= rent;
-
-        (PoorOut::new(out, String::new()), result)
+        }
     }
     pub fn get_status(&self, caller_id: usize) -> String {
         let player: &Player = &self.players[self.current_player];
@@ -664,7 +769,7 @@ impl Game {
             Status::Auction => "Waiting for bid submissions.".to_owned(),
         };
 
-        let Some(caller) = find_by_id(&self.players, caller_id) else {
+        let Some(caller) = self.player_by_id(caller_id) else {
             return game_status;
         };
 
@@ -685,32 +790,37 @@ impl Game {
             caller_status,
         )
     }
+    /// Bit for bit as i64, Postgres has no unsigned bigint
+    pub const fn get_rng_state(&self) -> i64 {
+        self.rng.state() as i64
+    }
+    pub const fn is_auction(&self) -> bool {
+        matches!(self.status, Status::Auction)
+    }
     pub fn get_position(&self, user_id: usize) -> usize {
-        let Some(player) = find_by_id(&self.players, user_id) else {
+        let Some(player) = self.player_by_id(user_id) else {
             // Return empty map if caller is not a player
             return 101;
         };
         player.position
     }
     /// If successfull, returns Some(caller.money)
-    pub fn build(&mut self, user_id: usize, tile_id: usize) -> (PoorOut, Option<isize>) {
+    pub fn build(&mut self, user_id: usize, tile_id: usize) -> (Vec<Event>, Option<isize>) {
         let tile: Tile = BOARD[tile_id];
-        let Some(player) = find_by_id_mut(&mut self.players, user_id) else {
+        let Some(order) = self.order_of(user_id) else {
             // Not a player
-            return (PoorOut::empty(), None);
+            return (Vec::new(), None);
         };
+        let player: &mut Player = &mut self.players[order];
 
-        let Some(&house_count) = player.ownership.get(&tile_id) else {
-            let out: String = "You don't own ".to_owned() + tile.name;
-            return (PoorOut::new(out, String::new()), None);
+        let Some(house_count) = player.ownership.get(tile_id) else {
+            return (vec![Event::NotOwned { tile_id }], None);
         };
 
         if !matches!(tile.inner, TileType::Street(_)) {
-            let out: String = "Can't build houses on ".to_owned() + tile.name;
-            return (PoorOut::new(out, String::new()), None);
+            return (vec![Event::CantBuildOn { tile_id }], None);
         } else if house_count == 5 {
-            let out: String = "Can't build any more on ".to_owned() + tile.name;
-            return (PoorOut::new(out, String::new()), None);
+            return (vec![Event::FullyBuilt { tile_id }], None);
         }
 
         let (colour, price): (Colour, isize) = match tile_id {
@@ -740,36 +850,27 @@ impl Game {
                 Colour::Yellow => COLOUR_YELLOW.iter(),
             };
             let full_colour: bool =
-                colour_tiles.all(|tile_id: &usize| player.ownership.contains_key(tile_id));
+                colour_tiles.all(|tile_id: &usize| self.owners[*tile_id] == Some(order));
             if !full_colour {
-                let out: String = "You need to have colour monopoly to build.".to_owned();
-                (PoorOut::new(out, String::new()), None)
-            } else if player.money < price {
-                let out: String = format!(
-                    "Not enough money. You have {}, building costs {}.",
-                    player.money, price,
-                );
-                (PoorOut::new(out, String::new()), None)
-            } else {
-                player.build(colour, price, house_count);
-                let out: String = format!("Built 3 houses. {} in the bank", player.money);
-                (PoorOut::new(out, String::new()), Some(player.money))
+                return (vec![Event::NeedMonopoly { tile_id }], None);
             }
-        } else if player.money < price {
-            let out: String = format!(
-                "Not enough money. You have {}, building costs {}.",
-                player.money, price,
-            );
-            (PoorOut::new(out, String::new()), None)
-        } else {
-            player.build(colour, price, house_count);
-
-            let out: String = if house_count == 4 {
-                format!("Built 3 hotels. {} in the bank", player.money)
-            } else {
-                format!("Built 3 houses. {} in the bank", player.money)
+        }
+        if player.money < price {
+            let event: Event = Event::CantAffordHouses {
+                money: player.money,
+                cost: price,
             };
-            (PoorOut::new(out, String::new()), Some(player.money))
+            return (vec![event], None);
         }
+
+        player.build(colour, price, house_count);
+        let event: Event = Event::Built {
+            user_id,
+            tile_id,
+            house_count: house_count + 1,
+            cost: price,
+            money: player.money,
+        };
+        (vec![event], Some(player.money))
     }
 }
@@ -1,4 +1,4 @@
-use rand::{seq::SliceRandom, thread_rng};
+use rand::{seq::SliceRandom, Rng};
 
 use crate::game::{roll_dice, Player};
 
@@ -181,7 +181,7 @@ impl Railroad {
         let exp: u32 = RAILROADS
             .into_iter()
             .map(|railroad_id| {
-                if player.ownership.contains_key(&railroad_id) {
+                if player.ownership.contains(railroad_id) {
                     1
                 } else {
                     0
@@ -209,12 +209,10 @@ impl Utility {
     const fn new(cost: isize) -> Self {
         Self { cost }
     }
-    pub fn calculate_rent(player: &Player) -> isize {
-        let (roll_0, roll_1) = roll_dice();
+    pub fn calculate_rent(player: &Player, rng: &mut impl Rng) -> isize {
+        let (roll_0, roll_1) = roll_dice(rng);
         let rolled: isize = isize::try_from(roll_0 + roll_1).expect("rolled overflowing integer");
-        if player.ownership.contains_key(&UTILITIES[0])
-            && player.ownership.contains_key(&UTILITIES[1])
-        {
+        if player.ownership.contains(UTILITIES[0]) && player.ownership.contains(UTILITIES[1]) {
             rolled * 10
         } else {
             rolled * 4
@@ -336,12 +334,10 @@ const CHESTS: [Card; 16] = [
     Card::new("You inherit £100", CardEffect::Money(100)),
 ];
 
-pub fn chance_roll() -> Card {
-    let mut rng = thread_rng();
-    *CHANCES.choose(&mut rng).expect("const array is not empty")
+pub fn chance_roll(rng: &mut impl Rng) -> Card {
+    *CHANCES.choose(rng).expect("const array is not empty")
 }
 
-pub fn chest_roll() -> Card {
-    let mut rng = thread_rng();
-    *CHESTS.choose(&mut rng).expect("const array is not empty")
+pub fn chest_roll(rng: &mut impl Rng) -> Card {
+    *CHESTS.choose(rng).expect("const array is not empty")
 }
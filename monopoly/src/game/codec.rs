@@ -0,0 +1,301 @@
+//! Versioned binary layout of a game, integers are little-endian
+//!
+//! u8 FORMAT_VERSION
+//! u8 status, u16 current_player, i64 biggest_bid, u64 bid_time_sec, u64 bidder_id
+//! u64 rng state, missing in version 1
+//! u16 player count, then per player
+//!     u64 user_id, u8 username length or NO_USERNAME, username bytes
+//!     u8 position, i64 money, u8 is_jailed, u8 streak
+//!     u8 tile count, then per tile u8 tile_id and u8 house_count sorted by tile_id
+
+use std::{collections::HashMap, fmt::Display, sync::Arc};
+
+use crate::game::{
+    board::{TileType, BOARD},
+    event::Name,
+    ownership::Ownership,
+    rng::GameRng,
+    Game, Player, Status,
+};
+
+/// Bumped on every change of the layout
+pub const FORMAT_VERSION: u8 = 2;
+/// Oldest version that can still be read
+const MIN_FORMAT_VERSION: u8 = 1;
+const NO_USERNAME: u8 = u8::MAX;
+
+#[derive(Debug)]
+pub enum DecodeError {
+    Version(u8),
+    Truncated,
+    TrailingBytes(usize),
+    Invalid(&'static str),
+}
+
+impl Display for DecodeError {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        match self {
+            Self::Version(version) => write!(
+                f,
+                "Unsupported format version {version}, expected {MIN_FORMAT_VERSION} to {FORMAT_VERSION}"
+            ),
+            Self::Truncated => write!(f, "Unexpected end of data"),
+            Self::TrailingBytes(count) => write!(f, "{count} bytes after the end of the game"),
+            Self::Invalid(field) => write!(f, "Invalid {field}"),
+        }
+    }
+}
+
+struct Reader<'data> {
+    data: &'data [u8],
+}
+
+impl<'data> Reader<'data> {
+    fn take(&mut self, count: usize) -> Result<&'data [u8], DecodeError> {
+        if self.data.len() < count {
+            return Err(DecodeError::Truncated);
+        }
+        let (head, tail) = self.data.split_at(count);
+        self.data = tail;
+        Ok(head)
+    }
+    fn u8(&mut self) -> Result<u8, DecodeError> {
+        Ok(self.take(1)?[0])
+    }
+    fn u16(&mut self) -> Result<u16, DecodeError> {
+        let bytes: [u8; 2] = self.take(2)?.try_into().expect("took 2 bytes");
+        Ok(u16::from_le_bytes(bytes))
+    }
+    fn u64(&mut self) -> Result<u64, DecodeError> {
+        let bytes: [u8; 8] = self.take(8)?.try_into().expect("took 8 bytes");
+        Ok(u64::from_le_bytes(bytes))
+    }
+    fn i64(&mut self) -> Result<i64, DecodeError> {
+        let bytes: [u8; 8] = self.take(8)?.try_into().expect("took 8 bytes");
+        Ok(i64::from_le_bytes(bytes))
+    }
+    fn bool(&mut self) -> Result<bool, DecodeError> {
+        match self.u8()? {
+            0 => Ok(false),
+            1 => Ok(true),
+            _ => Err(DecodeError::Invalid("flag")),
+        }
+    }
+    fn usize(&mut self, field: &'static str) -> Result<usize, DecodeError> {
+        usize::try_from(self.u64()?).map_err(|_| DecodeError::Invalid(field))
+    }
+    fn isize(&mut self, field: &'static str) -> Result<isize, DecodeError> {
+        isize::try_from(self.i64()?).map_err(|_| DecodeError::Invalid(field))
+    }
+    fn tile_id(&mut self) -> Result<usize, DecodeError> {
+        let tile_id: usize = usize::from(self.u8()?);
+        if tile_id < BOARD.len() {
+            Ok(tile_id)
+        } else {
+            Err(DecodeError::Invalid("tile_id"))
+        }
+    }
+}
+
+/// Houses a tile can have if it's owned, None if it can't be owned
+const fn max_houses(tile_id: usize) -> Option<u8> {
+    match BOARD[tile_id].inner {
+        TileType::Street(_) => Some(5),
+        TileType::Railroad(_) | TileType::Utility(_) => Some(0),
+        TileType::Chance
+        | TileType::Chest
+        | TileType::Free
+        | TileType::Go
+        | TileType::GoToJail
+        | TileType::JailVisit
+        | TileType::TaxIncome
+        | TileType::TaxLuxury => None,
+    }
+}
+
+const fn encode_status(status: &Status) -> u8 {
+    match status {
+        Status::Roll => 0,
+        Status::Buy => 1,
+        Status::Auction => 2,
+    }
+}
+
+const fn decode_status(status: u8) -> Result<Status, DecodeError> {
+    match status {
+        0 => Ok(Status::Roll),
+        1 => Ok(Status::Buy),
+        2 => Ok(Status::Auction),
+        _ => Err(DecodeError::Invalid("status")),
+    }
+}
+
+fn encode_player(player: &Player, out: &mut Vec<u8>) {
+    out.extend_from_slice(&(player.user_id as u64).to_le_bytes());
+    match &player.username {
+        Some(username) => {
+            let length: u8 = u8::try_from(username.len())
+                .ok()
+                .filter(|&length| length != NO_USERNAME)
+                .expect("Telegram usernames are at most 32 characters");
+            out.push(length);
+            out.extend_from_slice(username.as_bytes());
+        }
+        None => out.push(NO_USERNAME),
+    }
+    out.push(u8::try_from(player.position).expect("position is on the board"));
+    out.extend_from_slice(&(player.money as i64).to_le_bytes());
+    out.push(u8::from(player.is_jailed));
+    out.push(player.streak);
+
+    // Sorted by tile_id, the same game is always the same bytes
+    out.push(u8::try_from(player.ownership.len()).expect("tiles are on the board"));
+    for (tile_id, house_count) in player.ownership.iter() {
+        out.push(u8::try_from(tile_id).expect("tile is on the board"));
+        out.push(house_count);
+    }
+}
+
+fn decode_player(reader: &mut Reader<'_>) -> Result<Player, DecodeError> {
+    let user_id: usize = reader.usize("user_id")?;
+    let username: Name = match reader.u8()? {
+        NO_USERNAME => None,
+        length => {
+            let bytes: &[u8] = reader.take(usize::from(length))?;
+            let username: &str =
+                std::str::from_utf8(bytes).map_err(|_| DecodeError::Invalid("username"))?;
+            Some(Arc::from(username))
+        }
+    };
+    let position: usize = reader.tile_id()?;
+    let money: isize = reader.isize("money")?;
+    let is_jailed: bool = reader.bool()?;
+    let streak: u8 = reader.u8()?;
+
+    let tile_count: u8 = reader.u8()?;
+    let mut ownership: Ownership = Ownership::new();
+    for _ in 0..tile_count {
+        let tile_id: usize = reader.tile_id()?;
+        let house_count: u8 = reader.u8()?;
+        if house_count > 5 {
+            return Err(DecodeError::Invalid("house_count"));
+        } else if ownership.contains(tile_id) {
+            return Err(DecodeError::Invalid("tile_id"));
+        }
+        match max_houses(tile_id) {
+            // Rent and auctions only know what to do with these
+            Some(max_houses) if house_count <= max_houses => {}
+            _ => return Err(DecodeError::Invalid("tile_id")),
+        }
+        ownership.insert(tile_id, house_count);
+    }
+
+    Ok(Player {
+        user_id,
+        username,
+        ownership,
+        position,
+        money,
+        is_jailed,
+        streak,
+    })
+}
+
+impl Game {
+    pub fn to_bytes(&self) -> Vec<u8> {
+        // Header and a player with a short username and a few tiles
+        let mut out: Vec<u8> = Vec::with_capacity(32 + 48 * self.players.len());
+        out.push(FORMAT_VERSION);
+        out.push(encode_status(&self.status));
+        let current_player: u16 = u16::try_from(self.current_player).expect("players fit u16");
+        out.extend_from_slice(&current_player.to_le_bytes());
+        out.extend_from_slice(&(self.biggest_bid as i64).to_le_bytes());
+        out.extend_from_slice(&(self.bid_time_sec as u64).to_le_bytes());
+        out.extend_from_slice(&(self.bidder_id as u64).to_le_bytes());
+        out.extend_from_slice(&self.rng.state().to_le_bytes());
+
+        let player_count: u16 = u16::try_from(self.players.len()).expect("players fit u16");
+        out.extend_from_slice(&player_count.to_le_bytes());
+        for player in &self.players {
+            encode_player(player, &mut out);
+        }
+        out
+    }
+    /// Same as deserialize, settles the auction if it has ended
+    pub fn from_bytes(data: &[u8]) -> Result<(Self, Option<(isize, usize)>), DecodeError> {
+        let mut game: Self = Self::decode(data)?;
+        let (_events, maybe_settled) = game.settle_auction();
+        Ok((
+            game,
+            maybe_settled.map(|(_user_id, money, tile_id)| (money, tile_id)),
+        ))
+    }
+    /// Same as load, an auction past its time stays open
+    pub fn decode(data: &[u8]) -> Result<Self, DecodeError> {
+        let mut reader: Reader<'_> = Reader { data };
+
+        let version: u8 = reader.u8()?;
+        if !(MIN_FORMAT_VERSION..=FORMAT_VERSION).contains(&version) {
+            return Err(DecodeError::Version(version));
+        }
+        let status: Status = decode_status(reader.u8()?)?;
+        let current_player: usize = usize::from(reader.u16()?);
+        let biggest_bid: isize = reader.isize("biggest_bid")?;
+        let bid_time_sec: usize = reader.usize("bid_time_sec")?;
+        let bidder_id: usize = reader.usize("bidder_id")?;
+        let rng: GameRng = if version >= 2 {
+            GameRng::new(reader.u64()?)
+        } else {
+            GameRng::from_entropy()
+        };
+
+        let player_count: usize = usize::from(reader.u16()?);
+        let players: Vec<Player> = (0..player_count)
+            .map(|_| decode_player(&mut reader))
+            .collect::<Result<Vec<Player>, DecodeError>>()?;
+
+        if !reader.data.is_empty() {
+            return Err(DecodeError::TrailingBytes(reader.data.len()));
+        } else if players.is_empty() {
+            // Every move indexes the current player
+            return Err(DecodeError::Invalid("player_count"));
+        } else if current_player >= players.len() {
+            return Err(DecodeError::Invalid("current_player"));
+        }
+        let mut owned: Ownership = Ownership::new();
+        for player in &players {
+            for (tile_id, _house_count) in player.ownership.iter() {
+                if owned.contains(tile_id) {
+                    // Only one of the owners would be kept by indexed
+                    return Err(DecodeError::Invalid("tile_id"));
+                }
+                owned.insert(tile_id, 0);
+            }
+        }
+        if matches!(status, Status::Auction)
+            && (max_houses(players[current_player].position).is_none()
+                || owned.contains(players[current_player].position))
+        {
+            // Whoever wins the auction gets a tile that can't be bought
+            return Err(DecodeError::Invalid("status"));
+        }
+
+        let game: Self = Self {
+            current_player,
+            players,
+            status,
+            biggest_bid,
+            bid_time_sec,
+            bidder_id,
+            rng,
+            owners: [None; BOARD.len()],
+            orders: HashMap::new(),
+        }
+        .indexed();
+        if matches!(game.status, Status::Auction) && game.order_of(bidder_id).is_none() {
+            // Settling would have nobody to give the tile to
+            return Err(DecodeError::Invalid("bidder_id"));
+        }
+        Ok(game)
+    }
+}
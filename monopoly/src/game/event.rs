@@ -0,0 +1,279 @@
+//! What happened during a move, rendered only if someone reads it
+//!
+//! Events hold ids, numbers and shared usernames, nothing is formatted until
+//! Display or a template in Python asks for the text
+
+use std::{fmt::Display, sync::Arc};
+
+use crate::game::board::BOARD;
+
+/// Shared with the player, cloning it doesn't copy the string
+pub type Name = Option<Arc<str>>;
+
+#[derive(Clone)]
+pub enum Event {
+    Rolled {
+        user_id: usize,
+        name: Name,
+        dice: (usize, usize),
+        tile_id: usize,
+    },
+    PassedGo {
+        user_id: usize,
+    },
+    /// Three doubles in a row or the go to jail tile
+    Jailed {
+        user_id: usize,
+        three_doubles: bool,
+    },
+    CardDrawn {
+        user_id: usize,
+        is_chance: bool,
+        note: &'static str,
+    },
+    Taxed {
+        user_id: usize,
+        amount: isize,
+    },
+    /// Nobody owns the tile the player is on, waiting for buy or auction
+    Offered {
+        tile_id: usize,
+        cost: isize,
+    },
+    Balance {
+        user_id: usize,
+        money: isize,
+    },
+    AlreadyOwned {
+        owner_id: usize,
+        owner_name: Name,
+    },
+    NotPurchasable {
+        tile_id: usize,
+    },
+    CantAffordTile {
+        user_id: usize,
+        money: isize,
+        tile_id: usize,
+        cost: isize,
+    },
+    Purchased {
+        user_id: usize,
+        tile_id: usize,
+        cost: isize,
+        money: isize,
+    },
+    CantStartAuction {
+        user_id: usize,
+        money: isize,
+    },
+    AuctionStarted {
+        user_id: usize,
+        tile_id: usize,
+        starting_bid: isize,
+    },
+    BidTooLow {
+        price: isize,
+        biggest_bid: isize,
+    },
+    BidPlaced {
+        user_id: usize,
+        price: isize,
+    },
+    /// Nobody outbid user_id in time, money is after paying for the tile
+    AuctionWon {
+        user_id: usize,
+        name: Name,
+        tile_id: usize,
+        money: isize,
+    },
+    RentFromSelf,
+    RentPaid {
+        owner_id: usize,
+        owner_name: Name,
+        rentee_id: usize,
+        rentee_name: Name,
+        tile_id: usize,
+        amount: isize,
+        owner_money: isize,
+        rentee_money: isize,
+    },
+    NotOwned {
+        tile_id: usize,
+    },
+    CantBuildOn {
+        tile_id: usize,
+    },
+    FullyBuilt {
+        tile_id: usize,
+    },
+    NeedMonopoly {
+        tile_id: usize,
+    },
+    CantAffordHouses {
+        money: isize,
+        cost: isize,
+    },
+    /// house_count is the new one on every tile of the colour, 5 is a hotel
+    Built {
+        user_id: usize,
+        tile_id: usize,
+        house_count: u8,
+        cost: isize,
+        money: isize,
+    },
+}
+
+fn or_none(name: &Name) -> &str {
+    name.as_deref().unwrap_or("None")
+}
+
+impl Event {
+    /// Name of the variant, what templates are looked up by
+    pub const fn kind(&self) -> &'static str {
+        match self {
+            Self::Rolled { .. } => "rolled",
+            Self::PassedGo { .. } => "passed_go",
+            Self::Jailed { .. } => "jailed",
+            Self::CardDrawn { .. } => "card_drawn",
+            Self::Taxed { .. } => "taxed",
+            Self::Offered { .. } => "offered",
+            Self::Balance { .. } => "balance",
+            Self::AlreadyOwned { .. } => "already_owned",
+            Self::NotPurchasable { .. } => "not_purchasable",
+            Self::CantAffordTile { .. } => "cant_afford_tile",
+            Self::Purchased { .. } => "purchased",
+            Self::CantStartAuction { .. } => "cant_start_auction",
+            Self::AuctionStarted { .. } => "auction_started",
+            Self::BidTooLow { .. } => "bid_too_low",
+            Self::BidPlaced { .. } => "bid_placed",
+            Self::AuctionWon { .. } => "auction_won",
+            Self::RentFromSelf => "rent_from_self",
+            Self::RentPaid { .. } => "rent_paid",
+            Self::NotOwned { .. } => "not_owned",
+            Self::CantBuildOn { .. } => "cant_build_on",
+            Self::FullyBuilt { .. } => "fully_built",
+            Self::NeedMonopoly { .. } => "need_monopoly",
+            Self::CantAffordHouses { .. } => "cant_afford_houses",
+            Self::Built { .. } => "built",
+        }
+    }
+}
+
+/// The English text the bot has always replied with
+impl Display for Event {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        match self {
+            Self::Rolled {
+                name,
+                dice: (roll_1, roll_2),
+                tile_id,
+                ..
+            } => write!(
+                f,
+                "{:?} has rolled {} and {}, now on {}.",
+                or_none(name),
+                roll_1,
+                roll_2,
+                BOARD[*tile_id].name,
+            ),
+            Self::PassedGo { .. } => write!(f, "Passed GO."),
+            Self::Jailed {
+                three_doubles: true,
+                ..
+            } => write!(f, "Rolled double 3 times in a row, go to jail."),
+            Self::Jailed { .. } => write!(f, "Go to jail."),
+            Self::CardDrawn { note, .. } => write!(f, "{note}"),
+            Self::Taxed { amount, .. } => write!(f, "Paid {amount} in taxes."),
+            Self::Offered { cost, .. } => write!(f, "Buy for {cost} or start an auction."),
+            Self::Balance { money, .. } => write!(f, "{money} in the bank."),
+            Self::AlreadyOwned { owner_name, .. } => write!(
+                f,
+                "This property is already owned by {}",
+                or_none(owner_name)
+            ),
+            Self::NotPurchasable { .. } => write!(f, "Non-purchasable tile"),
+            Self::CantAffordTile {
+                money,
+                tile_id,
+                cost,
+                ..
+            } => write!(
+                f,
+                "Not enough money. \n{} in the bank. {} costs {}",
+                money, BOARD[*tile_id].name, cost
+            ),
+            Self::Purchased { tile_id, money, .. } => write!(
+                f,
+                "Purchased {}. \n{} in the bank.",
+                BOARD[*tile_id].name, money
+            ),
+            Self::CantStartAuction { .. } => {
+                write!(f, "You don't have enough money to start a bid.")
+            }
+            Self::AuctionStarted { starting_bid, .. } => write!(
+                f,
+                "Starting an auction. Starting bid is {starting_bid}. \n10 seconds to make a bid"
+            ),
+            Self::BidTooLow { .. } => write!(f, "Enter a bigger bid"),
+            Self::BidPlaced { price, .. } => write!(f, "Biggest bid {price}"),
+            Self::AuctionWon {
+                name,
+                tile_id,
+                money,
+                ..
+            } => write!(
+                f,
+                "Auction is over, {} bought {}. \n{} in the bank.",
+                or_none(name),
+                BOARD[*tile_id].name,
+                money
+            ),
+            Self::RentFromSelf => write!(f, "Can't ask rent from yourself"),
+            Self::RentPaid {
+                owner_name,
+                rentee_name,
+                owner_money,
+                rentee_money,
+                ..
+            } => {
+                let (owner, rentee) = (or_none(owner_name), or_none(rentee_name));
+                write!(
+                    f,
+                    "{owner} collected rent from {rentee}. {owner} now has {owner_money}, {rentee} now has {rentee_money}."
+                )
+            }
+            Self::NotOwned { tile_id } => write!(f, "You don't own {}", BOARD[*tile_id].name),
+            Self::CantBuildOn { tile_id } => {
+                write!(f, "Can't build houses on {}", BOARD[*tile_id].name)
+            }
+            Self::FullyBuilt { tile_id } => {
+                write!(f, "Can't build any more on {}", BOARD[*tile_id].name)
+            }
+            Self::NeedMonopoly { .. } => write!(f, "You need to have colour monopoly to build."),
+            Self::CantAffordHouses { money, cost } => write!(
+                f,
+                "Not enough money. You have {money}, building costs {cost}."
+            ),
+            Self::Built {
+                house_count: 5,
+                money,
+                ..
+            } => write!(f, "Built 3 hotels. {money} in the bank"),
+            Self::Built { money, .. } => write!(f, "Built 3 houses. {money} in the bank"),
+        }
+    }
+}
+
+/// Events of one move as the reply text, lines joined like PoorOut::merge did
+pub fn render(events: &[Event]) -> String {
+    let mut out: String = String::new();
+    for (index, event) in events.iter().enumerate() {
+        if index > 0 {
+            out.push_str(" \n");
+        }
+        // Writing into a String can't fail
+        let _ = std::fmt::Write::write_fmt(&mut out, format_args!("{event}"));
+    }
+    out
+}
@@ -0,0 +1,81 @@
+//! Tiles of a player and the houses on them in 28 bytes, nothing on the heap
+
+use crate::game::board::BOARD;
+
+/// One byte per tile for Python, 0 if not owned or house_count + 1
+pub type Slots = [u8; BOARD.len()];
+
+#[derive(Clone, Copy, PartialEq, Eq)]
+pub struct Ownership {
+    // Bit tile_id is set if the tile is owned
+    owned: u64,
+    // House counts, tile_id / 2 is the byte, even tiles in the low nibble
+    houses: [u8; BOARD.len() / 2],
+}
+
+const _: () = assert!(BOARD.len() <= u64::BITS as usize);
+
+impl Ownership {
+    pub const fn new() -> Self {
+        Self {
+            owned: 0,
+            houses: [0; BOARD.len() / 2],
+        }
+    }
+    pub const fn contains(&self, tile_id: usize) -> bool {
+        self.owned >> tile_id & 1 == 1
+    }
+    pub const fn get(&self, tile_id: usize) -> Option<u8> {
+        if self.contains(tile_id) {
+            Some(self.houses[tile_id / 2] >> (tile_id % 2 * 4) & 0xF)
+        } else {
+            None
+        }
+    }
+    /// Owns the tile from now on, with house_count houses
+    pub fn insert(&mut self, tile_id: usize, house_count: u8) {
+        debug_assert!(house_count <= 5, "a hotel is the most");
+        let shift: usize = tile_id % 2 * 4;
+        let byte: &mut u8 = &mut self.houses[tile_id / 2];
+        *byte = *byte & !(0xF << shift) | house_count << shift;
+        self.owned |= 1 << tile_id;
+    }
+    pub const fn len(&self) -> usize {
+        self.owned.count_ones() as usize
+    }
+    pub const fn is_empty(&self) -> bool {
+        self.owned == 0
+    }
+    /// (tile_id, house_count) sorted by tile_id
+    pub fn iter(&self) -> impl Iterator<Item = (usize, u8)> + '_ {
+        let mut owned: u64 = self.owned;
+        std::iter::from_fn(move || {
+            if owned == 0 {
+                return None;
+            }
+            let tile_id: usize = owned.trailing_zeros() as usize;
+            // Clear the lowest set bit
+            owned &= owned - 1;
+            Some((tile_id, self.get(tile_id).expect("bit was set")))
+        })
+    }
+    pub fn to_slots(&self) -> Slots {
+        let mut slots: Slots = [0; BOARD.len()];
+        for (tile_id, house_count) in self.iter() {
+            slots[tile_id] = house_count + 1;
+        }
+        slots
+    }
+    /// None if a slot has more than a hotel
+    pub fn from_slots(slots: &Slots) -> Option<Self> {
+        let mut ownership: Self = Self::new();
+        for (tile_id, &slot) in slots.iter().enumerate() {
+            match slot {
+                0 => {}
+                1..=6 => ownership.insert(tile_id, slot - 1),
+                _ => return None,
+            }
+        }
+        Some(ownership)
+    }
+}
@@ -0,0 +1,49 @@
+use rand::{thread_rng, Error, RngCore};
+
+const GAMMA: u64 = 0x9E37_79B9_7F4A_7C15;
+
+/// SplitMix64, the whole state is one u64 that is stored with the game
+/// so the same state and the same moves always give the same rolls
+pub struct GameRng {
+    state: u64,
+}
+
+impl GameRng {
+    pub const fn new(seed: u64) -> Self {
+        Self { state: seed }
+    }
+    /// For games that weren't given a seed
+    pub fn from_entropy() -> Self {
+        Self::new(thread_rng().next_u64())
+    }
+    /// Same as GameRng::new(seed) after drawing `count` numbers from it
+    pub const fn skipped(seed: u64, count: u64) -> Self {
+        Self::new(seed.wrapping_add(count.wrapping_mul(GAMMA)))
+    }
+    pub const fn state(&self) -> u64 {
+        self.state
+    }
+}
+
+impl RngCore for GameRng {
+    fn next_u32(&mut self) -> u32 {
+        (self.next_u64() >> 32) as u32
+    }
+    fn next_u64(&mut self) -> u64 {
+        self.state = self.state.wrapping_add(GAMMA);
+        let mut z: u64 = self.state;
+        z = (z ^ (z >> 30)).wrapping_mul(0xBF58_476D_1CE4_E5B9);
+        z = (z ^ (z >> 27)).wrapping_mul(0x94D0_49BB_1331_11EB);
+        z ^ (z >> 31)
+    }
+    fn fill_bytes(&mut self, dest: &mut [u8]) {
+        for chunk in dest.chunks_mut(8) {
+            let bytes: [u8; 8] = self.next_u64().to_le_bytes();
+            chunk.copy_from_slice(&bytes[..chunk.len()]);
+        }
+    }
+    fn try_fill_bytes(&mut self, dest: &mut [u8]) -> Result<(), Error> {
+        self.fill_bytes(dest);
+        Ok(())
+    }
+}
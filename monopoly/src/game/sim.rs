@@ -0,0 +1,154 @@
+use rand::{Rng, RngCore};
+use rayon::prelude::{IntoParallelIterator, ParallelIterator};
+
+use crate::{
+    game::{board::BOARD, rng::GameRng, Game, Status},
+    io::SimStats,
+};
+
+/// What simulated players do when they land on a property nobody owns
+#[derive(Clone, Copy)]
+pub enum Policy {
+    /// Buy if there's enough money, auction otherwise
+    Buy,
+    /// Always auction, every other player who can afford it outbids once by 10
+    Auction,
+    /// Coin flip between the two, random players outbid by random amounts
+    Random,
+}
+
+impl Policy {
+    pub fn parse(name: &str) -> Option<Self> {
+        match name {
+            "buy" => Some(Self::Buy),
+            "auction" => Some(Self::Auction),
+            "random" => Some(Self::Random),
+            _ => None,
+        }
+    }
+}
+
+/// Plays every game until one player is left or it reaches max_turns, on all cores
+pub fn simulate(
+    n_games: u64,
+    n_players: usize,
+    policy: Policy,
+    seed: u64,
+    max_turns: u64,
+) -> SimStats {
+    (0..n_games)
+        .into_par_iter()
+        .map(|index: u64| {
+            // Two seeds per game from one stream, so any game can be replayed on its own
+            let mut seeds: GameRng = GameRng::skipped(seed, index.wrapping_mul(2));
+            let game_seed: u64 = seeds.next_u64();
+            play(n_players, policy, game_seed, seeds.next_u64(), max_turns)
+        })
+        .reduce(SimStats::new, SimStats::merge)
+}
+
+fn play(
+    n_players: usize,
+    policy: Policy,
+    game_seed: u64,
+    policy_seed: u64,
+    max_turns: u64,
+) -> SimStats {
+    let info: Vec<(usize, Option<String>)> =
+        (1..=n_players).map(|user_id| (user_id, None)).collect();
+    let mut game: Game = Game::new(info, Some(game_seed));
+    let mut rng: GameRng = GameRng::new(policy_seed);
+    let mut stats: SimStats = SimStats::new();
+    stats.games = 1;
+
+    while stats.turns < max_turns && game.players.len() > 1 {
+        let mover: usize = game.current_player;
+        let mover_id: usize = game.players[mover].user_id;
+        if game.roll(mover_id).1.is_none() {
+            unreachable!("every turn ends waiting for the next roll");
+        }
+        stats.turns += 1;
+
+        let position: usize = game.players[mover].position;
+        stats.landings[position] += 1;
+
+        charge_rent(&mut game, mover, position);
+        if matches!(game.status, Status::Buy) {
+            purchase(&mut game, policy, &mut rng, mover_id);
+        }
+        stats.bankruptcies += remove_bankrupt(&mut game);
+    }
+
+    stats.finished = u64::from(game.players.len() <= 1);
+    stats
+}
+
+/// Players don't have to ask for rent here, the owner always does
+fn charge_rent(game: &mut Game, mover: usize, tile_id: usize) {
+    let Some(owner) = game.owners[tile_id].filter(|&owner: &usize| owner != mover) else {
+        return;
+    };
+    let house_count: u8 = game.players[owner]
+        .ownership
+        .get(tile_id)
+        .expect("owners is in sync");
+    let rent: isize = game.rent_owed(owner, tile_id, house_count);
+    game.players[owner].money += rent;
+    game.players[mover].money -= rent;
+}
+
+fn purchase(game: &mut Game, policy: Policy, rng: &mut GameRng, mover_id: usize) {
+    let wants_to_buy: bool = match policy {
+        Policy::Buy => true,
+        Policy::Auction => false,
+        Policy::Random => rng.gen_bool(0.5),
+    };
+    if wants_to_buy && game.buy(mover_id).1.is_some() {
+        return;
+    } else if game.auction(mover_id).1.is_none() {
+        // Can afford neither and the engine has no way to pass yet
+        game.status = Status::Roll;
+        game.current_player = (game.current_player + 1) % game.players.len();
+        return;
+    }
+
+    for order in 0..game.players.len() {
+        let bidder_id: usize = game.players[order].user_id;
+        let raise: isize = match policy {
+            Policy::Buy | Policy::Auction => 10,
+            Policy::Random if rng.gen_bool(0.5) => rng.gen_range(1..50),
+            Policy::Random => continue,
+        };
+        let price: isize = game.biggest_bid + raise;
+        if bidder_id != game.bidder_id && game.players[order].money >= price {
+            let _ = game.bid(bidder_id, price);
+        }
+    }
+    game.close_auction();
+}
+
+/// Returns how many players went below zero, their properties go back to the bank
+fn remove_bankrupt(game: &mut Game) -> u64 {
+    let mut removed: u64 = 0;
+    let mut order: usize = 0;
+    while order < game.players.len() && game.players.len() > 1 {
+        if game.players[order].money >= 0 {
+            order += 1;
+            continue;
+        }
+        game.players.remove(order);
+        removed += 1;
+        if order < game.current_player {
+            game.current_player -= 1;
+        }
+    }
+    if game.current_player >= game.players.len() {
+        game.current_player = 0;
+    }
+    if removed > 0 {
+        game.reindex();
+    }
+    removed
+}
+
+const _: () = assert!(BOARD.len() == SimStats::TILE_COUNT);
@@ -1,73 +1,268 @@
-use pyo3::{pyclass, pymethods};
-use std::collections::HashMap;
+use pyo3::{
+    exceptions::PyValueError,
+    prelude::{
+        pyclass, pymethods, Bound, FromPyObject, IntoPy, PyAny, PyAnyMethods, PyObject, PyResult,
+        Python,
+    },
+    types::{PyBytes, PyBytesMethods, PyDict},
+};
+use std::cell::OnceCell;
 
+use crate::game::{render, Event, Ownership, Slots, BOARD};
+
+/// Events of a move, the text is only made if out is read
 #[pyclass]
 pub struct PoorResult {
-    #[pyo3(get)]
-    out: String,
-    #[pyo3(get)]
-    warning: String,
+    events: Vec<Event>,
+    out: OnceCell<String>,
+}
+
+pub fn pass_poor<T>((events, other): (Vec<Event>, T)) -> (PoorResult, T) {
+    let result: PoorResult = PoorResult {
+        events,
+        out: OnceCell::new(),
+    };
+    (result, other)
 }
 
-pub fn pass_poor<T>((out, other): (PoorOut, T)) -> (PoorResult, T) {
-    (PoorResult::from(out), other)
+#[pymethods]
+impl PoorResult {
+    /// English reply, "" if the move did nothing
+    #[getter]
+    fn out(&self) -> &str {
+        self.out.get_or_init(|| render(&self.events))
+    }
+    /// Nothing warns anymore, kept for callers that check it
+    #[getter]
+    const fn warning(&self) -> &'static str {
+        ""
+    }
+    #[getter]
+    fn events(&self) -> Vec<PyEvent> {
+        self.events.iter().cloned().map(PyEvent::from).collect()
+    }
+    fn __len__(&self) -> usize {
+        self.events.len()
+    }
 }
 
-pub struct PoorOut {
-    pub out: String,
-    pub warning: String,
+/// One thing that happened, kind says which and fields has its values
+#[pyclass(name = "Event")]
+pub struct PyEvent {
+    inner: Event,
 }
 
-impl PoorOut {
-    pub const fn new(out: String, warning: String) -> Self {
-        Self { out, warning }
+impl From<Event> for PyEvent {
+    fn from(inner: Event) -> Self {
+        Self { inner }
     }
-    pub const fn empty() -> Self {
-        Self {
-            out: String::new(),
-            warning: String::new(),
+}
+
+#[pymethods]
+impl PyEvent {
+    #[getter]
+    const fn kind(&self) -> &'static str {
+        self.inner.kind()
+    }
+    /// Values by name for str.format_map, tile names are added as "tile"
+    #[getter]
+    fn fields<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let fields: Bound<'py, PyDict> = PyDict::new_bound(py);
+        let tile = |tile_id: &usize| BOARD[*tile_id].name;
+        match &self.inner {
+            Event::Rolled {
+                user_id,
+                name,
+                dice,
+                tile_id,
+            } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("name", name.as_deref())?;
+                fields.set_item("dice", dice)?;
+                fields.set_item("tile_id", tile_id)?;
+                fields.set_item("tile", tile(tile_id))?;
+            }
+            Event::PassedGo { user_id } => {
+                fields.set_item("user_id", user_id)?;
+            }
+            Event::Jailed {
+                user_id,
+                three_doubles,
+            } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("three_doubles", three_doubles)?;
+            }
+            Event::CardDrawn {
+                user_id,
+                is_chance,
+                note,
+            } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("is_chance", is_chance)?;
+                fields.set_item("note", note)?;
+            }
+            Event::Taxed { user_id, amount } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("amount", amount)?;
+            }
+            Event::Offered { tile_id, cost } => {
+                fields.set_item("tile_id", tile_id)?;
+                fields.set_item("tile", tile(tile_id))?;
+                fields.set_item("cost", cost)?;
+            }
+            Event::Balance { user_id, money } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("money", money)?;
+            }
+            Event::AlreadyOwned {
+                owner_id,
+                owner_name,
+            } => {
+                fields.set_item("owner_id", owner_id)?;
+                fields.set_item("owner_name", owner_name.as_deref())?;
+            }
+            Event::NotPurchasable { tile_id }
+            | Event::NotOwned { tile_id }
+            | Event::CantBuildOn { tile_id }
+            | Event::FullyBuilt { tile_id }
+            | Event::NeedMonopoly { tile_id } => {
+                fields.set_item("tile_id", tile_id)?;
+                fields.set_item("tile", tile(tile_id))?;
+            }
+            Event::CantAffordTile {
+                user_id,
+                money,
+                tile_id,
+                cost,
+            } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("money", money)?;
+                fields.set_item("tile_id", tile_id)?;
+                fields.set_item("tile", tile(tile_id))?;
+                fields.set_item("cost", cost)?;
+            }
+            Event::Purchased {
+                user_id,
+                tile_id,
+                cost,
+                money,
+            } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("tile_id", tile_id)?;
+                fields.set_item("tile", tile(tile_id))?;
+                fields.set_item("cost", cost)?;
+                fields.set_item("money", money)?;
+            }
+            Event::CantStartAuction { user_id, money } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("money", money)?;
+            }
+            Event::AuctionStarted {
+                user_id,
+                tile_id,
+                starting_bid,
+            } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("tile_id", tile_id)?;
+                fields.set_item("tile", tile(tile_id))?;
+                fields.set_item("starting_bid", starting_bid)?;
+            }
+            Event::BidTooLow { price, biggest_bid } => {
+                fields.set_item("price", price)?;
+                fields.set_item("biggest_bid", biggest_bid)?;
+            }
+            Event::BidPlaced { user_id, price } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("price", price)?;
+            }
+            Event::AuctionWon {
+                user_id,
+                name,
+                tile_id,
+                money,
+            } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("name", name.as_deref())?;
+                fields.set_item("tile_id", tile_id)?;
+                fields.set_item("tile", tile(tile_id))?;
+                fields.set_item("money", money)?;
+            }
+            Event::RentFromSelf => {}
+            Event::RentPaid {
+                owner_id,
+                owner_name,
+                rentee_id,
+                rentee_name,
+                tile_id,
+                amount,
+                owner_money,
+                rentee_money,
+            } => {
+                fields.set_item("owner_id", owner_id)?;
+                fields.set_item("owner_name", owner_name.as_deref())?;
+                fields.set_item("rentee_id", rentee_id)?;
+                fields.set_item("rentee_name", rentee_name.as_deref())?;
+                fields.set_item("tile_id", tile_id)?;
+                fields.set_item("tile", tile(tile_id))?;
+                fields.set_item("amount", amount)?;
+                fields.set_item("owner_money", owner_money)?;
+                fields.set_item("rentee_money", rentee_money)?;
+            }
+            Event::CantAffordHouses { money, cost } => {
+                fields.set_item("money", money)?;
+                fields.set_item("cost", cost)?;
+            }
+            Event::Built {
+                user_id,
+                tile_id,
+                house_count,
+                cost,
+                money,
+            } => {
+                fields.set_item("user_id", user_id)?;
+                fields.set_item("tile_id", tile_id)?;
+                fields.set_item("tile", tile(tile_id))?;
+                fields.set_item("house_count", house_count)?;
+                fields.set_item("cost", cost)?;
+                fields.set_item("money", money)?;
+            }
         }
+        Ok(fields)
     }
-    pub fn merge(self, rhs: Self) -> Self {
-        let out: String = match (self.out.is_empty(), rhs.out.is_empty()) {
-            (_, true) => self.out,
-            (true, false) => rhs.out,
-            (false, false) => self.out + " \n" + &rhs.out,
-        };
-        let warning: String = match (self.warning.is_empty(), rhs.warning.is_empty()) {
-            (_, true) => self.warning,
-            (true, false) => rhs.warning,
-            (false, false) => self.warning + " \n" + &rhs.warning,
-        };
-
-        Self { out, warning }
+    /// The English text, what PoorResult.out is made of
+    fn __str__(&self) -> String {
+        self.inner.to_string()
     }
-    pub fn merge_out(self, rhs: &str) -> Self {
-        Self {
-            out: self.out + " \n" + rhs,
-            ..self
-        }
+    fn __repr__(&self) -> String {
+        format!("<Event {}>", self.inner.kind())
     }
 }
 
-impl From<PoorOut> for PoorResult {
-    fn from(value: PoorOut) -> Self {
-        Self {
-            out: value.out,
-            warning: value.warning,
+/// Ownership of a player as bytes in Python, one per tile_id
+/// 0 if not owned, house_count + 1 otherwise
+#[derive(Clone)]
+pub struct TileSlots(pub Slots);
+
+impl IntoPy<PyObject> for TileSlots {
+    fn into_py(self, py: Python<'_>) -> PyObject {
+        PyBytes::new_bound(py, &self.0).into_any().unbind()
+    }
+}
+
+impl<'py> FromPyObject<'py> for TileSlots {
+    fn extract_bound(ob: &Bound<'py, PyAny>) -> PyResult<Self> {
+        let bytes: &Bound<'py, PyBytes> = ob.downcast::<PyBytes>()?;
+        let slots: Slots = bytes.as_bytes().try_into().map_err(|_| {
+            PyValueError::new_err(format!("Ownership has to be {} bytes", BOARD.len()))
+        })?;
+        if Ownership::from_slots(&slots).is_none() {
+            return Err(PyValueError::new_err("More than a hotel on a tile"));
         }
+        Ok(Self(slots))
     }
 }
 
-pub type SerPlayer = (
-    usize,
-    Option<String>,
-    HashMap<usize, u8>,
-    usize,
-    isize,
-    bool,
-    u8,
-);
+pub type SerPlayer = (usize, Option<String>, TileSlots, usize, isize, bool, u8);
 
 #[pyclass]
 pub struct SerGame {
@@ -83,11 +278,59 @@ pub struct SerGame {
     pub bid_time_sec: usize,
     #[pyo3(get)]
     pub bidder_id: usize,
+    /// None for games saved before seeds existed
+    #[pyo3(get)]
+    pub rng_state: Option<i64>,
+}
+
+/// Totals over all simulated games
+#[pyclass]
+pub struct SimStats {
+    #[pyo3(get)]
+    pub games: u64,
+    /// Games that ended with one player left, the rest ran out of turns
+    #[pyo3(get)]
+    pub finished: u64,
+    #[pyo3(get)]
+    pub turns: u64,
+    #[pyo3(get)]
+    pub bankruptcies: u64,
+    /// How many turns ended on each tile, by tile_id
+    #[pyo3(get)]
+    pub landings: Vec<u64>,
+}
+
+impl SimStats {
+    pub const TILE_COUNT: usize = 40;
+
+    pub fn new() -> Self {
+        Self {
+            games: 0,
+            finished: 0,
+            turns: 0,
+            bankruptcies: 0,
+            landings: vec![0; Self::TILE_COUNT],
+        }
+    }
+    pub fn merge(mut self, rhs: Self) -> Self {
+        self.games += rhs.games;
+        self.finished += rhs.finished;
+        self.turns += rhs.turns;
+        self.bankruptcies += rhs.bankruptcies;
+        self.landings
+            .iter_mut()
+            .zip(rhs.landings)
+            .for_each(|(landings, rhs_landings)| *landings += rhs_landings);
+        self
+    }
 }
 
 #[pymethods]
 impl SerGame {
     #[new]
+    #[pyo3(signature = (
+        current_player, status, players, biggest_bid, bid_time_sec, bidder_id, rng_state=None
+    ))]
     pub const fn new(
         current_player: usize,
         status: String,
@@ -95,6 +338,7 @@ impl SerGame {
         biggest_bid: isize,
         bid_time_sec: usize,
         bidder_id: usize,
+        rng_state: Option<i64>,
     ) -> Self {
         Self {
             current_player,
@@ -103,6 +347,7 @@ impl SerGame {
             biggest_bid,
             bid_time_sec,
             bidder_id,
+            rng_state,
         }
     }
 }
@@ -1,64 +1,227 @@
+mod batch;
 mod game;
 mod io;
 
-use pyo3::prelude::{pyclass, pymethods, pymodule, Bound, PyModule, PyResult};
+use pyo3::{
+    exceptions::PyValueError,
+    prelude::{
+        pyclass, pyfunction, pymethods, pymodule, wrap_pyfunction, Bound, IntoPy, PyModule,
+        PyObject, PyResult, Python,
+    },
+    types::{PyBytes, PyBytesMethods},
+};
+use std::sync::{Mutex, MutexGuard, PoisonError};
 
 use crate::{
-    game::{Game, RollResult},
-    io::{pass_poor, PoorResult, SerGame},
+    batch::{Action, Played},
+    game::{Game, RollResult, Settled, AUCTION_SEC, BOARD},
+    io::{pass_poor, PoorResult, PyEvent, SerGame},
+};
+
+// For the benchmarks, Python only sees the module below
+pub use crate::{
+    game::{simulate as simulate_games, Policy},
+    io::SimStats,
 };
 
-#[pyclass(name = "Game")]
+/// Frozen so any thread can share it, moves lock the game with the GIL released
+///
+/// The lock is only ever taken inside allow_threads, a thread waiting for it
+/// never holds the GIL that the thread holding it might need
+#[pyclass(name = "Game", frozen)]
 struct PyGame {
-    inner: Game,
+    inner: Mutex<Game>,
 }
 
-#[pymethods]
 impl PyGame {
-    #[new]
-    fn new(info: Vec<(usize, Option<String>)>) -> Self {
+    fn wrap(game: Game) -> Self {
         Self {
-            inner: Game::new(info),
+            inner: Mutex::new(game),
         }
     }
-    fn serialize(&self) -> SerGame {
-        self.inner.serialize()
+    /// Runs f on the game without the GIL
+    fn with<T: Send>(&self, py: Python<'_>, f: impl FnOnce(&mut Game) -> T + Send) -> T {
+        py.allow_threads(|| {
+            // Panics abort in release, a poisoned game is still a whole game
+            let mut game: MutexGuard<'_, Game> =
+                self.inner.lock().unwrap_or_else(PoisonError::into_inner);
+            f(&mut game)
+        })
+    }
+}
+
+#[pymethods]
+impl PyGame {
+    #[new]
+    #[pyo3(signature = (info, seed=None))]
+    fn new(info: Vec<(usize, Option<String>)>, seed: Option<u64>) -> Self {
+        Self::wrap(Game::new(info, seed))
+    }
+    fn serialize(&self, py: Python<'_>) -> SerGame {
+        self.with(py, |game: &mut Game| game.serialize())
+    }
+    /// With settle=False an auction past its time stays open, see settle
+    #[staticmethod]
+    #[pyo3(signature = (game, settle=true))]
+    fn deserialize(py: Python<'_>, game: &SerGame, settle: bool) -> (Self, Option<(isize, usize)>) {
+        let (inner, maybe_auction) = py.allow_threads(|| {
+            if settle {
+                Game::deserialize(game)
+            } else {
+                (Game::load(game), None)
+            }
+        });
+        (Self::wrap(inner), maybe_auction)
+    }
+    fn to_bytes<'py>(&self, py: Python<'py>) -> Bound<'py, PyBytes> {
+        let data: Vec<u8> = self.with(py, |game: &mut Game| game.to_bytes());
+        PyBytes::new_bound(py, &data)
     }
     #[staticmethod]
-    fn deserialize(game: &SerGame) -> (Self, Option<(isize, usize)>) {
-        let (inner, maybe_auction) = Game::deserialize(game);
-        (Self { inner }, maybe_auction)
+    #[pyo3(signature = (data, settle=true))]
+    fn from_bytes(
+        py: Python<'_>,
+        data: &[u8],
+        settle: bool,
+    ) -> PyResult<(Self, Option<(isize, usize)>)> {
+        let (inner, maybe_auction) = py
+            .allow_threads(|| {
+                if settle {
+                    Game::from_bytes(data)
+                } else {
+                    Game::decode(data).map(|game: Game| (game, None))
+                }
+            })
+            .map_err(|error| PyValueError::new_err(error.to_string()))?;
+        Ok((Self::wrap(inner), maybe_auction))
+    }
+    fn roll(&self, py: Python<'_>, caller_id: usize) -> (PoorResult, Option<RollResult>) {
+        pass_poor(self.with(py, |game: &mut Game| game.roll(caller_id)))
+    }
+    fn buy(&self, py: Python<'_>, caller_id: usize) -> (PoorResult, Option<(isize, usize)>) {
+        pass_poor(self.with(py, |game: &mut Game| game.buy(caller_id)))
     }
-    fn roll(&mut self, caller_id: usize) -> (PoorResult, Option<RollResult>) {
-        pass_poor(self.inner.roll(caller_id))
+    fn auction(&self, py: Python<'_>, caller_id: usize) -> (PoorResult, Option<usize>) {
+        pass_poor(self.with(py, |game: &mut Game| game.auction(caller_id)))
     }
-    fn buy(&mut self, caller_id: usize) -> (PoorResult, Option<(isize, usize)>) {
-        pass_poor(self.inner.buy(caller_id))
+    fn bid(&self, py: Python<'_>, caller_id: usize, price: isize) -> (PoorResult, Option<usize>) {
+        pass_poor(self.with(py, |game: &mut Game| game.bid(caller_id, price)))
     }
-    fn auction(&mut self, caller_id: usize) -> (PoorResult, Option<usize>) {
-        pass_poor(self.inner.auction(caller_id))
+    fn rent(
+        &self,
+        py: Python<'_>,
+        caller_id: usize,
+    ) -> (PoorResult, Option<(isize, usize, isize)>) {
+        pass_poor(self.with(py, |game: &mut Game| game.rent(caller_id)))
     }
-    fn bid(&mut self, caller_id: usize, price: isize) -> (PoorResult, Option<usize>) {
-        pass_poor(self.inner.bid(caller_id, price))
+    /// Closes the auction if nobody outbid in time, Some((user_id, money, tile_id))
+    fn settle(&self, py: Python<'_>) -> (PoorResult, Option<Settled>) {
+        pass_poor(self.with(py, |game: &mut Game| game.settle_auction()))
     }
-    fn rent(&mut self, caller_id: usize) -> (PoorResult, Option<(isize, usize, isize)>) {
-        pass_poor(self.inner.rent(caller_id))
+    fn get_bid_time_sec(&self, py: Python<'_>) -> Option<usize> {
+        self.with(py, |game: &mut Game| game.get_bid_time_sec())
     }
-    fn get_status(&self, caller_id: usize) -> String {
-        self.inner.get_status(caller_id)
+    fn get_status(&self, py: Python<'_>, caller_id: usize) -> String {
+        self.with(py, |game: &mut Game| game.get_status(caller_id))
     }
-    fn get_position(&self, user_id: usize) -> usize {
-        self.inner.get_position(user_id)
+    fn get_rng_state(&self, py: Python<'_>) -> i64 {
+        self.with(py, |game: &mut Game| game.get_rng_state())
     }
-    fn build(&mut self, user_id: usize, tile_id: usize) -> (PoorResult, Option<isize>) {
-        pass_poor(self.inner.build(user_id, tile_id))
+    fn is_auction(&self, py: Python<'_>) -> bool {
+        self.with(py, |game: &mut Game| game.is_auction())
     }
+    fn get_position(&self, py: Python<'_>, user_id: usize) -> usize {
+        self.with(py, |game: &mut Game| game.get_position(user_id))
+    }
+    fn build(&self, py: Python<'_>, user_id: usize, tile_id: usize) -> (PoorResult, Option<isize>) {
+        pass_poor(self.with(py, |game: &mut Game| game.build(user_id, tile_id)))
+    }
+}
+
+/// Plays whole games without Python in between, on all cores
+///
+/// policy is "buy", "auction" or "random", the same seed gives the same stats
+#[pyfunction]
+#[pyo3(signature = (n_games, n_players, policy="random".to_owned(), seed=0, max_turns=1000))]
+fn simulate(
+    py: Python<'_>,
+    n_games: u64,
+    n_players: usize,
+    policy: String,
+    seed: u64,
+    max_turns: u64,
+) -> PyResult<SimStats> {
+    let Some(policy) = Policy::parse(&policy) else {
+        return Err(PyValueError::new_err(format!(
+            "Unknown policy {policy}, expected buy, auction or random"
+        )));
+    };
+    if n_players == 0 {
+        return Err(PyValueError::new_err("A game needs at least one player"));
+    }
+    Ok(py.allow_threads(|| game::simulate(n_games, n_players, policy, seed, max_turns)))
+}
+
+/// (game_bytes, action, caller_id, arg) to (game_bytes, output, result, maybe_auction)
+///
+/// result is what the Game method of the action returns with output,
+/// maybe_auction is what from_bytes returns with the game
+#[pyfunction]
+fn play_batch<'py>(
+    py: Python<'py>,
+    moves: Vec<(Bound<'py, PyBytes>, String, usize, Option<isize>)>,
+) -> PyResult<
+    Vec<(
+        Bound<'py, PyBytes>,
+        PoorResult,
+        PyObject,
+        Option<(isize, usize)>,
+    )>,
+> {
+    let parsed: Vec<(&[u8], Action, usize)> = moves
+        .iter()
+        .map(|(data, action, caller_id, arg)| {
+            let action: Action = Action::parse(action, *arg).map_err(PyValueError::new_err)?;
+            Ok((data.as_bytes(), action, *caller_id))
+        })
+        .collect::<PyResult<Vec<(&[u8], Action, usize)>>>()?;
+
+    // bytes are immutable and moves holds them, the slices stay valid without the GIL
+    let played: Vec<Result<Played, game::DecodeError>> = py.allow_threads(|| {
+        parsed
+            .iter()
+            .map(|(data, action, caller_id)| batch::play(data, action, *caller_id))
+            .collect()
+    });
+
+    played
+        .into_iter()
+        .enumerate()
+        .map(|(index, result)| {
+            let played: Played =
+                result.map_err(|error| PyValueError::new_err(format!("Move {index}: {error}")))?;
+            let (output, ()) = pass_poor((played.events, ()));
+            Ok((
+                PyBytes::new_bound(py, &played.game),
+                output,
+                played.outcome.into_py(py),
+                played.maybe_auction,
+            ))
+        })
+        .collect()
 }
 
 #[pymodule]
 fn monopoly(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_class::<PyGame>()?;
     m.add_class::<PoorResult>()?;
+    m.add_class::<PyEvent>()?;
     m.add_class::<SerGame>()?;
+    m.add_class::<SimStats>()?;
+    m.add_function(wrap_pyfunction!(simulate, m)?)?;
+    m.add_function(wrap_pyfunction!(play_batch, m)?)?;
+    // Length of the ownership bytes in SerGame
+    m.add("TILE_COUNT", BOARD.len())?;
+    m.add("AUCTION_SEC", AUCTION_SEC)?;
     Ok(())
 }
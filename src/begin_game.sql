@@ -1,5 +1,12 @@
-INSERT INTO game (chat_id, status, current_player)
-VALUES (%s, 'roll', 0)
+WITH players AS (
+    UPDATE chat SET "position" = 1, money = 1500
+    WHERE chat_id = %(chat_id)s AND user_id = ANY(%(user_ids)s)
+)
+INSERT INTO game (chat_id, status, current_player, rng_state)
+VALUES (%(chat_id)s, 'roll', 0, %(rng_state)s)
 ON CONFLICT (chat_id) DO UPDATE SET
     status = EXCLUDED.status,
-    current_player = EXCLUDED.current_player;
+    current_player = EXCLUDED.current_player,
+    rng_state = EXCLUDED.rng_state,
+    version = game.version + 1
+RETURNING version;
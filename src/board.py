@@ -0,0 +1,164 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+
+from monopoly import Game, TILE_COUNT
+
+
+# Tiles on a side of the square board, corners are on two sides
+SIDE: int = TILE_COUNT // 4 + 1
+TILE_PX: int = 64
+BOARD_PX: int = SIDE * TILE_PX
+# Players in the order they joined, repeated past the last one
+PLAYER_COLOURS: tuple[str, ...] = (
+    "#e6194b",
+    "#3cb44b",
+    "#4363d8",
+    "#f58231",
+    "#911eb4",
+    "#42d4f4",
+    "#f032e6",
+    "#9a6324",
+)
+# PNGs held while their upload is in flight
+MAX_UPLOADS: int = 32
+BACKGROUND: str = "#cde6d0"
+LINE: str = "#1e1e1e"
+
+
+@dataclass(frozen=True, slots=True)
+class Board:
+    """Everything a board image shows, equal boards are the same image"""
+
+    # username, or user_id without one, of every player in order
+    names: tuple[str, ...]
+    positions: tuple[int, ...]
+    # A byte per tile for every player, 0 if not owned or house_count + 1
+    ownership: tuple[bytes, ...]
+    # Order of the player who asked, their token is drawn larger
+    caller: Optional[int]
+
+    def key(self) -> str:
+        """Hash of what is shown, the name of the image in board_image"""
+        return hashlib.blake2b(repr(self).encode(), digest_size=16).hexdigest()
+
+
+def board_of(game: Optional[Game], caller_id: Optional[int]) -> Board:
+    """An empty board without a game"""
+    if game is None:
+        return Board((), (), (), None)
+    players: list = game.serialize().players
+    user_ids: list[int] = [player[0] for player in players]
+    return Board(
+        tuple(username or str(user_id) for user_id, username, *_ in players),
+        tuple(player[3] for player in players),
+        tuple(bytes(player[2]) for player in players),
+        user_ids.index(caller_id) if caller_id in user_ids else None,
+    )
+
+
+def tile_box(tile_id: int) -> tuple[int, int, int, int]:
+    """Pixels of a tile, Go is in the bottom right corner and moves go clockwise"""
+    last: int = SIDE - 1
+    side, step = divmod(tile_id, last)
+    column, row = (
+        (last - step, last),
+        (0, last - step),
+        (step, 0),
+        (last, step),
+    )[side]
+    left, top = column * TILE_PX, row * TILE_PX
+    return left, top, left + TILE_PX, top + TILE_PX
+
+
+def draw(board: Board) -> bytes:
+    """PNG of the board, slow enough to be run off the event loop"""
+    # Only /map needs Pillow, cold starts for other commands skip loading it
+    from PIL import Image, ImageDraw, ImageFont
+
+    image: Image.Image = Image.new("RGB", (BOARD_PX, BOARD_PX), BACKGROUND)
+    canvas: ImageDraw.ImageDraw = ImageDraw.Draw(image)
+    # Loaded per image, a font can't be shared by threads drawing at once
+    font: ImageFont.ImageFont | ImageFont.FreeTypeFont = ImageFont.load_default(13)
+
+    for tile_id in range(TILE_COUNT):
+        left, top, right, bottom = tile_box(tile_id)
+        canvas.rectangle((left, top, right, bottom), fill="white", outline=LINE)
+        canvas.text((left + 4, top + 2), str(tile_id), fill=LINE, font=font)
+
+    for order, tiles in enumerate(board.ownership):
+        colour: str = PLAYER_COLOURS[order % len(PLAYER_COLOURS)]
+        for tile_id, slot in enumerate(tiles):
+            if slot == 0:
+                continue
+            left, top, right, bottom = tile_box(tile_id)
+            # A band along the bottom of the tile, a square per house on it
+            canvas.rectangle(
+                (left + 1, bottom - 14, right - 1, bottom - 1), fill=colour
+            )
+            for house in range(slot - 1):
+                x: int = left + 4 + house * 11
+                canvas.rectangle((x, bottom - 11, x + 7, bottom - 4), fill="white")
+
+    for order, position in enumerate(board.positions):
+        colour = PLAYER_COLOURS[order % len(PLAYER_COLOURS)]
+        left, top, _right, _bottom = tile_box(position)
+        # Up to 9 tokens in a 3 by 3 grid under the tile number
+        row, column = divmod(order % 9, 3)
+        x, y = left + 14 + column * 16, top + 22 + row * 13
+        radius: int = 7 if order == board.caller else 5
+        canvas.ellipse(
+            (x - radius, y - radius, x + radius, y + radius), fill=colour, outline=LINE
+        )
+
+    # Who is who in the middle of the board
+    for order, name in enumerate(board.names):
+        colour = PLAYER_COLOURS[order % len(PLAYER_COLOURS)]
+        x, y = TILE_PX + 16, TILE_PX + 16 + order * 20
+        canvas.rectangle((x, y, x + 12, y + 12), fill=colour, outline=LINE)
+        canvas.text((x + 20, y - 1), name, fill=LINE, font=font)
+
+    output: BytesIO = BytesIO()
+    image.save(output, format="PNG", optimize=True)
+    return output.getvalue()
+
+
+class BoardCache:
+    """Board key -> file_id of the uploaded image, PNGs only while uploading
+
+    A board asked for again while its upload is in flight is sent as the
+    same PNG instead of being drawn again. A failed upload forgets its PNG,
+    so only file_ids stay around
+    """
+
+    __slots__ = ("entries", "max_size", "uploads")
+
+    def __init__(self, max_size: int) -> None:
+        self.entries: OrderedDict[str, str] = OrderedDict()
+        self.max_size: int = max_size
+        self.uploads: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, key: str) -> Optional[str | bytes]:
+        file_id: Optional[str] = self.entries.get(key, None)
+        if file_id is not None:
+            self.entries.move_to_end(key)
+            return file_id
+        return self.uploads.get(key, None)
+
+    def put(self, key: str, file_id: str) -> None:
+        self.uploads.pop(key, None)
+        self.entries[key] = file_id
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def upload(self, key: str, png: bytes) -> None:
+        """Until put or failed, an upload lost without either is pushed out"""
+        self.uploads[key] = png
+        while len(self.uploads) > MAX_UPLOADS:
+            self.uploads.popitem(last=False)
+
+    def failed(self, key: str) -> None:
+        self.uploads.pop(key, None)
@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from monopoly import Game
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    game: Game
+    # game.version in the database this state corresponds to
+    version: int
+    # time.monotonic() of the last write or revalidation
+    synced_at: float
+    # The last change was written by this instance
+    is_own: bool
+
+
+class GameCache:
+    """In-process chat_id -> Game cache with LRU and TTL eviction
+
+    Write-through: handlers mutate the cached Game in place,
+    persist the change and then record the version they wrote
+    """
+
+    __slots__ = ("entries", "max_size", "ttl_sec")
+
+    def __init__(self, max_size: int, ttl_sec: float) -> None:
+        self.entries: OrderedDict[int, CacheEntry] = OrderedDict()
+        self.max_size: int = max_size
+        self.ttl_sec: float = ttl_sec
+
+    def __contains__(self, chat_id: int) -> bool:
+        return self.lookup(chat_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, chat_id: int) -> Optional[CacheEntry]:
+        entry: Optional[CacheEntry] = self.entries.get(chat_id, None)
+        if entry is None:
+            return None
+        elif time.monotonic() - entry.synced_at > self.ttl_sec:
+            del self.entries[chat_id]
+            return None
+        self.entries.move_to_end(chat_id)
+        return entry
+
+    def get(self, chat_id: int, default: Optional[Game] = None) -> Optional[Game]:
+        entry: Optional[CacheEntry] = self.lookup(chat_id)
+        return entry.game if entry is not None else default
+
+    def put(self, chat_id: int, game: Game, version: int, is_own: bool) -> None:
+        self.entries[chat_id] = CacheEntry(game, version, time.monotonic(), is_own)
+        self.entries.move_to_end(chat_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def revalidated(self, chat_id: int) -> None:
+        entry: Optional[CacheEntry] = self.entries.get(chat_id, None)
+        if entry is not None:
+            entry.synced_at = time.monotonic()
+
+    def mark_written(self, chat_id: int, version: Optional[int]) -> None:
+        entry: Optional[CacheEntry] = self.entries.get(chat_id, None)
+        if entry is None:
+            return
+        elif version is None:
+            # The row disappeared under us, next read has to go to the database
+            del self.entries[chat_id]
+            return
+        entry.version = version
+        entry.synced_at = time.monotonic()
+        entry.is_own = True
+
+    def pop(self, chat_id: int, default: Optional[Game] = None) -> Optional[Game]:
+        entry: Optional[CacheEntry] = self.entries.pop(chat_id, None)
+        return entry.game if entry is not None else default
@@ -0,0 +1,208 @@
+from psycopg import AsyncConnection
+from psycopg.types.json import Jsonb
+from typing import Any, Optional
+
+import metrics
+from monopoly import SerGame, Game, TILE_COUNT
+
+
+# The whole game of a chat in one row of game_state
+# state is {"ready": [[user_id, username], ...]} before /begin
+# game is Game.to_bytes() after
+# Rows written before 0004_game_state_bytes.sql or copied from the relational
+# tables have {"game": {...}} with the fields of SerGame in state instead
+SELECT_STATE_SQL: str = (
+    "SELECT version, state, game FROM game_state WHERE chat_id = %s;"
+)
+VERSION_SQL: str = "SELECT version FROM game_state WHERE chat_id = %s;"
+
+ADD_USER_SQL: str = """
+INSERT INTO game_state (chat_id, state)
+VALUES (%(chat_id)s, jsonb_build_object('ready', jsonb_build_array(%(user)s::jsonb)))
+ON CONFLICT (chat_id) DO UPDATE
+SET
+    state = jsonb_build_object(
+        'ready', (game_state.state -> 'ready') || (EXCLUDED.state -> 'ready')
+    ),
+    version = game_state.version + 1
+WHERE game_state.state ? 'ready'
+    AND NOT (game_state.state -> 'ready') @> jsonb_build_array(
+        jsonb_build_array(%(user_id)s::bigint)
+    );
+"""
+
+# Overwrites whatever was there, used when a game begins
+PUT_GAME_SQL: str = """
+INSERT INTO game_state (chat_id, game, bid_time_sec)
+VALUES (%(chat_id)s, %(game)s, %(bid_time_sec)s)
+ON CONFLICT (chat_id) DO UPDATE
+SET
+    state = NULL,
+    game = EXCLUDED.game,
+    bid_time_sec = EXCLUDED.bid_time_sec,
+    version = game_state.version + 1
+RETURNING version;
+"""
+
+# Optimistic concurrency, only replaces the state the caller has read
+SAVE_GAME_SQL: str = """
+UPDATE game_state
+SET
+    state = NULL,
+    game = %(game)s,
+    bid_time_sec = %(bid_time_sec)s,
+    version = version + 1
+WHERE chat_id = %(chat_id)s AND version = %(version)s
+RETURNING version;
+"""
+
+# bid_time_sec is only set during auctions, see 0006_auction_expiry.sql
+EXPIRED_AUCTIONS_SQL: str = """
+SELECT chat_id FROM game_state
+WHERE bid_time_sec < %(before_sec)s
+ORDER BY bid_time_sec
+LIMIT %(limit)s;
+"""
+
+FINISH_GAME_SQL: str = "DELETE FROM game_state WHERE chat_id = %(chat_id)s;"
+
+
+class StaleGameError(Exception):
+    """The game was changed by someone else since it was read"""
+
+
+def encode(ser_game: SerGame) -> dict[str, Any]:
+    return {
+        "current_player": ser_game.current_player,
+        "status": ser_game.status,
+        # Ownership goes as [tile_id, house_count] pairs, the same as before it was bytes
+        "players": [
+            [
+                user_id,
+                username,
+                [[tile_id, slot - 1] for tile_id, slot in enumerate(ownership) if slot],
+                *rest,
+            ]
+            for user_id, username, ownership, *rest in ser_game.players
+        ],
+        "biggest_bid": ser_game.biggest_bid,
+        "bid_time_sec": ser_game.bid_time_sec,
+        "bidder_id": ser_game.bidder_id,
+        "rng_state": ser_game.rng_state,
+    }
+
+
+def decode_ownership(pairs: list[list[int]]) -> bytes:
+    slots: bytearray = bytearray(TILE_COUNT)
+    for tile_id, house_count in pairs:
+        slots[tile_id] = house_count + 1
+    return bytes(slots)
+
+
+def decode(state: dict[str, Any]) -> SerGame:
+    players: list[tuple[int, Optional[str], bytes, int, int, bool, int]] = [
+        (user_id, username, decode_ownership(ownership), *rest)
+        for user_id, username, ownership, *rest in state["players"]
+    ]
+    return SerGame(
+        state["current_player"],
+        state["status"],
+        players,
+        state["biggest_bid"],
+        state["bid_time_sec"],
+        state["bidder_id"],
+        state.get("rng_state", None),
+    )
+
+
+async def fetch_state(
+    conn: AsyncConnection, chat_id: int
+) -> tuple[None | list[tuple[int, Optional[str]]] | Game, Optional[int]]:
+    """A single primary key lookup, returns the game and its version
+
+    Only reads, an auction past its time is left for Game.settle
+    """
+    row: Optional[dict] = await (
+        await conn.execute(SELECT_STATE_SQL, (chat_id,))
+    ).fetchone()
+    if row is None:
+        # Game not ready
+        return None, None
+
+    version: int = row["version"]
+    state: Optional[dict[str, Any]] = row["state"]
+    if row["game"] is not None:
+        metrics.add_bytes("state", len(row["game"]))
+        with metrics.span("decode"):
+            game, _maybe_auction = Game.from_bytes(row["game"], settle=False)
+    elif "ready" in state:
+        # Game not ready but there are ready players
+        return [(user_id, username) for user_id, username in state["ready"]], version
+    else:
+        with metrics.span("decode"):
+            game, _maybe_auction = Game.deserialize(decode(state["game"]), settle=False)
+    return game, version
+
+
+async def fetch_game(
+    conn: AsyncConnection, chat_id: int
+) -> None | list[tuple[int, Optional[str]]] | Game:
+    return (await fetch_state(conn, chat_id))[0]
+
+
+async def fetch_version(conn: AsyncConnection, chat_id: int) -> Optional[int]:
+    """Cheap check if the game changed since it was last fetched"""
+    row: Optional[dict] = await (await conn.execute(VERSION_SQL, (chat_id,))).fetchone()
+    return row["version"] if row is not None else None
+
+
+async def save_game(
+    conn: AsyncConnection, chat_id: int, game: Game, version: Optional[int]
+) -> int:
+    """Writes the whole game in one statement and commits
+
+    `version` is the one the game was read at, None overwrites unconditionally
+    """
+    with metrics.span("encode"):
+        data: bytes = game.to_bytes()
+    metrics.add_bytes("state", len(data))
+    params: dict[str, Any] = {
+        "chat_id": chat_id,
+        "game": data,
+        "bid_time_sec": game.get_bid_time_sec(),
+        "version": version,
+    }
+    query: str = PUT_GAME_SQL if version is None else SAVE_GAME_SQL
+    row: Optional[dict] = await (await conn.execute(query, params)).fetchone()
+    await conn.commit()
+    if row is None:
+        raise StaleGameError(f"Game of chat {chat_id} changed after version {version}")
+    return row["version"]
+
+
+async def expired_auctions(
+    conn: AsyncConnection, before_sec: int, limit: int
+) -> list[int]:
+    """Chats with an auction whose last bid was before `before_sec`"""
+    params: dict[str, Any] = {"before_sec": before_sec, "limit": limit}
+    rows: list[dict] = await (
+        await conn.execute(EXPIRED_AUCTIONS_SQL, params)
+    ).fetchall()
+    return [row["chat_id"] for row in rows]
+
+
+async def add_user(
+    conn: AsyncConnection, chat_id: int, user_id: int, username: Optional[str]
+) -> None:
+    params: dict[str, Any] = {
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "user": Jsonb([user_id, username]),
+    }
+    await conn.execute(ADD_USER_SQL, params)
+    await conn.commit()
+
+
+async def finish_game(conn: AsyncConnection, chat_id: int) -> None:
+    await conn.execute(FINISH_GAME_SQL, {"chat_id": chat_id})
+    await conn.commit()
@@ -1,25 +1,211 @@
-import psycopg
-from psycopg import Connection, sql
+import os
+import time
+from psycopg import AsyncConnection, AsyncCursor
+from psycopg.conninfo import conninfo_to_dict
 from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 from pathlib import Path
+from weakref import WeakKeyDictionary
 from typing import Any, Optional
 
-from secret import load_cloud, load_local
-from monopoly import SerGame, Game
+import metrics
+from monopoly import SerGame, Game, TILE_COUNT
 
 
 PARENT: Path = Path(__file__).resolve(strict=True).parent
 
 
-def select_sql() -> str:
-    with open(PARENT.joinpath("select.sql")) as file:
-        query: str = file.read()
-    return query
+def load_queries(*names: str) -> dict[str, str]:
+    """Reads every SQL file once, fails on import if any of them is missing"""
+    missing: list[str] = [name for name in names if not PARENT.joinpath(name).is_file()]
+    if len(missing) > 0:
+        raise FileNotFoundError(f"Missing SQL files in {PARENT}: {missing}")
+
+    queries: dict[str, str] = dict()
+    for name in names:
+        with open(PARENT.joinpath(name)) as file:
+            queries[name] = file.read()
+    return queries
+
+
+QUERIES: dict[str, str] = load_queries("select.sql", "begin_game.sql")
+SELECT_SQL: str = QUERIES["select.sql"]
+BEGIN_GAME_SQL: str = QUERIES["begin_game.sql"]
+VERSION_SQL: str = "SELECT version FROM game WHERE chat_id = %s;"
+
+ADD_USER_SQL: str = """
+WITH new_chat AS (
+    INSERT INTO chat (chat_id, user_id, "position", money)
+    VALUES (%(chat_id)s, %(user_id)s, -1, -1)
+    ON CONFLICT DO NOTHING
+)
+INSERT INTO meta (user_id, username)
+VALUES (%(user_id)s, %(username)s)
+ON CONFLICT DO NOTHING;
+"""
+
+# Moves write absolute values, so each only applies to the version it was
+# made on and returns no row if another instance wrote in between. The rows of
+# chat and player go with the game row, the same as in SETTLE_AUCTION_SQL
 
+ROLL_USER_SQL: str = """
+WITH moved AS (
+    UPDATE game
+    SET status = %(status)s, rng_state = %(rng_state)s, version = version + 1
+    WHERE chat_id = %(chat_id)s AND version = %(version)s
+    RETURNING version
+), player_update AS (
+    UPDATE chat
+    SET
+        "position" = %(position)s,
+        money = %(money)s,
+        is_jailed = %(is_jailed)s,
+        streak = %(streak)s
+    WHERE chat_id = %(chat_id)s
+        AND user_id = %(user_id)s
+        AND EXISTS (SELECT FROM moved)
+)
+SELECT version FROM moved;
+"""
+
+BUY_USER_SQL: str = """
+WITH moved AS (
+    UPDATE game
+    SET status = 'roll', version = version + 1
+    WHERE chat_id = %(chat_id)s AND version = %(version)s
+    RETURNING version
+), buyer AS (
+    UPDATE chat SET money = %(money)s
+    WHERE chat_id = %(chat_id)s
+        AND user_id = %(user_id)s
+        AND EXISTS (SELECT FROM moved)
+    RETURNING player_id
+), ownership AS (
+    INSERT INTO player (player_id, tile_id, house_count)
+    SELECT player_id, %(tile_id)s, 0 FROM buyer
+)
+SELECT version FROM moved;
+"""
+
+# Same as BUY_USER_SQL for the winner, only if nobody moved since the game was read
+SETTLE_AUCTION_SQL: str = """
+WITH settled AS (
+    UPDATE game
+    SET status = 'roll', version = version + 1
+    WHERE chat_id = %(chat_id)s AND status = 'auction' AND version = %(version)s
+    RETURNING version
+), buyer AS (
+    UPDATE chat SET money = %(money)s
+    WHERE chat_id = %(chat_id)s
+        AND user_id = %(user_id)s
+        AND EXISTS (SELECT FROM settled)
+    RETURNING player_id
+), ownership AS (
+    INSERT INTO player (player_id, tile_id, house_count)
+    SELECT player_id, %(tile_id)s, 0 FROM buyer
+)
+SELECT version FROM settled;
+"""
 
-def connect_to_db(context: Any) -> Connection:
+# Oldest first, served by the partial index from 0006_auction_expiry.sql
+EXPIRED_AUCTIONS_SQL: str = """
+SELECT chat_id FROM game
+WHERE status = 'auction' AND bid_time_sec < %(before_sec)s
+ORDER BY bid_time_sec
+LIMIT %(limit)s;
+"""
+
+BOARD_IMAGE_SQL: str = "SELECT file_id FROM board_image WHERE board_key = %s;"
+
+# Two instances uploading the same board keep the first file_id
+SAVE_BOARD_IMAGE_SQL: str = """
+INSERT INTO board_image (board_key, file_id)
+VALUES (%(board_key)s, %(file_id)s)
+ON CONFLICT (board_key) DO NOTHING;
+"""
+
+# Ownership rows in player go with the chat rows, ON DELETE CASCADE
+FINISH_GAME_SQL: str = """
+WITH game_delete AS (
+    DELETE FROM game WHERE chat_id = %(chat_id)s
+)
+DELETE FROM chat WHERE chat_id = %(chat_id)s;
+"""
+
+AUCTION_GAME_SQL: str = """
+UPDATE game
+SET
+    status = 'auction',
+    biggest_bid = 40,
+    bid_time_sec = %(bid_time_sec)s,
+    bidder_id = %(user_id)s,
+    version = version + 1
+WHERE chat_id = %(chat_id)s AND version = %(version)s
+RETURNING version;
+"""
+
+BID_GAME_SQL: str = """
+UPDATE game
+SET
+    biggest_bid = %(price)s,
+    bid_time_sec = %(bid_time_sec)s,
+    bidder_id = %(user_id)s,
+    version = version + 1
+WHERE chat_id = %(chat_id)s AND version = %(version)s
+RETURNING version;
+"""
+
+RENT_CHAT_SQL: str = """
+WITH moved AS (
+    UPDATE game
+    SET rng_state = %(rng_state)s, version = version + 1
+    WHERE chat_id = %(chat_id)s AND version = %(version)s
+    RETURNING version
+), caller_update AS (
+    UPDATE chat SET money = %(caller_money)s
+    WHERE chat_id = %(chat_id)s
+        AND user_id = %(caller_id)s
+        AND EXISTS (SELECT FROM moved)
+), rentee_update AS (
+    UPDATE chat SET money = %(rentee_money)s
+    WHERE chat_id = %(chat_id)s
+        AND user_id = %(rentee_id)s
+        AND EXISTS (SELECT FROM moved)
+)
+SELECT version FROM moved;
+"""
+
+BUILD_PLAYER_SQL: str = """
+WITH moved AS (
+    UPDATE game
+    SET version = version + 1
+    WHERE chat_id = %(chat_id)s AND version = %(version)s
+    RETURNING version
+), builder AS (
+    UPDATE chat SET money = %(money)s
+    WHERE chat_id = %(chat_id)s
+        AND user_id = %(user_id)s
+        AND EXISTS (SELECT FROM moved)
+    RETURNING player_id
+), house AS (
+    UPDATE player SET house_count = house_count + 1
+    FROM builder
+    WHERE player.player_id = builder.player_id AND player.tile_id = %(tile_id)s
+)
+SELECT version FROM moved;
+"""
+
+
+def connection_params(context: Any) -> dict[str, str | int]:
     # God knows what this context is
 
+    dsn: Optional[str] = os.environ.get("DB_DSN")
+    if dsn is not None:
+        # A database of its own, like the one of bench/updates.py
+        return conninfo_to_dict(dsn)
+    # Not in the repository, only needed without DB_DSN
+    from secret import load_cloud, load_local
+
     secrets: Path = PARENT.joinpath("secret.txt")
     if secrets.is_file():
         # Running locally
@@ -27,27 +213,82 @@ def connect_to_db(context: Any) -> Connection:
     else:
         # Running in the cloud
         params: dict[str, str | int] = load_cloud(context)
+    return params
+
+
+class TracedConnection(AsyncConnection):
+    """Adds every round trip to the "db" phase of the traced update"""
+
+    async def execute(self, *args: Any, **kwargs: Any) -> AsyncCursor:
+        with metrics.span("db"):
+            return await super().execute(*args, **kwargs)
+
+    async def commit(self) -> None:
+        with metrics.span("db"):
+            await super().commit()
+
+    async def rollback(self) -> None:
+        with metrics.span("db"):
+            await super().rollback()
 
-    conn: Connection = psycopg.connect(row_factory=dict_row, **params)
+
+async def connect_to_db(context: Any) -> AsyncConnection:
+    conn: AsyncConnection = await AsyncConnection.connect(
+        row_factory=dict_row, **connection_params(context)
+    )
     return conn
 
 
+async def create_pool(
+    context: Any,
+    min_size: int,
+    max_size: int,
+    timeout: float,
+    max_idle: float,
+    health_check_sec: float,
+) -> AsyncConnectionPool:
+    # When each pooled connection was last handed back
+    returned_at: WeakKeyDictionary[AsyncConnection, float] = WeakKeyDictionary()
+
+    async def check(conn: AsyncConnection) -> None:
+        # Only ping connections idle long enough to have possibly gone stale
+        if time.monotonic() - returned_at.get(conn, 0.0) > health_check_sec:
+            await AsyncConnectionPool.check_connection(conn)
+
+    async def reset(conn: AsyncConnection) -> None:
+        returned_at[conn] = time.monotonic()
+
+    pool: AsyncConnectionPool = AsyncConnectionPool(
+        connection_class=TracedConnection,
+        kwargs={"row_factory": dict_row, **connection_params(context)},
+        min_size=min_size,
+        max_size=max_size,
+        timeout=timeout,
+        max_idle=max_idle,
+        check=check,
+        reset=reset,
+        open=False,
+    )
+    await pool.open()
+    return pool
+
+
 def flatten_row(
-    row: tuple[int, tuple[Optional[str], dict[int, int], int, int]],
-) -> tuple[int, Optional[str], dict[int, int], int, int]:
-    result = (row[0], *row[1])
+    row: tuple[int, tuple[Optional[str], bytearray, int, int]],
+) -> tuple[int, Optional[str], bytes, int, int]:
+    username, ownership, *rest = row[1]
+    result = (row[0], username, bytes(ownership), *rest)
     assert isinstance(result[0], int)
     assert result[1] is None or isinstance(result[1], str)
-    assert isinstance(result[2], dict)
     assert isinstance(result[3], int)
     assert isinstance(result[4], int)
     return result
 
 
 def collect_players(
-    rows: list[dict[str, int | bool | Optional[int | str] | dict[int, int]]],
-) -> list[tuple[int, Optional[str], dict[int, int], int, int]]:
-    players: dict[int, tuple[Optional[str], dict[int, int], int, int]] = dict()
+    rows: list[dict[str, int | bool | Optional[int | str]]],
+) -> list[tuple[int, Optional[str], bytes, int, int]]:
+    players: dict[int, tuple[Optional[str], bytearray, int, int]] = dict()
     for row in rows:
         user_id: int = row["user_id"]
         is_jailed: bool = row["is_jailed"]
@@ -62,34 +303,37 @@ def collect_players(
         if user_id not in players.keys():
             username: Optional[str] = row["username"]
 
-            ownership: dict[int, int] = (
-                {tile_id: house_count} if tile_id is not None else dict()
-            )
+            # SerGame takes a byte per tile, 0 if not owned or house_count + 1
+            ownership: bytearray = bytearray(TILE_COUNT)
 
             position: int = row["position"]
             money: int = row["money"]
             players[user_id] = (username, ownership, position, money, is_jailed, streak)
-        else:
-            players[user_id][1][tile_id] = house_count
+        if tile_id is not None:
+            players[user_id][1][tile_id] = house_count + 1
 
     # From Python 3.6 `dict` preserves inserion order
     # That is, the order that was in Postgres
     return list(map(flatten_row, players.items()))
 
 
-def fetch_game(
-    conn: Connection, chat_id: int
-) -> None | list[tuple[int, Optional[str]]] | Game:
-    query: str = select_sql()
+async def fetch_state(
+    conn: AsyncConnection, chat_id: int
+) -> tuple[None | list[tuple[int, Optional[str]]] | Game, Optional[int]]:
+    """Returns the game and the version it was read at
+
+    Only reads, an auction past its time is left for Game.settle
+    """
+    query: str = SELECT_SQL
     params: tuple[int] = (chat_id,)
-    rows: list[dict] = conn.execute(query, params).fetchall()
+    rows: list[dict] = await (await conn.execute(query, params)).fetchall()
 
     if len(rows) == 0:
         # Game not ready
-        return None
+        return None, None
     elif rows[0]["status"] is None:
         # Game not ready but there are ready players
-        return [(row["user_id"], row["username"]) for row in rows]
+        return [(row["user_id"], row["username"]) for row in rows], None
 
     # Game in progress
     current_player: int = rows[0]["current_player"]
@@ -97,77 +341,74 @@ def fetch_game(
     biggest_bid: int = rows[0]["biggest_bid"]
     bid_time_sec: int = rows[0]["bid_time_sec"]
     bidder_id: int = rows[0]["bidder_id"]
-    players: list[tuple[int, Optional[str], dict[int, int], int, int]] = (
-        collect_players(rows)
-    )
+    players: list[tuple[int, Optional[str], bytes, int, int]] = collect_players(rows)
+    rng_state: Optional[int] = rows[0]["rng_state"]
     ser_game = SerGame(
-        current_player, status, players, biggest_bid, bid_time_sec, bidder_id
-    )
-    game, maybe_auction = Game.deserialize(ser_game)
-    if maybe_auction is None:
-        return game
-    # sync with db if auction ended
-    money, tile_id = maybe_auction
-    buy_user(conn, chat_id, bidder_id, money, tile_id)
-    return game
-
-
-def add_user(
-    conn: Connection, chat_id: int, user_id: int, username: Optional[str]
-) -> None:
-    query: sql.Composed = sql.SQL("""DO $$
-BEGIN
-    INSERT INTO chat  (chat_id, user_id, "position", money) 
-    VALUES ({chat_id}, {user_id}, {position}, {money})
-    ON CONFLICT DO NOTHING;
-
-    INSERT INTO meta (user_id, username)
-    VALUES ({user_id}, {username})
-    ON CONFLICT DO NOTHING;
-END $$;""").format(
-        chat_id=chat_id,
-        user_id=user_id,
-        position=-1,
-        money=-1,
-        username=username,
+        current_player,
+        status,
+        players,
+        biggest_bid,
+        bid_time_sec,
+        bidder_id,
+        rng_state,
     )
-    conn.execute(query)
-    conn.commit()
+    with metrics.span("decode"):
+        game, _maybe_auction = Game.deserialize(ser_game, settle=False)
+    return game, rows[0]["version"]
 
 
-def begin_game_sql() -> str:
-    with open(PARENT.joinpath("begin_game.sql")) as file:
-        query: str = file.read()
-    return query
-
+async def fetch_game(
+    conn: AsyncConnection, chat_id: int
+) -> None | list[tuple[int, Optional[str]]] | Game:
+    return (await fetch_state(conn, chat_id))[0]
 
-def begin_user_sql() -> str:
-    with open(PARENT.joinpath("begin_user.sql")) as file:
-        query: str = file.read()
-    return query
 
+async def fetch_version(conn: AsyncConnection, chat_id: int) -> Optional[int]:
+    """Cheap check if the game changed since it was last fetched"""
+    row: Optional[dict] = await (await conn.execute(VERSION_SQL, (chat_id,))).fetchone()
+    return row["version"] if row is not None else None
 
-def begin_game(conn: Connection, chat_id: int, ready_ids: tuple[int]) -> None:
-    cursor = conn.execute(
-        begin_game_sql(),
-        (chat_id,),
-    )
 
-    query = begin_user_sql()
+async def write_versioned(
+    conn: AsyncConnection, query: str, params: dict[str, Any]
+) -> Optional[int]:
+    """Runs a single statement that ends with `RETURNING version` and commits
 
-    for user_id in ready_ids:
-        cursor.execute(
-            query,
-            {
-                "chat_id": chat_id,
-                "user_id": user_id,
-            },
-        )
-    conn.commit()
+    Writes that touch many rows pass arrays and stay one round trip
+    """
+    row: Optional[dict] = await (await conn.execute(query, params)).fetchone()
+    await conn.commit()
+    return row["version"] if row is not None else None
 
 
-def roll_user(
-    conn: Connection,
+async def add_user(
+    conn: AsyncConnection, chat_id: int, user_id: int, username: Optional[str]
+) -> None:
+    params: dict[str, Any] = {
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "username": username,
+    }
+    await conn.execute(ADD_USER_SQL, params)
+    await conn.commit()
+
+
+async def begin_game(
+    conn: AsyncConnection, chat_id: int, ready_ids: tuple[int], rng_state: int
+) -> int:
+    # One statement for the game and every ready player
+    params: dict[str, Any] = {
+        "chat_id": chat_id,
+        "user_ids": list(ready_ids),
+        "rng_state": rng_state,
+    }
+    version: Optional[int] = await write_versioned(conn, BEGIN_GAME_SQL, params)
+    assert version is not None
+    return version
+
+
+async def roll_user(
+    conn: AsyncConnection,
     chat_id: int,
     user_id: int,
     position: int,
@@ -175,176 +416,156 @@ def roll_user(
     is_jailed: bool,
     streak: int,
     status: bool,
-) -> None:
-    # Have to do it inline because status is a string
-    query: sql.Composed = sql.SQL(
-        """DO $$
-BEGIN
-    UPDATE chat 
-    SET 
-        "position" = {position}, 
-        money = {money}, 
-        is_jailed = {is_jailed}, 
-        streak = {streak}
-    WHERE player_id = (
-        SELECT player_id FROM chat
-        WHERE user_id = {user_id} AND chat_id = {chat_id}
-    );
-
-    UPDATE game SET status = {status}
-    WHERE chat_id = {chat_id};
-END $$;"""
-    ).format(
-        position=position,
-        money=money,
-        is_jailed=is_jailed,
-        streak=streak,
-        user_id=user_id,
-        chat_id=chat_id,
-        status="buy" if status else "roll",
-    )
-    conn.execute(query)
-    conn.commit()
-
-
-def buy_user(
-    conn: Connection, chat_id: int, user_id: int, money: int, tile_id: int
-) -> None:
-    query: sql.Composed = sql.SQL("""DO $$
-DECLARE
-    player_0 integer;
-BEGIN
-    player_0 := (
-        SELECT player_id FROM chat
-        WHERE user_id = {user_id} AND chat_id = {chat_id}
-    );
-
-    UPDATE chat SET money = {money}
-    WHERE player_id = player_0;
-
-    UPDATE game SET status = 'roll'
-    WHERE chat_id = {chat_id};
-
-    INSERT INTO player (player_id, tile_id, house_count)
-    VALUES (player_0, {tile_id}, 0);
-END $$;""").format(money=money, chat_id=chat_id, user_id=user_id, tile_id=tile_id)
-
-    conn.execute(query)
-    conn.commit()
-
-
-def finish_game(conn: Connection, chat_id: int) -> None:
-    query: sql.Composed = sql.SQL("""DO $$
-BEGIN
-    DELETE FROM game WHERE chat_id = {chat_id};
-
-    DELETE FROM player USING chat 
-	WHERE player.player_id = chat.player_id AND chat.chat_id = {chat_id};
-
-	DELETE FROM chat WHERE chat_id = {chat_id};
-END $$;""").format(chat_id=chat_id)
-
-    conn.execute(query)
-    conn.commit()
-
-
-def auction_game(
-    conn: Connection, chat_id: int, user_id: int, bid_time_sec: int
-) -> None:
-    query: sql.Composed = sql.SQL(
-        """
-UPDATE game 
-SET 
-    status = 'auction', 
-    biggest_bid = 40, 
-    bid_time_sec = {bid_time_sec}, 
-    bidder_id = {user_id}
-WHERE chat_id = {chat_id};
-"""
-    ).format(bid_time_sec=bid_time_sec, user_id=user_id, chat_id=chat_id)
-
-    conn.execute(query)
-    conn.commit()
-
-
-def bid_game(
-    conn: Connection, chat_id: int, user_id: int, bid_time_sec: int, price: int
-) -> None:
-    query: sql.Composed = sql.SQL(
-        """
-    UPDATE game
-    SET
-        biggest_bid = {price},
-        bid_time_sec = {bid_time_sec},
-        bidder_id = {user_id}
-    WHERE chat_id = {chat_id};
-"""
-    ).format(price=price, bid_time_sec=bid_time_sec, user_id=user_id, chat_id=chat_id)
-
-    conn.execute(query)
-    conn.commit()
-
-
-def rent_chat(
-    conn: Connection,
+    rng_state: int,
+    version: int,
+) -> Optional[int]:
+    """None if the game changed since `version`, the same for every move below"""
+    params: dict[str, Any] = {
+        "position": position,
+        "money": money,
+        "is_jailed": is_jailed,
+        "streak": streak,
+        "user_id": user_id,
+        "chat_id": chat_id,
+        "status": "buy" if status else "roll",
+        "rng_state": rng_state,
+        "version": version,
+    }
+    return await write_versioned(conn, ROLL_USER_SQL, params)
+
+
+async def buy_user(
+    conn: AsyncConnection,
+    chat_id: int,
+    user_id: int,
+    money: int,
+    tile_id: int,
+    version: int,
+) -> Optional[int]:
+    params: dict[str, Any] = {
+        "money": money,
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "tile_id": tile_id,
+        "version": version,
+    }
+    return await write_versioned(conn, BUY_USER_SQL, params)
+
+
+async def settle_auction(
+    conn: AsyncConnection,
+    chat_id: int,
+    user_id: int,
+    money: int,
+    tile_id: int,
+    version: int,
+) -> Optional[int]:
+    """None if the auction was settled or outbid since `version`"""
+    params: dict[str, Any] = {
+        "money": money,
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "tile_id": tile_id,
+        "version": version,
+    }
+    return await write_versioned(conn, SETTLE_AUCTION_SQL, params)
+
+
+async def expired_auctions(
+    conn: AsyncConnection, before_sec: int, limit: int
+) -> list[int]:
+    """Chats with an auction whose last bid was before `before_sec`"""
+    params: dict[str, Any] = {"before_sec": before_sec, "limit": limit}
+    rows: list[dict] = await (
+        await conn.execute(EXPIRED_AUCTIONS_SQL, params)
+    ).fetchall()
+    return [row["chat_id"] for row in rows]
+
+
+async def fetch_board_image(conn: AsyncConnection, board_key: str) -> Optional[str]:
+    """file_id of a board uploaded before, see board.Board.key"""
+    row: Optional[dict] = await (
+        await conn.execute(BOARD_IMAGE_SQL, (board_key,))
+    ).fetchone()
+    return row["file_id"] if row is not None else None
+
+
+async def save_board_image(conn: AsyncConnection, board_key: str, file_id: str) -> None:
+    params: dict[str, Any] = {"board_key": board_key, "file_id": file_id}
+    await conn.execute(SAVE_BOARD_IMAGE_SQL, params)
+    await conn.commit()
+
+
+async def finish_game(conn: AsyncConnection, chat_id: int) -> None:
+    await conn.execute(FINISH_GAME_SQL, {"chat_id": chat_id})
+    await conn.commit()
+
+
+async def auction_game(
+    conn: AsyncConnection, chat_id: int, user_id: int, bid_time_sec: int, version: int
+) -> Optional[int]:
+    params: dict[str, Any] = {
+        "bid_time_sec": bid_time_sec,
+        "user_id": user_id,
+        "chat_id": chat_id,
+        "version": version,
+    }
+    return await write_versioned(conn, AUCTION_GAME_SQL, params)
+
+
+async def bid_game(
+    conn: AsyncConnection,
+    chat_id: int,
+    user_id: int,
+    bid_time_sec: int,
+    price: int,
+    version: int,
+) -> Optional[int]:
+    params: dict[str, Any] = {
+        "price": price,
+        "bid_time_sec": bid_time_sec,
+        "user_id": user_id,
+        "chat_id": chat_id,
+        "version": version,
+    }
+    return await write_versioned(conn, BID_GAME_SQL, params)
+
+
+async def rent_chat(
+    conn: AsyncConnection,
     chat_id: int,
     caller_id: int,
     caller_money: int,
     rentee_id: int,
     rentee_money: int,
-) -> None:
-    query: sql.Composed = sql.SQL(
-        """DO $$
-    BEGIN
-        UPDATE chat
-        SET money = {caller_money}
-        WHERE chat_id = {chat_id} AND user_id = {caller_id};
-
-        UPDATE chat
-        SET money = {rentee_money}
-        WHERE chat_id = {chat_id} AND user_id = {rentee_id};
-    END $$;"""
-    ).format(
-        caller_money=caller_money,
-        chat_id=chat_id,
-        caller_id=caller_id,
-        rentee_money=rentee_money,
-        rentee_id=rentee_id,
-    )
-
-    conn.execute(query)
-    conn.commit()
-
-
-def build_player(
-    conn: Connection,
+    rng_state: int,
+    version: int,
+) -> Optional[int]:
+    params: dict[str, Any] = {
+        "caller_money": caller_money,
+        "chat_id": chat_id,
+        "caller_id": caller_id,
+        "rentee_money": rentee_money,
+        "rentee_id": rentee_id,
+        "rng_state": rng_state,
+        "version": version,
+    }
+    return await write_versioned(conn, RENT_CHAT_SQL, params)
+
+
+async def build_player(
+    conn: AsyncConnection,
     chat_id: int,
     user_id: int,
     money: int,
     tile_id: int,
-) -> None:
-    query: sql.Composed = sql.SQL(
-        """DO $$
-DECLARE
-    player_0 integer;
-    ownership_0 integer;
-BEGIN
-    player_0 := (
-        SELECT player_id FROM chat WHERE chat_id = {chat_id} AND user_id = {user_id}
-    );
-    ownership_0 := (
-        SELECT id FROM player WHERE player_id = player_0 AND tile_id = {tile_id}
-    );
-    
-    UPDATE chat 
-    SET money = {money}
-    WHERE player_id = player_0;
-
-    UPDATE player
-    SET house_count = house_count + 1
-    WHERE id = ownership_0;
-END $$;"""
-    ).format(chat_id=chat_id, user_id=user_id, tile_id=tile_id, money=money)
-
-    conn.execute(query)
-    conn.commit()
+    version: int,
+) -> Optional[int]:
+    params: dict[str, Any] = {
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "tile_id": tile_id,
+        "money": money,
+        "version": version,
+    }
+    return await write_versioned(conn, BUILD_PLAYER_SQL, params)
@@ -2,7 +2,10 @@ from typing import Optional, Any
 import json
 import warnings
 
-from lib import App
+import routes
+
+# lib loads telegram, psycopg and the engine, so it's imported by the first
+# invocation with something to do, an invocation of only chatter never does
 
 
 def parse_body(message: dict) -> Optional[dict]:
@@ -26,14 +29,32 @@ def get_body(event: Optional[dict]) -> Optional[list[dict]]:
 
 async def handler(event: Optional[dict], context: Any) -> dict:
     bodies: Optional[list[dict]] = get_body(event)
-    if bodies is not None:
+    if bodies is None:
+        warnings.warn(f"Body is empty {bodies}")
+    elif any(map(routes.is_wanted, bodies)):
+        from lib import App, PERSISTENT_RUNTIME
+
         app: App = App()
         await app.start(context)
-        for body in bodies:
-            await app.handle_update(body)
+        await app.handle_batch(bodies)
+        if not PERSISTENT_RUNTIME:
+            # Otherwise the app stays warm until the container is torn down
+            await app.stop()
+    return {
+        "statusCode": 200,
+        "body": "",
+    }
+
+
+async def sweep_handler(_event: Optional[dict], context: Any) -> dict:
+    """Entry point for a timer trigger, settles auctions nobody outbid in time"""
+    from lib import App, PERSISTENT_RUNTIME
+
+    app: App = App()
+    await app.start(context)
+    await app.sweep_auctions()
+    if not PERSISTENT_RUNTIME:
         await app.stop()
-    else:
-        warnings.warn(f"Body is empty {bodies}")
     return {
         "statusCode": 200,
         "body": "",
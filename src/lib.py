@@ -1,84 +1,107 @@
 import os
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
-from telegram.ext import (
-    Application,
-    ApplicationBuilder,
-    CallbackQueryHandler,
-    CommandHandler,
-    MessageHandler,
-    filters,
-    ContextTypes,
+import time
+import signal
+import asyncio
+from telegram import (
+    Update,
+    Chat,
+    Message,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
 )
+from telegram.ext import Application, ApplicationBuilder, ContextTypes
 import warnings
 from dataclasses import dataclass
-from psycopg import Connection
+from functools import partial
+from contextvars import ContextVar
+from psycopg import AsyncConnection
+from psycopg.pq import TransactionStatus
+from psycopg_pool import AsyncConnectionPool
+from types import ModuleType
 from typing import Optional, Any
-from collections.abc import Sequence
+from collections.abc import Awaitable, Callable, Sequence
 
 import db
-from monopoly import Game
-
+import compact
+import render
+import outbox
+import board
+import routes
+import metrics
+from compact import StaleGameError
+from cache import CacheEntry, GameCache
+from monopoly import AUCTION_SEC, Game, PoorResult
+
+
+# Keep the Application and the database connection alive between invocations
+# of a warm container instead of tearing them down after every batch
+PERSISTENT_RUNTIME: bool = os.environ.get("PERSISTENT_RUNTIME", "1") != "0"
+# Ping the database before reuse if it has been idle for longer than this
+DB_HEALTH_CHECK_SEC: float = float(os.environ.get("DB_HEALTH_CHECK_SEC", "30"))
+# Chats of a batch processed at the same time
+DISPATCH_CONCURRENCY: int = int(os.environ.get("DISPATCH_CONCURRENCY", "8"))
+# Connections kept open and the most that can be opened under load
+DB_POOL_MIN_SIZE: int = int(os.environ.get("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE: int = int(
+    os.environ.get("DB_POOL_MAX_SIZE", str(DISPATCH_CONCURRENCY))
+)
+# How long an update waits for a free connection before failing
+DB_POOL_TIMEOUT_SEC: float = float(os.environ.get("DB_POOL_TIMEOUT_SEC", "30"))
+# Connections above the minimum are closed after being idle for this long
+DB_POOL_MAX_IDLE_SEC: float = float(os.environ.get("DB_POOL_MAX_IDLE_SEC", "600"))
+# Chats kept in memory and how long before a cached game has to be reloaded
+GAME_CACHE_SIZE: int = int(os.environ.get("GAME_CACHE_SIZE", "1024"))
+GAME_CACHE_TTL_SEC: float = float(os.environ.get("GAME_CACHE_TTL_SEC", "600"))
+# "relational" keeps games in chat, game, player and meta
+# "compact" keeps each game in one row of game_state
+GAME_STORE: str = os.environ.get("GAME_STORE", "relational")
+if GAME_STORE not in ("relational", "compact"):
+    raise ValueError(f"Unknown GAME_STORE {GAME_STORE}")
+COMPACT_STORE: bool = GAME_STORE == "compact"
+# Seed every new game from this and its chat_id for reproducible load tests
+# Unset, games roll random dice
+GAME_SEED: Optional[int] = (
+    int(os.environ["GAME_SEED"]) if "GAME_SEED" in os.environ else None
+)
+# Directory of <language>.json files with reply templates per event kind
+# Unset or missing a language, replies are in English
+LOCALES_DIR: Optional[str] = os.environ.get("LOCALES_DIR")
+LOCALES: dict[str, render.Templates] = render.load_locales(LOCALES_DIR)
+# Seconds between sweeps for auctions nobody outbid in time while the loop runs
+# 0 leaves them to sweep_handler on a timer and to the next move in the chat
+AUCTION_SWEEP_SEC: float = float(os.environ.get("AUCTION_SWEEP_SEC", "0"))
+# Auctions settled by one sweep at most, the rest wait for the next one
+AUCTION_SWEEP_BATCH: int = int(os.environ.get("AUCTION_SWEEP_BATCH", "100"))
+# Replies per chat, Telegram allows about 20 a minute in a group, a few at once
+REPLY_CHAT_PER_MIN: float = float(os.environ.get("REPLY_CHAT_PER_MIN", "20"))
+REPLY_CHAT_BURST: float = float(os.environ.get("REPLY_CHAT_BURST", "5"))
+# Replies over all chats, about 30 a second before Telegram answers with 429
+REPLY_GLOBAL_PER_SEC: float = float(os.environ.get("REPLY_GLOBAL_PER_SEC", "30"))
+# How long a batch waits for its replies, past it a warm runtime sends them
+# later and a cold one drops them, a chat told to retry later can wait minutes
+REPLY_DRAIN_SEC: float = float(os.environ.get("REPLY_DRAIN_SEC", "10"))
+# file_ids of board images kept in memory, the rest are looked up in board_image
+BOARD_CACHE_SIZE: int = int(os.environ.get("BOARD_CACHE_SIZE", "4096"))
+# A JSON line per update on stdout with the time spent per phase, 0 turns it off
+TRACE_UPDATES: bool = os.environ.get("TRACE_UPDATES", "1") != "0"
+# Bot API server, a self-hosted one or the stand-in of bench/updates.py
+BOT_API_URL: str = os.environ.get("BOT_API_URL", "https://api.telegram.org/bot")
+# Reads and lobby writes, both stores have them with the same signatures
+STORE: ModuleType = compact if COMPACT_STORE else db
+
+# Every reply goes through it, see reply
+OUTBOX: outbox.Outbox = outbox.Outbox(
+    REPLY_CHAT_PER_MIN / 60, REPLY_CHAT_BURST, REPLY_GLOBAL_PER_SEC
+)
 
 INLINE_BUTTONS: dict[int, InlineKeyboardButton] = {
-    1: InlineKeyboardButton("start", callback_data="1"),
-    2: InlineKeyboardButton("begin", callback_data="2"),
-    3: InlineKeyboardButton("help", callback_data="3"),
-    4: InlineKeyboardButton("roll", callback_data="4"),
-    5: InlineKeyboardButton("buy", callback_data="5"),
-    6: InlineKeyboardButton("auction", callback_data="6"),
-    7: InlineKeyboardButton("bid", callback_data="7"),
-    8: InlineKeyboardButton("rent", callback_data="8"),
-    9: InlineKeyboardButton("trade", callback_data="9"),
-    10: InlineKeyboardButton("finish", callback_data="10"),
-    11: InlineKeyboardButton("status", callback_data="11"),
-    12: InlineKeyboardButton("map", callback_data="12"),
-    13: InlineKeyboardButton("build", callback_data="13"),
+    int(data): InlineKeyboardButton(command, callback_data=data)
+    for data, command in routes.BUTTONS.items()
 }
 
-MAPS: dict[int, str] = {
-    0: "AgACAgIAAxkDAAICG2ZXcesdj44gCRfnxb_d7sUuAAFoDwACv90xGylbwEophxkgm9EeMAEAAwIAA3MAAzUE",
-    1: "AgACAgIAAxkDAAICHmZXcgfj1edBLLL00Jx_3-0yqUG7AALB3TEbKVvASvhU1aoZ5jKsAQADAgADcwADNQQ",
-    2: "AgACAgIAAxkDAAICIWZXchaZ2cmguZQWYbBtP4NqHGsPAALC3TEbKVvASsvO1Cu11hzXAQADAgADcwADNQQ",
-    3: "AgACAgIAAxkDAAICJGZXckYL4jwtTs09GR0mbXYT7fN8AALE3TEbKVvASptMp8CqQ-lGAQADAgADcwADNQQ",
-    4: "AgACAgIAAxkDAAICJ2ZXclNYWC6YW0xkQ__fXQjXE_M0AALF3TEbKVvASveR9VyqVqN1AQADAgADcwADNQQ",
-    5: "AgACAgIAAxkDAAICKmZXcmdawWmvEZ9Z9KAC-6DsCMv4AALH3TEbKVvAShPgBmza1fnWAQADAgADcwADNQQ",
-    6: "AgACAgIAAxkDAAICLWZXcne7eIKvOdv_3VBcwiH89VhDAALI3TEbKVvASoTOI4NJcd73AQADAgADcwADNQQ",
-    7: "AgACAgIAAxkDAAICMGZXc5sLNbKG0oN6z1prTtwstwcXAALY3TEbKVvASm5j6G85bmSqAQADAgADcwADNQQ",
-    8: "AgACAgIAAxkDAAICMWZXc7BOr6zfPf35PfDhbP1bxn46AALZ3TEbKVvASpW3nBDMXGB4AQADAgADcwADNQQ",
-    9: "AgACAgIAAxkDAAICMmZXc72P7eBCkLert8gr371gG_DgAALb3TEbKVvASjQTqr7WEmRKAQADAgADcwADNQQ",
-    10: "AgACAgIAAxkDAAICM2ZXc8Xkf_FoKAcAAdoMQzjn1nLB1AAC3N0xGylbwEo2ZJgh70Ky8AEAAwIAA3MAAzUE",
-    11: "AgACAgIAAxkDAAICNGZXc83BsNjjXbOqtECOnv2erQABJQAC3d0xGylbwEpBIAq0dVkQlAEAAwIAA3MAAzUE",
-    12: "AgACAgIAAxkDAAICNWZXc9Uj-rLSM3xy7Ta7MWXUk0kYAALe3TEbKVvASqwO3xFLCZFhAQADAgADcwADNQQ",
-    13: "AgACAgIAAxkDAAICNmZXc9sISBjt0kebQNzhxPoefqatAALf3TEbKVvASszGmzfgT53-AQADAgADcwADNQQ",
-    14: "AgACAgIAAxkDAAICN2ZXc-Zf2raRKeeLv05GoH-91nIKAALg3TEbKVvASmjTap8o-7hsAQADAgADcwADNQQ",
-    15: "AgACAgIAAxkDAAICOGZXc-zHznV0tyagsL5GiT8fG9AYAALh3TEbKVvASrTlpx71132jAQADAgADcwADNQQ",
-    16: "AgACAgIAAxkDAAICOWZXc_Oy8mR-MhNjZyoaiO1eQVN3AALl3TEbKVvASusmce34MXwPAQADAgADcwADNQQ",
-    17: "AgACAgIAAxkDAAICOmZXc_p9S7birpdFQWCyLPaBEu4eAALm3TEbKVvASlguVN946MGvAQADAgADcwADNQQ",
-    18: "AgACAgIAAxkDAAICO2ZXdCb6J4IFKqP2xX976V9if7LtAALn3TEbKVvASt0Snt4jz0Z1AQADAgADcwADNQQ",
-    19: "AgACAgIAAxkDAAICPGZXdC5kJGgg7XPAaWf5eB8B5JOUAALo3TEbKVvASoRLwrJH-Zl2AQADAgADcwADNQQ",
-    20: "AgACAgIAAxkDAAICPWZXdDYfl0NygMQ68dv47bxagAx7AALp3TEbKVvASkL7gjsKB36xAQADAgADcwADNQQ",
-    21: "AgACAgIAAxkDAAICPmZXdECIS9WjiCHtBA_StT25AAHcxgAC6t0xGylbwErypvdjgO3YUgEAAwIAA3MAAzUE",
-    22: "AgACAgIAAxkDAAICP2ZXdEaerNihk_WnBvG3kdeIefnvAALr3TEbKVvASr6QaJ2m7AJ-AQADAgADcwADNQQ",
-    23: "AgACAgIAAxkDAAICQGZXdF-8WnVhMoMCnpihbK0wZK05AALs3TEbKVvASqPuK4Cs4-gxAQADAgADcwADNQQ",
-    24: "AgACAgIAAxkDAAICQWZXdGWpm4sLQ1HX_gt7VlaZgOasAALt3TEbKVvAShM9U8Og1LsjAQADAgADcwADNQQ",
-    25: "AgACAgIAAxkDAAICQmZXdIIb35IuoMYoYfGPksTLzE-tAALu3TEbKVvASpMrLCtVFYVJAQADAgADcwADNQQ",
-    26: "AgACAgIAAxkDAAICQ2ZXdIlG6BQ1bmUR-wP5nz5MBHXEAALv3TEbKVvASphDf9o_oILmAQADAgADcwADNQQ",
-    27: "AgACAgIAAxkDAAICRGZXdI9OfSz4hL6aCjWnjK5tagxJAALw3TEbKVvASkqkJcepy593AQADAgADcwADNQQ",
-    28: "AgACAgIAAxkDAAICRWZXdJbqgTb5tPEhH80HJDwv3rBxAALx3TEbKVvASr28PRTK2yY5AQADAgADcwADNQQ",
-    29: "AgACAgIAAxkDAAICRmZXdJ3qWzVahmGux5oN5FpyMncOAALy3TEbKVvASj7TKLbaGO28AQADAgADcwADNQQ",
-    30: "AgACAgIAAxkDAAICR2ZXdKN3jxY8BOeE4wZMCylgeBZ0AALz3TEbKVvASt3unGwtr8yvAQADAgADcwADNQQ",
-    31: "AgACAgIAAxkDAAICSGZXdKprmDM_0u1LDI8o1fZFH6u2AAL03TEbKVvAStjDnWoN-IOLAQADAgADcwADNQQ",
-    32: "AgACAgIAAxkDAAICSWZXdLC6ZsZxLCHhCOv1mNbt3JBJAAL13TEbKVvASuL0IXX-6r4FAQADAgADcwADNQQ",
-    33: "AgACAgIAAxkDAAICSmZXdLbrdQLJdc2Sf491haCHkRpqAAL23TEbKVvASh7TDlK9nHKsAQADAgADcwADNQQ",
-    34: "AgACAgIAAxkDAAICS2ZXdL2hVLhGnV4wvl9V9xBl1cTPAAL33TEbKVvASvcVrS0k0Hs3AQADAgADcwADNQQ",
-    35: "AgACAgIAAxkDAAICTGZXdMJb861hjbH6MqazCSaYAaBiAAL43TEbKVvASs8bzmTEZPK_AQADAgADcwADNQQ",
-    36: "AgACAgIAAxkDAAICTWZXdMpPzOntbwo0GpIU8iUYGVy6AAL53TEbKVvASpd5xP3o0S_aAQADAgADcwADNQQ",
-    37: "AgACAgIAAxkDAAICTmZXdNCxEDOmjyGoQT9xD4zqngPUAAL73TEbKVvASmavE_qsAAHaQQEAAwIAA3MAAzUE",
-    38: "AgACAgIAAxkDAAICT2ZXdNeARfoYVrvwukYXsiwH9Oz5AAL83TEbKVvASh_5DLgtidLvAQADAgADcwADNQQ",
-    39: "AgACAgIAAxkDAAICUGZXdOKYJ_wpmYDkbomjspMyqwrFAAL93TEbKVvASmxWZ3ThfYLyAQADAgADcwADNQQ",
-    100: "AgACAgIAAxkDAAIB-2ZXHRJ_cAE0faxq-S7J7fY0dSGGAAKX4TEbKVu4Sl1ARUom521wAQADAgADcwADNQQ",
-    101: "AgACAgIAAxkDAAICFmZXaxlh4-V6-WLoXPgQISre49Y8AAJo3TEbKVvASkZLh9El0_ujAQADAgADcwADNQQ",
-}
+# The command, its handler and the words after the command
+Handler = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]
+Route = tuple[str, Handler, list[str]]
 
 
 def match_button(command: int) -> InlineKeyboardButton:
@@ -90,15 +113,71 @@ def construct_keyboard(commands: Sequence[int]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup.from_column(result)
 
 
+def quoted(update: Update) -> Optional[int]:
+    """The message a reply quotes, in groups only like reply_text did"""
+    if update.message is None or update.message.chat.type == Chat.PRIVATE:
+        return None
+    return update.message.message_id
+
+
 async def reply(
-    update: Update, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None
+    update: Update,
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    priority: int = outbox.GAME,
 ) -> None:
-    if update.message:
-        await update.message.reply_text(text, reply_markup=reply_markup)
-    elif update.effective_chat:
-        await update.effective_chat.send_message(text, reply_markup=reply_markup)
-    else:
+    """Queues the reply, App.dispatch waits for it up to REPLY_DRAIN_SEC"""
+    if update.effective_chat is None:
         warnings.warn("No chat found for update")
+        return
+    message: outbox.Message = outbox.Message(
+        update.get_bot(),
+        update.effective_chat.id,
+        text=text,
+        reply_markup=reply_markup,
+        reply_to=quoted(update),
+        priority=priority,
+    )
+    OUTBOX.put(message)
+
+
+async def reply_photo(
+    update: Update,
+    photo: str | bytes,
+    on_sent: Optional[Callable[[Message], Awaitable[None]]] = None,
+    on_failed: Optional[Callable[[], None]] = None,
+) -> None:
+    message: outbox.Message = outbox.Message(
+        update.get_bot(),
+        update.effective_chat.id,
+        photo=photo,
+        priority=outbox.INFO,
+        on_sent=on_sent,
+        on_failed=on_failed,
+    )
+    OUTBOX.put(message)
+
+
+async def drain_replies(sends: list[asyncio.Future]) -> None:
+    """Waits for the replies of `sends` until REPLY_DRAIN_SEC
+
+    The rest stay queued for the runtime kept warm, otherwise they're dropped
+    """
+    left: int = await OUTBOX.drain(sends, REPLY_DRAIN_SEC)
+    if left == 0:
+        return
+    if PERSISTENT_RUNTIME:
+        warnings.warn(f"{left} replies not sent in time, left to the outbox")
+    else:
+        OUTBOX.drop(set(sends))
+
+
+def result_text(update: Update, result: PoorResult) -> str:
+    """Events of a move in the language of whoever made it"""
+    language_code: Optional[str] = (
+        update.effective_user.language_code if update.effective_user else None
+    )
+    return render.text(result, LOCALES.get(render.language(language_code)))
 
 
 async def help_(update: Update, _context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -121,17 +200,25 @@ In a game
 - /map to see the board and your position
 - /build <tile> to add a house to an owned street
 """
-    await reply(update, text, reply_markup=reply_markup)
-
-
-async def echo(update: Update, _context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.message and update.message.text:
-        await update.message.reply_text(update.message.text)
-
-
-# async def upload_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-#     message = await update.effective_chat.send_photo("../assets/tile-39.png")
-#     print(message.photo[0].file_id)
+    await reply(update, text, reply_markup=reply_markup, priority=outbox.INFO)
+
+
+# Command names of routes.COMMANDS -> the App method handling each
+HANDLERS: dict[str, str] = {
+    "start": "start_command",
+    "begin": "begin_command",
+    "help": "help_command",
+    "roll": "roll_command",
+    "buy": "buy_command",
+    "auction": "auction_command",
+    "bid": "bid_command",
+    "rent": "rent_command",
+    "trade": "trade_command",
+    "finish": "finish_command",
+    "status": "status_command",
+    "map": "map_command",
+    "build": "build_command",
+}
 
 
 def is_ready(ready: list[tuple[int, Optional[str]]], user_id: int) -> bool:
@@ -147,6 +234,23 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+# The connection checked out of the pool for the update being processed
+# Every task gets its own copy of the context so chats never share one
+DB_CONN: ContextVar[AsyncConnection] = ContextVar("DB_CONN")
+
+
+def chat_of(update: Update) -> Optional[int]:
+    return update.effective_chat.id if update.effective_chat is not None else None
+
+
+def update_request(update: Update) -> tuple[Optional[str], Optional[str]]:
+    """The same as routes.body_request for an Update already built"""
+    if update.callback_query is not None:
+        return None, update.callback_query.data
+    message: Optional[Message] = update.message or update.edited_message
+    return (message.text if message is not None else None), None
+
+
 @dataclass(init=False, slots=True)
 class App(metaclass=Singleton):
     app: Application
@@ -156,95 +260,365 @@ class App(metaclass=Singleton):
     # tuple is update.effective_user.id and update.effective_user.username
     ready: dict[int, list[tuple[int, Optional[str]]]]
     # update.effective_chat.id
-    games: dict[int, Game]
-    db_conn: Connection
+    games: GameCache
+    db_pool: AsyncConnectionPool
+    # Chats processed at the same time, each needs a connection of its own
+    concurrency: asyncio.Semaphore
+    # The loop the Application was initialized on
+    loop: Optional[asyncio.AbstractEventLoop]
+    # Settles expired auctions every AUCTION_SWEEP_SEC on that loop
+    sweeper: Optional[asyncio.Task]
+    # Board images sent so far, see board.BoardCache
+    boards: board.BoardCache
+    # Handlers by the command names of routes.COMMANDS, see HANDLERS
+    commands: dict[str, Handler]
+    help_command = staticmethod(help_)
 
     def __init__(self) -> None:
-        self.app: Application = (
-            ApplicationBuilder().token(os.environ["BOT_TOKEN"]).build()
-        )
+        self.app: Application = self.build_application()
+        self.commands: dict[str, Handler] = {
+            name: getattr(self, method) for name, method in HANDLERS.items()
+        }
 
-        self.app.add_handler(CommandHandler("start", self.start_command))
-        self.app.add_handler(CommandHandler("begin", self.begin_command))
-        self.app.add_handler(CommandHandler("help", help_))
-        self.app.add_handler(CommandHandler("roll", self.roll_command))
-        self.app.add_handler(CommandHandler("buy", self.buy_command))
-        self.app.add_handler(CommandHandler("auction", self.auction_command))
-        self.app.add_handler(CommandHandler("bid", self.bid_command))
-        self.app.add_handler(CommandHandler("rent", self.rent_command))
-        self.app.add_handler(CommandHandler("trade", self.trade_command))
-        self.app.add_handler(CommandHandler("finish", self.finish_command))
-        self.app.add_handler(CommandHandler("status", self.status_command))
-        self.app.add_handler(CommandHandler("map", self.map_command))
-        self.app.add_handler(CommandHandler("build", self.build_command))
-        self.app.add_handler(CallbackQueryHandler(self.query))
-        # The order matters
-        self.app.add_handler(MessageHandler(filters.TEXT, echo))
-
-        self.games: dict[int, Game] = dict()
+        self.games: GameCache = GameCache(GAME_CACHE_SIZE, GAME_CACHE_TTL_SEC)
+        self.boards: board.BoardCache = board.BoardCache(BOARD_CACHE_SIZE)
         self.ready: dict[int, list[tuple[int, Optional[str]]]] = dict()
 
         # A travesty that only is_initalized flag is holding back
-        self.db_conn: Connection = None  # type: ignore
+        self.db_pool: AsyncConnectionPool = None  # type: ignore
+        self.concurrency: asyncio.Semaphore = asyncio.Semaphore(DISPATCH_CONCURRENCY)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.sweeper: Optional[asyncio.Task] = None
 
         self.is_initialized: bool = False
 
+    @property
+    def db_conn(self) -> AsyncConnection:
+        return DB_CONN.get()
+
+    def build_application(self) -> Application:
+        # No handlers, updates are routed by App.route
+        return (
+            ApplicationBuilder()
+            .token(os.environ["BOT_TOKEN"])
+            .base_url(BOT_API_URL)
+            .build()
+        )
+
+    def route(self, text: Optional[str], data: Optional[str]) -> Optional[Route]:
+        """Handler of a command or a button, None for what the game ignores"""
+        command: Optional[tuple[str, list[str]]] = routes.command_of(
+            text, data, self.app.bot.username
+        )
+        if command is None:
+            return None
+        name, args = command
+        return name, self.commands[name], args
+
     async def start(self, context: Any) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        if self.is_initialized and self.loop is not loop:
+            # The runtime handed us a new event loop, the HTTP client of
+            # the old Application is bound to the old one and is unusable
+            warnings.warn("Event loop changed between invocations")
+            # So are the pool's connections and workers, let them be collected
+            self.db_pool = None  # type: ignore
+            self.sweeper = None
+            self.app = self.build_application()
+            self.is_initialized = False
+
         if self.is_initialized:
+            # Stale connections are replaced by the pool on checkout
             return
         await self.app.initialize()
         await self.app.start()
 
-        self.db_conn: Connection = db.connect_to_db(context)
+        self.db_pool: AsyncConnectionPool = await db.create_pool(
+            context,
+            DB_POOL_MIN_SIZE,
+            DB_POOL_MAX_SIZE,
+            DB_POOL_TIMEOUT_SEC,
+            DB_POOL_MAX_IDLE_SEC,
+            DB_HEALTH_CHECK_SEC,
+        )
+        self.concurrency = asyncio.Semaphore(DISPATCH_CONCURRENCY)
+        self.loop = loop
+
+        if PERSISTENT_RUNTIME:
+            self.register_teardown(loop)
+        if AUCTION_SWEEP_SEC > 0:
+            self.sweeper = loop.create_task(self.sweep_forever(AUCTION_SWEEP_SEC))
 
         self.is_initialized = True
 
+    def register_teardown(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.add_signal_handler(
+                signal.SIGTERM, lambda: loop.create_task(self.stop())
+            )
+        except (NotImplementedError, RuntimeError):
+            # Not supported on Windows or outside of the main thread
+            pass
+
+    async def close_db(self) -> None:
+        if self.db_pool is not None and not self.db_pool.closed:
+            await self.db_pool.close()
+
     async def stop(self) -> None:
         if not self.is_initialized:
             return
 
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+            self.sweeper = None
+
+        # Sent with the bot's client, closed by shutdown
+        await OUTBOX.close(REPLY_DRAIN_SEC)
         await self.app.stop()
         await self.app.shutdown()
 
-        self.db_conn.close()
+        await self.close_db()
 
         self.is_initialized = False
 
-    async def handle_update(self, body: dict) -> None:
+    async def handle_batch(self, bodies: list[dict]) -> None:
+        """Updates from the bodies of queue messages, see index.handler
+
+        Chatter and commands of other bots are dropped before an Update is built
+        """
         if not self.is_initialized:
             warnings.warn("Update without intialization")
             return
 
+        routed: list[tuple[Update, Route]] = []
+        for body in bodies:
+            route: Optional[Route] = self.route(*routes.body_request(body))
+            if route is not None:
+                routed.append((Update.de_json(body, bot=self.app.bot), route))
         try:
-            update: Update = Update.de_json(body, bot=self.app.bot)
-            await self.app.process_update(update)
+            await self.dispatch(routed)
         except BaseException as e:
-            self.db_conn.rollback()
-            await self.stop()
+            if not PERSISTENT_RUNTIME:
+                await self.stop()
             raise e
-        else:
-            pass
-            # self.db_conn.commit()
 
-    def db_sync(self, chat_id: int) -> None:
-        maybe_game: None | list[tuple[int, Optional[str]]] | Game = db.fetch_game(
-            self.db_conn, chat_id
+    async def handle_updates(self, updates: list[Update]) -> None:
+        """Updates the bot already built, see server.serve"""
+        if not self.is_initialized:
+            warnings.warn("Update without intialization")
+            return
+
+        routed: list[tuple[Update, Route]] = []
+        for update in updates:
+            route: Optional[Route] = self.route(*update_request(update))
+            if route is not None:
+                routed.append((update, route))
+        await self.dispatch(routed)
+
+    async def dispatch(self, routed: list[tuple[Update, Route]]) -> None:
+        """Process chats concurrently, updates of the same chat in order"""
+        chats: dict[Optional[int], list[tuple[Update, Route]]] = dict()
+        for update, route in routed:
+            chats.setdefault(chat_of(update), []).append((update, route))
+
+        sends: list[asyncio.Future] = []
+        token = outbox.SENDS.set(sends)
+        try:
+            results: list[Optional[BaseException]] = await asyncio.gather(
+                *map(self.handle_chat, chats.values()), return_exceptions=True
+            )
+        finally:
+            outbox.SENDS.reset(token)
+        # Replies of chats done early are already on their way
+        await drain_replies(sends)
+        errors: list[BaseException] = [e for e in results if e is not None]
+        if len(errors) > 0:
+            raise errors[0]
+
+    async def handle_chat(self, routed: list[tuple[Update, Route]]) -> None:
+        for update, route in routed:
+            # A failed move stops the rest of the chat's moves from reordering
+            await self.handle_update(update, route)
+
+    async def handle_update(self, update: Update, route: Route) -> None:
+        name, handler, args = route
+        if not TRACE_UPDATES:
+            await self.run_handler(update, handler, args)
+            return
+
+        trace: metrics.Trace = metrics.Trace(name, update.update_id)
+        token = metrics.TRACE.set(trace)
+        error: Optional[BaseException] = None
+        try:
+            await self.run_handler(update, handler, args)
+        except BaseException as e:
+            error = e
+            raise e
+        finally:
+            metrics.TRACE.reset(token)
+            # Written now or once the last of its replies is sent
+            trace.handled(error)
+
+    async def run_handler(
+        self, update: Update, handler: Handler, args: list[str]
+    ) -> None:
+        context_type: type = self.app.context_types.context
+        context: ContextTypes.DEFAULT_TYPE = context_type.from_update(update, self.app)
+        context.args = args
+        async with self.concurrency:
+            async with self.db_pool.connection() as conn:
+                trace: Optional[metrics.Trace] = metrics.TRACE.get()
+                if trace is not None:
+                    # Behind other chats for a slot and a connection
+                    trace.add("wait", time.perf_counter() - trace.started_at)
+                token = DB_CONN.set(conn)
+                try:
+                    await handler(update, context)
+                    if update.callback_query is not None:
+                        with metrics.span("answer"):
+                            await update.callback_query.answer()
+                except BaseException as e:
+                    chat_id: Optional[int] = chat_of(update)
+                    if chat_id is not None:
+                        # The cached game may hold changes never written to the db
+                        self.games.pop(chat_id, None)
+                    if not isinstance(e, StaleGameError):
+                        raise e
+                    # Another instance moved first, the next update reloads the game
+                    warnings.warn(str(e))
+                finally:
+                    if (
+                        not conn.broken
+                        and conn.info.transaction_status != TransactionStatus.IDLE
+                    ):
+                        # Reads leave a transaction open, writes commit on their own
+                        await conn.rollback()
+                    DB_CONN.reset(token)
+
+    async def sweep_forever(self, interval_sec: float) -> None:
+        while True:
+            await asyncio.sleep(interval_sec)
+            try:
+                await self.sweep_auctions()
+            except Exception as e:
+                # The next sweep or move in the chat settles what this one missed
+                warnings.warn(f"Auction sweep failed: {e}")
+
+    async def sweep_auctions(self) -> int:
+        """Settles auctions nobody outbid in time, returns how many
+
+        Each chat is read and written the same way a move would, so a chat
+        settled by another instance or by a move meanwhile is skipped
+        """
+        sends: list[asyncio.Future] = []
+        token = outbox.SENDS.set(sends)
+        try:
+            settled: int = await self.settle_expired()
+        finally:
+            outbox.SENDS.reset(token)
+        await drain_replies(sends)
+        return settled
+
+    async def settle_expired(self) -> int:
+        before_sec: int = int(time.time()) - AUCTION_SEC
+        settled: int = 0
+        async with self.db_pool.connection() as conn:
+            token = DB_CONN.set(conn)
+            try:
+                chat_ids: list[int] = await STORE.expired_auctions(
+                    conn, before_sec, AUCTION_SWEEP_BATCH
+                )
+                for chat_id in chat_ids:
+                    try:
+                        await self.load(chat_id, read_only=True)
+                        settled += await self.settle(chat_id)
+                    except StaleGameError as e:
+                        self.games.pop(chat_id, None)
+                        warnings.warn(str(e))
+            finally:
+                if (
+                    not conn.broken
+                    and conn.info.transaction_status != TransactionStatus.IDLE
+                ):
+                    await conn.rollback()
+                DB_CONN.reset(token)
+        return settled
+
+    async def settle(self, chat_id: int) -> bool:
+        """Closes the auction of the cached game if it's over and tells the chat
+
+        Raises StaleGameError if somebody else wrote the game first, settling
+        it and telling the chat themselves
+        """
+        entry: Optional[CacheEntry] = self.games.lookup(chat_id)
+        if entry is None:
+            return False
+
+        with metrics.span("engine"):
+            output, maybe_settled = entry.game.settle()
+        if maybe_settled is None:
+            return False
+        user_id, money, tile_id = maybe_settled
+        await self.persist(
+            chat_id, entry.game, db.settle_auction, user_id, money, tile_id
         )
+        # Nobody in particular made this move, so the reply is in English
+        OUTBOX.put(outbox.Message(self.app.bot, chat_id, render.text(output, None)))
+        return True
+
+    async def db_sync(self, chat_id: int, read_only: bool = False) -> None:
+        with metrics.span("db_sync"):
+            await self.load(chat_id, read_only)
+            if read_only:
+                return
+            try:
+                # A move can't wait for the sweep, an auction past its time closes
+                await self.settle(chat_id)
+            except StaleGameError:
+                # Settled elsewhere first, the move goes on the game as they left it
+                self.games.pop(chat_id, None)
+                await self.load(chat_id, read_only=False)
+
+    async def load(self, chat_id: int, read_only: bool) -> None:
+        """Brings the cached game of the chat up to date with the database"""
+        entry: Optional[CacheEntry] = self.games.lookup(chat_id)
+        if (
+            entry is not None
+            and read_only
+            and entry.is_own
+            and not entry.game.is_auction()
+        ):
+            # This instance wrote the last change, nothing to revalidate
+            # Auctions are revalidated, a sweep elsewhere may have settled them
+            return
+
+        if entry is not None:
+            version: Optional[int] = await STORE.fetch_version(self.db_conn, chat_id)
+            if entry.version == version:
+                self.games.revalidated(chat_id)
+                return
+
+        maybe_game: None | list[tuple[int, Optional[str]]] | Game
+        maybe_game, version = await STORE.fetch_state(self.db_conn, chat_id)
         if maybe_game is None:
             # Nothing to sync
+            self.games.pop(chat_id, None)
             return
         elif isinstance(maybe_game, list):
+            self.games.pop(chat_id, None)
             self.ready[chat_id] = maybe_game
             return
-        self.games[chat_id] = maybe_game
+        self.games.put(
+            chat_id, maybe_game, version if version is not None else -1, is_own=False
+        )
 
     async def start_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
         chat_id: int = update.effective_chat.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
 
-        if chat_id in self.games.keys():
+        if chat_id in self.games:
             await reply(update, "A game is already in progress")
             return
 
@@ -262,13 +636,47 @@ class App(metaclass=Singleton):
 
         keyboard = construct_keyboard((2,))
         await reply(update, "You have entered a game", reply_markup=keyboard)
-        db.add_user(self.db_conn, chat_id, user_id, username)
+        await STORE.add_user(self.db_conn, chat_id, user_id, username)
+
+    async def persist(
+        self,
+        chat_id: int,
+        game: Game,
+        write: Callable[..., Awaitable[Optional[int]]],
+        *args: Any,
+    ) -> Optional[int]:
+        """Writes a move and returns the new version
+
+        The relational store takes the change through `write`,
+        the compact store replaces the whole game. Either only writes if nobody
+        changed the game since the cached version, else raises StaleGameError
+        """
+        entry: Optional[CacheEntry] = self.games.lookup(chat_id)
+        # None for a new game, written whatever there was
+        read_at: Optional[int] = entry.version if entry is not None else None
+        with metrics.span("persist"):
+            if COMPACT_STORE:
+                version: Optional[int] = await compact.save_game(
+                    self.db_conn, chat_id, game, read_at
+                )
+            elif read_at is None:
+                version: Optional[int] = await write(self.db_conn, chat_id, *args)
+            else:
+                version: Optional[int] = await write(
+                    self.db_conn, chat_id, *args, version=read_at
+                )
+                if version is None:
+                    raise StaleGameError(
+                        f"Game of chat {chat_id} changed after version {read_at}"
+                    )
+        self.games.mark_written(chat_id, version)
+        return version
 
     async def begin_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
         chat_id: int = update.effective_chat.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
 
         # Check if there's already a game in progress
         # and that there are players ready to start
@@ -285,9 +693,19 @@ class App(metaclass=Singleton):
         keyboard = construct_keyboard((4,))
         await reply(update, "Beginning of the game", reply_markup=keyboard)
 
-        game: Game = Game(ready_players)
-        self.games[chat_id] = game
-        db.begin_game(self.db_conn, chat_id, tuple(map(lambda x: x[0], ready_players)))
+        seed: Optional[int] = (
+            (GAME_SEED ^ chat_id) % 2**64 if GAME_SEED is not None else None
+        )
+        game: Game = Game(ready_players, seed=seed)
+        version: Optional[int] = await self.persist(
+            chat_id,
+            game,
+            db.begin_game,
+            tuple(map(lambda x: x[0], ready_players)),
+            game.get_rng_state(),
+        )
+        assert version is not None
+        self.games.put(chat_id, game, version, is_own=True)
         del self.ready[chat_id]
 
     async def roll_command(
@@ -295,15 +713,14 @@ class App(metaclass=Singleton):
     ) -> None:
         chat_id: int = update.effective_chat.id
         user_id: int = update.effective_user.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
 
         game: Optional[Game] = self.games.get(chat_id, None)
         if game is None:
             return
 
-        output, maybe_change = game.roll(user_id)
-        if len(output.warning) > 0:
-            warnings.warn(output.warning)
+        with metrics.span("engine"):
+            output, maybe_change = game.roll(user_id)
         if maybe_change is None:
             # TODO change types to indicate this better
             # No change
@@ -312,10 +729,19 @@ class App(metaclass=Singleton):
 
         keyboard = construct_keyboard((5, 6, 12) if status else (4, 12))
 
-        await reply(update, output.out, reply_markup=keyboard)
-
-        db.roll_user(
-            self.db_conn, chat_id, user_id, position, money, is_jailed, streak, status
+        await reply(update, result_text(update, output), reply_markup=keyboard)
+
+        await self.persist(
+            chat_id,
+            game,
+            db.roll_user,
+            user_id,
+            position,
+            money,
+            is_jailed,
+            streak,
+            status,
+            game.get_rng_state(),
         )
 
     async def buy_command(
@@ -323,47 +749,46 @@ class App(metaclass=Singleton):
     ) -> None:
         chat_id: int = update.effective_chat.id
         user_id: int = update.effective_user.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
 
         game: Optional[Game] = self.games.get(chat_id, None)
         if game is None:
             return
 
-        output, maybe_purchase = game.buy(user_id)
-        if len(output.warning) > 0:
-            warnings.warn(output.warning)
+        with metrics.span("engine"):
+            output, maybe_purchase = game.buy(user_id)
 
-        if len(output.out) > 0 and maybe_purchase is None:
-            await reply(update, output.out)
-        elif len(output.out) > 0:
+        # Events are only rendered if there's a reply to send
+        if output and maybe_purchase is None:
+            await reply(update, result_text(update, output))
+        elif output:
             keyboard = construct_keyboard((4, 12))
-            await reply(update, output.out, reply_markup=keyboard)
+            await reply(update, result_text(update, output), reply_markup=keyboard)
 
         if maybe_purchase is None:
             return
         money, tile_id = maybe_purchase
-        db.buy_user(self.db_conn, chat_id, user_id, money, tile_id)
+        await self.persist(chat_id, game, db.buy_user, user_id, money, tile_id)
 
     async def auction_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
         chat_id: int = update.effective_chat.id
         user_id: int = update.effective_user.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
 
         game: Optional[Game] = self.games.get(chat_id, None)
         if game is None:
             return
 
-        output, maybe_bid = game.auction(user_id)
-        if len(output.out) > 0:
-            await reply(update, output.out)
-        if len(output.warning) > 0:
-            warnings.warn(output.warning)
+        with metrics.span("engine"):
+            output, maybe_bid = game.auction(user_id)
+        if output:
+            await reply(update, result_text(update, output))
         if maybe_bid is None:
             return
         bid_time_sec: int = maybe_bid
-        db.auction_game(self.db_conn, chat_id, user_id, bid_time_sec)
+        await self.persist(chat_id, game, db.auction_game, user_id, bid_time_sec)
 
     async def bid_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -379,43 +804,48 @@ class App(metaclass=Singleton):
 
         chat_id: int = update.effective_chat.id
         user_id: int = update.effective_user.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
 
         game: Optional[Game] = self.games.get(chat_id, None)
         if game is None:
             return
 
-        output, maybe_bid = game.bid(user_id, price)
-        if len(output.out) > 0:
-            await reply(update, output.out)
-        if len(output.warning) > 0:
-            warnings.warn(output.warning)
+        with metrics.span("engine"):
+            output, maybe_bid = game.bid(user_id, price)
+        if output:
+            await reply(update, result_text(update, output))
         if maybe_bid is None:
             return
         bid_time_sec: int = maybe_bid
-        db.bid_game(self.db_conn, chat_id, user_id, bid_time_sec, price)
+        await self.persist(chat_id, game, db.bid_game, user_id, bid_time_sec, price)
 
     async def rent_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
         chat_id: int = update.effective_chat.id
         user_id: int = update.effective_user.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
 
         game: Optional[Game] = self.games.get(chat_id, None)
         if game is None:
             return
 
-        output, maybe_rent = game.rent(user_id)
-        if len(output.out) > 0:
-            await reply(update, output.out)
-        if len(output.warning) > 0:
-            warnings.warn(output.warning)
+        with metrics.span("engine"):
+            output, maybe_rent = game.rent(user_id)
+        if output:
+            await reply(update, result_text(update, output))
         if maybe_rent is None:
             return
         caller_money, rentee_id, rentee_money = maybe_rent
-        db.rent_chat(
-            self.db_conn, chat_id, user_id, caller_money, rentee_id, rentee_money
+        await self.persist(
+            chat_id,
+            game,
+            db.rent_chat,
+            user_id,
+            caller_money,
+            rentee_id,
+            rentee_money,
+            game.get_rng_state(),
         )
 
     async def trade_command(
@@ -423,54 +853,80 @@ class App(metaclass=Singleton):
     ) -> None:
         chat_id: int = update.effective_chat.id
         _user_id: int = update.effective_user.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
         # TODO
 
     async def finish_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
         chat_id: int = update.effective_chat.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
 
         maybe_ready = self.ready.pop(chat_id, None)
         maybe_game = self.games.pop(chat_id, None)
 
         if maybe_game or maybe_ready:
             # Don't make request if there's nothing to delete
-            db.finish_game(self.db_conn, chat_id)
+            await STORE.finish_game(self.db_conn, chat_id)
         await reply(update, "Stopping")
 
     async def status_command(
         self, update: Update, _context: ContextTypes.DEFAULT_TYPE
     ) -> None:
         chat_id: int = update.effective_chat.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id, read_only=True)
 
         game: Optional[Game] = self.games.get(chat_id, None)
         if game is None:
-            await reply(update, "No game in progess")
+            await reply(update, "No game in progess", priority=outbox.INFO)
             return
 
         user_id: int = update.effective_user.id
-        await reply(update, game.get_status(user_id))
+        with metrics.span("engine"):
+            status: str = game.get_status(user_id)
+        await reply(update, status, priority=outbox.INFO)
 
     async def map_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
-        # await upload_photo(update, context)
         chat_id: int = update.effective_chat.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id, read_only=True)
 
+        # Without a game the board is empty
         game: Optional[Game] = self.games.get(chat_id, None)
+        shown: board.Board = board.board_of(game, update.effective_user.id)
+        key: str = shown.key()
+        photo: Optional[str | bytes] = self.boards.get(key)
+        if photo is None:
+            photo = await db.fetch_board_image(self.db_conn, key)
+        if isinstance(photo, str):
+            self.boards.put(key, photo)
+        if photo is not None:
+            await reply_photo(update, photo)
+            return
 
-        if game is None:
-            # Send empty map
-            await update.effective_chat.send_photo(MAPS[101])
+        # Drawing takes long enough to hold up every other chat on the loop
+        with metrics.span("draw"):
+            png: bytes = await asyncio.to_thread(board.draw, shown)
+        self.boards.upload(key, png)
+        await reply_photo(
+            update, png, partial(self.save_board, key), partial(self.boards.failed, key)
+        )
+
+    async def save_board(self, key: str, sent: Message) -> None:
+        """Keeps the file_id of a board image once Telegram has it"""
+        if len(sent.photo) == 0:
+            self.boards.failed(key)
             return
-        # Send map with position of the caller
-        user_id: int = update.effective_user.id
-        position: int = game.get_position(user_id)
-        await update.effective_chat.send_photo(MAPS[position])
+        # Sizes go from the smallest to the original
+        file_id: str = sent.photo[-1].file_id
+        self.boards.put(key, file_id)
+        try:
+            async with self.db_pool.connection() as conn:
+                await db.save_board_image(conn, key, file_id)
+        except Exception as e:
+            # Drawn and uploaded again by the next instance that needs it
+            warnings.warn(f"Board image {key} not saved: {e}")
 
     async def build_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -485,53 +941,18 @@ class App(metaclass=Singleton):
             return
 
         chat_id: int = update.effective_chat.id
-        self.db_sync(chat_id)
+        await self.db_sync(chat_id)
 
         game: Optional[Game] = self.games.get(chat_id, None)
         if game is None:
             return
 
         user_id: int = update.effective_user.id
-        output, maybe_money = game.build(user_id, tile_id)
-        if len(output.out) > 0:
-            await reply(update, output.out)
-        if len(output.warning) > 0:
-            warnings.warn(output.warning)
+        with metrics.span("engine"):
+            output, maybe_money = game.build(user_id, tile_id)
+        if output:
+            await reply(update, result_text(update, output))
         if maybe_money is None:
             return
         money: int = maybe_money
-        db.build_player(self.db_conn, chat_id, user_id, money, tile_id)
-
-    async def query(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        query: CallbackQuery = update.callback_query
-
-        command: str = query.data
-        if command == "1":
-            await self.start_command(update, context)
-        elif command == "2":
-            await self.begin_command(update, context)
-        elif command == "3":
-            await help_(update, context)
-        elif command == "4":
-            await self.roll_command(update, context)
-        elif command == "5":
-            await self.buy_command(update, context)
-        elif command == "6":
-            await self.auction_command(update, context)
-        elif command == "7":
-            await self.bid_command(update, context)
-        elif command == "8":
-            await self.rent_command(update, context)
-        elif command == "9":
-            await self.trade_command(update, context)
-        elif command == "10":
-            await self.finish_command(update, context)
-        elif command == "11":
-            await self.status_command(update, context)
-        elif command == "12":
-            await self.map_command(update, context)
-        elif command == "13":
-            await self.build_command(update, context)
-        # else should be unreachable
-
-        await query.answer()
+        await self.persist(chat_id, game, db.build_player, user_id, money, tile_id)
@@ -0,0 +1,102 @@
+import sys
+import json
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+
+@dataclass(slots=True)
+class Trace:
+    """Where the time of one update went, a JSON line on stdout once it's done
+
+    Done means handled and every reply it queued sent or dropped
+    """
+
+    command: str
+    update_id: int
+    # time.perf_counter() when the update was taken up
+    started_at: float = field(default_factory=time.perf_counter)
+    # Seconds and calls per phase, phases nest, db_sync includes db and decode
+    seconds: dict[str, float] = field(default_factory=dict)
+    calls: dict[str, int] = field(default_factory=dict)
+    # Sizes of what was sent and stored, reply and state
+    sizes: dict[str, int] = field(default_factory=dict)
+    # Replies queued and not sent yet
+    pending: int = 0
+    handled_sec: Optional[float] = None
+    error: Optional[str] = None
+
+    def add(self, phase: str, sec: float) -> None:
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + sec
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def add_bytes(self, kind: str, size: int) -> None:
+        self.sizes[kind] = self.sizes.get(kind, 0) + size
+
+    def handled(self, error: Optional[BaseException]) -> None:
+        self.handled_sec = time.perf_counter() - self.started_at
+        if error is not None:
+            self.error = type(error).__name__
+        if self.pending == 0:
+            self.write()
+
+    def queued(self) -> None:
+        self.pending += 1
+
+    def sent(self, sec: float, size: int) -> None:
+        self.add("reply", sec)
+        self.add_bytes("reply", size)
+        self.pending -= 1
+        if self.pending == 0 and self.handled_sec is not None:
+            self.write()
+
+    def write(self) -> None:
+        line: dict[str, Any] = {
+            "command": self.command,
+            "update_id": self.update_id,
+            "ms": round((time.perf_counter() - self.started_at) * 1000, 3),
+            "handled_ms": round((self.handled_sec or 0.0) * 1000, 3),
+            "phases_ms": {
+                phase: round(sec * 1000, 3) for phase, sec in self.seconds.items()
+            },
+            "calls": self.calls,
+            "bytes": self.sizes,
+            "error": self.error,
+        }
+        sys.stdout.write(json.dumps(line, separators=(",", ":")) + "\n")
+
+
+# The update being processed, every chat's task has its own
+TRACE: ContextVar[Optional[Trace]] = ContextVar("TRACE", default=None)
+
+
+class Span:
+    """Adds the time spent inside `with` to a phase of the traced update"""
+
+    __slots__ = ("phase", "trace", "started_at")
+
+    def __init__(self, phase: str, trace: Optional[Trace]) -> None:
+        self.phase: str = phase
+        self.trace: Optional[Trace] = trace
+        self.started_at: float = 0.0
+
+    def __enter__(self) -> "Span":
+        if self.trace is not None:
+            self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        if self.trace is not None:
+            self.trace.add(self.phase, time.perf_counter() - self.started_at)
+
+
+def span(phase: str) -> Span:
+    """Does nothing outside of a traced update"""
+    return Span(phase, TRACE.get())
+
+
+def add_bytes(kind: str, size: int) -> None:
+    trace: Optional[Trace] = TRACE.get()
+    if trace is not None:
+        trace.add_bytes(kind, size)
@@ -0,0 +1,80 @@
+import re
+import sys
+from pathlib import Path
+
+import psycopg
+from psycopg import Connection
+
+
+MIGRATIONS: Path = (
+    Path(__file__).resolve(strict=True).parent.parent.joinpath("migrations")
+)
+# Not numbered, only applied on request
+TO_COMPACT: Path = MIGRATIONS.joinpath("relational_to_compact.sql")
+MIGRATION_NAME: re.Pattern = re.compile(r"^(\d+)_\w+\.sql$")
+
+
+def list_migrations(directory: Path = MIGRATIONS) -> list[tuple[int, Path]]:
+    migrations: list[tuple[int, Path]] = []
+    for path in directory.iterdir():
+        match = MIGRATION_NAME.match(path.name)
+        if match is not None:
+            migrations.append((int(match.group(1)), path))
+    migrations.sort()
+
+    versions: list[int] = [version for version, _path in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def migrate(conn: Connection, directory: Path = MIGRATIONS) -> list[int]:
+    """Applies migrations not applied yet, all or nothing
+
+    Returns the versions that were applied
+    """
+    applied: list[int] = []
+    with conn.transaction():
+        # Two deploys at once would otherwise both apply the same files
+        conn.execute("SELECT pg_advisory_xact_lock(hashtext('schema_migration'));")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS schema_migration
+(
+    version integer NOT NULL,
+    name text NOT NULL,
+    applied_at timestamp with time zone NOT NULL DEFAULT now(),
+    PRIMARY KEY (version)
+);"""
+        )
+        done: set[int] = {
+            row[0] for row in conn.execute("SELECT version FROM schema_migration;")
+        }
+        for version, path in list_migrations(directory):
+            if version in done:
+                continue
+            # Without parameters every statement of the file is sent at once
+            conn.execute(path.read_text())
+            conn.execute(
+                "INSERT INTO schema_migration (version, name) VALUES (%s, %s);",
+                (version, path.name),
+            )
+            applied.append(version)
+    return applied
+
+
+def copy_to_compact(conn: Connection) -> int:
+    """Copies every chat from the relational tables into game_state
+
+    Returns the number of chats copied
+    """
+    with conn.transaction():
+        return conn.execute(TO_COMPACT.read_text()).rowcount
+
+
+if __name__ == "__main__":
+    from secret import load_local
+
+    with psycopg.connect(**load_local()) as connection:
+        print(f"Applied migrations {migrate(connection)}")
+        if "--to-compact" in sys.argv[1:]:
+            print(f"Copied {copy_to_compact(connection)} chats to game_state")
@@ -0,0 +1,330 @@
+import time
+import asyncio
+import warnings
+from contextvars import Context, ContextVar
+from collections import deque
+from dataclasses import dataclass, field
+from telegram import Bot, InlineKeyboardMarkup, ReplyParameters
+from telegram import Message as Sent
+from telegram.error import RetryAfter, TelegramError
+from typing import Optional
+from collections.abc import Awaitable, Callable, Collection
+
+import metrics
+
+
+# Lower is sent first when chats compete for the global limit
+GAME: int = 0
+INFO: int = 1
+
+# The most Telegram takes in one message, texts stop merging short of it
+MAX_TEXT_LEN: int = 4096
+
+# Collects a future per message put, done once the message is sent or dropped,
+# so whoever put them can wait for their own messages only, see Outbox.drain
+SENDS: ContextVar[Optional[list[asyncio.Future]]] = ContextVar("SENDS", default=None)
+
+
+class TokenBucket:
+    """`rate` sends per second on average, `capacity` at once after a pause"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.updated_at: float = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a send is allowed, 0 if it is now"""
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self, now: float) -> None:
+        self.refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass(slots=True)
+class Message:
+    bot: Bot
+    chat_id: int
+    text: Optional[str] = None
+    # file_id or PNG of a photo, sent instead of text
+    photo: Optional[str | bytes] = None
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+    # Message quoted by the reply, kept for group chats like reply_text does
+    reply_to: Optional[int] = None
+    priority: int = GAME
+    # time.monotonic() when it was put, older chats go first at equal priority
+    queued_at: float = 0.0
+    # Called with what Telegram made of the message, photos get their file_id
+    on_sent: Optional[Callable[[Sent], Awaitable[None]]] = None
+    # Called when the message is dropped instead
+    on_failed: Optional[Callable[[], None]] = None
+    # Updates that wait for it to be sent before their trace is written
+    traces: list[metrics.Trace] = field(default_factory=list)
+    # Of SENDS, for the callers waiting for it
+    done: list[asyncio.Future] = field(default_factory=list)
+
+    def can_merge(self, other: "Message") -> bool:
+        return (
+            self.photo is None
+            and other.photo is None
+            and self.text is not None
+            and other.text is not None
+            and self.on_sent is None
+            and other.on_sent is None
+            and self.on_failed is None
+            and other.on_failed is None
+            and len(self.text) + 2 + len(other.text) <= MAX_TEXT_LEN
+        )
+
+    def merge(self, other: "Message") -> None:
+        """Appends other, its keyboard is the more recent one"""
+        assert self.text is not None and other.text is not None
+        self.text = f"{self.text}\n\n{other.text}"
+        if other.reply_markup is not None:
+            self.reply_markup = other.reply_markup
+        self.priority = min(self.priority, other.priority)
+        self.traces.extend(other.traces)
+        self.done.extend(other.done)
+
+    def size(self) -> int:
+        if isinstance(self.photo, bytes):
+            return len(self.photo)
+        return len((self.photo or self.text or "").encode())
+
+    def finish(self, sec: float, size: int) -> None:
+        """Sent or dropped, either way whoever waits for it is done"""
+        for trace in self.traces:
+            trace.sent(sec, size)
+        for done in self.done:
+            if not done.done():
+                done.set_result(None)
+
+
+@dataclass(slots=True)
+class ChatQueue:
+    bucket: TokenBucket
+    messages: deque[Message] = field(default_factory=deque)
+    # time.monotonic() before which Telegram asked not to send to the chat
+    retry_at: float = 0.0
+    is_sending: bool = False
+
+
+class Outbox:
+    """Sends replies within the per-chat and global limits of Telegram
+
+    Messages of a chat go in order, one at a time, pending texts are merged
+    into one message. A chat told to retry later waits alone. Nothing is
+    sent unless a loop runs the dispatcher, which goes on after drain gives
+    up on a message while the loop runs
+    """
+
+    __slots__ = (
+        "chat_rate",
+        "chat_burst",
+        "global_bucket",
+        "chats",
+        "wakeup",
+        "dispatcher",
+        "sends",
+    )
+
+    def __init__(self, chat_rate: float, chat_burst: float, global_rate: float) -> None:
+        self.chat_rate: float = chat_rate
+        self.chat_burst: float = chat_burst
+        self.global_bucket: TokenBucket = TokenBucket(global_rate, global_rate)
+        self.chats: dict[int, ChatQueue] = dict()
+        self.wakeup: asyncio.Event = asyncio.Event()
+        self.dispatcher: Optional[asyncio.Task] = None
+        self.sends: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return sum(len(chat.messages) for chat in self.chats.values())
+
+    def put(self, message: Message) -> None:
+        chat: Optional[ChatQueue] = self.chats.get(message.chat_id, None)
+        if chat is None:
+            chat = ChatQueue(TokenBucket(self.chat_rate, self.chat_burst))
+            self.chats[message.chat_id] = chat
+        message.queued_at = time.monotonic()
+        trace: Optional[metrics.Trace] = metrics.TRACE.get()
+        if trace is not None:
+            trace.queued()
+            message.traces.append(trace)
+        sends: Optional[list[asyncio.Future]] = SENDS.get()
+        if sends is not None:
+            done: asyncio.Future = asyncio.get_running_loop().create_future()
+            sends.append(done)
+            message.done.append(done)
+        chat.messages.append(message)
+        self.ensure_dispatcher()
+        self.wakeup.set()
+
+    def ensure_dispatcher(self) -> asyncio.Task:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        dispatcher: Optional[asyncio.Task] = self.dispatcher
+        if dispatcher is not None and dispatcher.get_loop() is loop:
+            if not dispatcher.done():
+                return dispatcher
+        elif dispatcher is not None:
+            # The runtime replaced the loop, sends in flight on it never finish
+            for chat in self.chats.values():
+                chat.is_sending = False
+        # Created on the loop it is used on, the event of an old loop is unusable
+        self.wakeup = asyncio.Event()
+        self.sends = set()
+        # Not in the context of the update that happened to put first
+        self.dispatcher = loop.create_task(self.dispatch(), context=Context())
+        return self.dispatcher
+
+    async def drain(self, sends: Collection[asyncio.Future], timeout: float) -> int:
+        """Waits up to `timeout` seconds for the messages of `sends` to be sent
+        or dropped, returns how many are still queued or in flight
+
+        Messages of other callers and chats told to retry later never hold
+        it up past the deadline
+        """
+        pending: list[asyncio.Future] = [done for done in sends if not done.done()]
+        if len(pending) == 0:
+            return 0
+        self.ensure_dispatcher()
+        _done, not_done = await asyncio.wait(pending, timeout=timeout)
+        return len(not_done)
+
+    async def close(self, timeout: float) -> int:
+        """Waits up to `timeout` seconds for every message, drops the rest
+
+        Returns how many were dropped, messages in flight are left to finish
+        """
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        deadline: float = loop.time() + timeout
+        while len(self) > 0 or len(self.sends) > 0:
+            dispatcher: asyncio.Task = self.ensure_dispatcher()
+            remaining: float = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.wait((dispatcher,), timeout=remaining)
+        return self.drop(None)
+
+    def drop(self, sends: Optional[Collection[asyncio.Future]]) -> int:
+        """Drops queued messages with a future in `sends`, all of them for None"""
+        dropped: int = 0
+        for chat_id, chat in self.chats.items():
+            kept: deque[Message] = deque()
+            for message in chat.messages:
+                if sends is not None and not any(
+                    done in sends for done in message.done
+                ):
+                    kept.append(message)
+                    continue
+                dropped += 1
+                warnings.warn(f"Reply to chat {chat_id} dropped, not sent in time")
+                if message.on_failed is not None:
+                    message.on_failed()
+                message.finish(0.0, 0)
+            chat.messages = kept
+        return dropped
+
+    def next_chat(self, now: float) -> tuple[Optional[int], float]:
+        """The chat to send to now and else how long until one can be sent to"""
+        best: Optional[tuple[int, float]] = None
+        best_chat_id: Optional[int] = None
+        wait: float = float("inf")
+        for chat_id, chat in list(self.chats.items()):
+            if len(chat.messages) == 0:
+                if not chat.is_sending and chat.bucket.is_full(now):
+                    # Nothing to remember about the chat anymore
+                    del self.chats[chat_id]
+                continue
+            elif chat.is_sending:
+                continue
+            delay: float = max(chat.retry_at - now, chat.bucket.delay(now))
+            if delay > 0:
+                wait = min(wait, delay)
+                continue
+            priority: int = min(message.priority for message in chat.messages)
+            rank: tuple[int, float] = (priority, chat.messages[0].queued_at)
+            if best is None or rank < best:
+                best, best_chat_id = rank, chat_id
+        return best_chat_id, wait
+
+    async def dispatch(self) -> None:
+        while len(self) > 0 or len(self.sends) > 0:
+            self.wakeup.clear()
+            now: float = time.monotonic()
+            chat_id, wait = self.next_chat(now)
+            if chat_id is not None:
+                wait = self.global_bucket.delay(now)
+            if chat_id is None or wait > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), min(wait, 60.0))
+                except TimeoutError:
+                    pass
+                continue
+
+            chat: ChatQueue = self.chats[chat_id]
+            message: Message = chat.messages.popleft()
+            while len(chat.messages) > 0 and message.can_merge(chat.messages[0]):
+                message.merge(chat.messages.popleft())
+            chat.bucket.take(now)
+            self.global_bucket.take(now)
+            chat.is_sending = True
+            send: asyncio.Task = asyncio.get_running_loop().create_task(
+                self.send(chat, message)
+            )
+            self.sends.add(send)
+            send.add_done_callback(self.sends.discard)
+
+    async def send(self, chat: ChatQueue, message: Message) -> None:
+        reply_parameters: Optional[ReplyParameters] = (
+            ReplyParameters(message.reply_to, allow_sending_without_reply=True)
+            if message.reply_to is not None
+            else None
+        )
+        sent: Sent
+        started_at: float = time.perf_counter()
+        try:
+            if message.photo is not None:
+                sent = await message.bot.send_photo(
+                    message.chat_id,
+                    message.photo,
+                    reply_markup=message.reply_markup,
+                    reply_parameters=reply_parameters,
+                )
+            else:
+                sent = await message.bot.send_message(
+                    message.chat_id,
+                    message.text,
+                    reply_markup=message.reply_markup,
+                    reply_parameters=reply_parameters,
+                )
+        except RetryAfter as e:
+            # Back in front, only this chat waits
+            chat.retry_at = time.monotonic() + e.retry_after
+            chat.messages.appendleft(message)
+            return
+        except TelegramError as e:
+            warnings.warn(f"Reply to chat {message.chat_id} dropped: {e}")
+            if message.on_failed is not None:
+                message.on_failed()
+        else:
+            if message.on_sent is not None:
+                await message.on_sent(sent)
+        finally:
+            chat.is_sending = False
+            self.wakeup.set()
+        message.finish(time.perf_counter() - started_at, message.size())
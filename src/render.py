@@ -0,0 +1,53 @@
+import json
+import warnings
+from pathlib import Path
+from typing import Optional
+
+from monopoly import Event, PoorResult
+
+
+# Event.kind to a str.format template filled from Event.fields
+Templates = dict[str, str]
+
+
+def load_locales(directory: Optional[str]) -> dict[str, Templates]:
+    """Every <language>.json in the directory, read once at startup"""
+    if directory is None:
+        return {}
+    return {
+        path.stem: json.loads(path.read_text(encoding="utf-8"))
+        for path in Path(directory).glob("*.json")
+    }
+
+
+def language(language_code: Optional[str]) -> Optional[str]:
+    """Telegram sends IETF tags like "pt-br", templates are per language"""
+    if language_code is None:
+        return None
+    return language_code.split("-", 1)[0].lower()
+
+
+def text(result: PoorResult, templates: Optional[Templates]) -> str:
+    """The reply for a move, only called when there is a reply to send
+
+    Without templates it's the English text cached by the engine, events
+    missing from the templates fall back to it one by one
+    """
+    if not templates:
+        return result.out
+    return " \n".join(fill(event, templates) for event in result.events)
+
+
+def fill(event: Event, templates: Templates) -> str:
+    """A template naming a field the event doesn't have falls back to English
+
+    The move is already made by the time it's rendered, the reply must go out
+    """
+    template: Optional[str] = templates.get(event.kind, None)
+    if template is None:
+        return str(event)
+    try:
+        return template.format_map(event.fields)
+    except (KeyError, IndexError, ValueError, AttributeError) as e:
+        warnings.warn(f"Template for {event.kind} is broken: {e}")
+        return str(event)
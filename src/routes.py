@@ -0,0 +1,77 @@
+import os
+from typing import Optional
+
+
+# What the game answers to, nothing in here imports telegram so index can
+# tell whether an invocation needs the bot at all before loading it
+
+COMMANDS: frozenset[str] = frozenset(
+    (
+        "start",
+        "begin",
+        "help",
+        "roll",
+        "buy",
+        "auction",
+        "bid",
+        "rent",
+        "trade",
+        "finish",
+        "status",
+        "map",
+        "build",
+    )
+)
+# The bot's username without the @, so commands to other bots in the group are
+# dropped before lib is loaded. Unset, lib drops them once it knows the name
+BOT_USERNAME: Optional[str] = os.environ.get("BOT_USERNAME") or None
+# callback_data of the inline buttons, each named after the command it stands for
+BUTTONS: dict[str, str] = {
+    "1": "start",
+    "2": "begin",
+    "3": "help",
+    "4": "roll",
+    "5": "buy",
+    "6": "auction",
+    "7": "bid",
+    "8": "rent",
+    "9": "trade",
+    "10": "finish",
+    "11": "status",
+    "12": "map",
+    "13": "build",
+}
+
+
+def body_request(body: dict) -> tuple[Optional[str], Optional[str]]:
+    """Message text and callback data of an update as Telegram sent it"""
+    query: Optional[dict] = body.get("callback_query")
+    if query is not None:
+        return None, query.get("data")
+    message: Optional[dict] = body.get("message") or body.get("edited_message")
+    return (message.get("text") if message is not None else None), None
+
+
+def command_of(
+    text: Optional[str], data: Optional[str], username: Optional[str]
+) -> Optional[tuple[str, list[str]]]:
+    """Command and the words after it, None for what the game ignores
+
+    username of the bot, None takes commands to any bot until it's known
+    """
+    if data is not None:
+        name: Optional[str] = BUTTONS.get(data, None)
+        return (name, []) if name is not None else None
+    if text is None or not text.startswith("/"):
+        return None
+    words: list[str] = text.split()
+    command, _, to = words[0][1:].partition("@")
+    if to != "" and username is not None and to.lower() != username.lower():
+        # A command to another bot in the same group
+        return None
+    command = command.lower()
+    return (command, words[1:]) if command in COMMANDS else None
+
+
+def is_wanted(body: dict) -> bool:
+    return command_of(*body_request(body), BOT_USERNAME) is not None
@@ -11,6 +11,8 @@ SELECT
 	game.biggest_bid, 
 	game.bid_time_sec,
 	game.bidder_id,
+	game.version,
+	game.rng_state,
 	meta.username,
     player.tile_id,
 	player.house_count
@@ -0,0 +1,84 @@
+import os
+import signal
+import asyncio
+import warnings
+from telegram import Update
+from typing import Optional
+
+from lib import App, AUCTION_SWEEP_SEC
+
+
+# A resident process instead of index.handler, long polls Telegram for updates
+# and hands them to the same App, a webhook on the bot has to be removed first
+
+# How long a getUpdates call waits for an update before returning empty
+POLL_TIMEOUT_SEC: int = int(os.environ.get("POLL_TIMEOUT_SEC", "30"))
+# Updates fetched per call, 100 is the most Telegram hands out
+POLL_LIMIT: int = int(os.environ.get("POLL_LIMIT", "100"))
+# Nothing else settles auctions on time here, so the sweep is always on
+SWEEP_SEC: float = AUCTION_SWEEP_SEC if AUCTION_SWEEP_SEC > 0 else 1.0
+
+
+async def poll(app: App, offset: Optional[int]) -> tuple[Update, ...]:
+    """Updates from `offset` on, confirms every update before it"""
+    return await app.app.bot.get_updates(
+        offset=offset, limit=POLL_LIMIT, timeout=POLL_TIMEOUT_SEC
+    )
+
+
+async def confirm(app: App, offset: int) -> None:
+    """Confirms the last batch, otherwise the next start processes it again"""
+    try:
+        await app.app.bot.get_updates(offset=offset, limit=1, timeout=0)
+    except Exception as e:
+        warnings.warn(f"Last batch not confirmed: {e}")
+
+
+async def serve() -> None:
+    """Runs until SIGTERM or SIGINT, the batch being processed is finished first"""
+    app: App = App()
+    await app.start(None)
+
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    stopping: asyncio.Event = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        # Replaces the teardown App.start registers, it would stop mid batch
+        loop.add_signal_handler(signum, stopping.set)
+    if app.sweeper is None:
+        app.sweeper = loop.create_task(app.sweep_forever(SWEEP_SEC))
+
+    offset: Optional[int] = None
+    try:
+        while not stopping.is_set():
+            polling: asyncio.Task = loop.create_task(poll(app, offset))
+            stopped: asyncio.Task = loop.create_task(stopping.wait())
+            await asyncio.wait((polling, stopped), return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
+            if not polling.done():
+                # Nothing in flight, the updates stay with Telegram
+                polling.cancel()
+                break
+
+            try:
+                updates: tuple[Update, ...] = polling.result()
+            except Exception as e:
+                # Network errors and Telegram being down, the next call retries
+                warnings.warn(f"Polling failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if len(updates) == 0:
+                continue
+            # A failed update isn't fetched again, same as a queue message
+            offset = updates[-1].update_id + 1
+            try:
+                await app.handle_updates(list(updates))
+            except Exception as e:
+                warnings.warn(f"Update failed: {e}")
+    finally:
+        if offset is not None:
+            await confirm(app, offset)
+        await app.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
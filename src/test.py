@@ -1,10 +1,35 @@
 import os
+import sys
 import asyncio
-from psycopg import Connection
+import subprocess
+from contextlib import redirect_stdout
+from io import StringIO
+import json
+import random
+import struct
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import psycopg
+from psycopg import AsyncConnection, Connection
+from psycopg.types.json import Jsonb
+from telegram.error import Forbidden, RetryAfter
+from typing import Any, Optional
 
-from monopoly import SerGame, Game
+import db
+import compact
+import render
+import outbox
+import board
+import metrics
+import routes
+from monopoly import SerGame, Game, SimStats, simulate, play_batch, TILE_COUNT
 from index import handler
+from lib import App, COMPACT_STORE, DB_CONN, HANDLERS, INLINE_BUTTONS
+from cache import CacheEntry
+from routes import COMMANDS, body_request, command_of
 from db import connect_to_db, fetch_game
+from migrate import migrate
 
 
 async def test_handler() -> None:
@@ -68,24 +93,784 @@ def test_serialize() -> None:
     print(ser_game.current_player)
     print(ser_game.status)
     print(ser_game.players)
+    # Ownership is a byte per tile, 0 if not owned or house_count + 1
+    ownership: bytes = ser_game.players[0][2]
+    assert isinstance(ownership, bytes) and len(ownership) == TILE_COUNT
+    try:
+        SerGame(
+            0, "roll", [(0, None, bytes([7]) * TILE_COUNT, 0, 0, False, 0)], 0, 0, 0
+        )
+    except ValueError:
+        pass
+    else:
+        assert False, "more than a hotel"
 
 
-def test_db() -> None:
-    conn: Connection = connect_to_db(None)
+def test_compact_codec() -> None:
+    game = Game(((0, "Gaming"), (1, None)))
+    # Some owned tiles so ownership is not empty
+    for user_id in (0, 1) * 10:
+        game.roll(user_id)
+        game.buy(user_id)
+    ser_game: SerGame = game.serialize()
+    # Through JSON the same way as it goes through jsonb
+    state: dict[str, Any] = json.loads(json.dumps(compact.encode(ser_game)))
+    decoded: SerGame = compact.decode(state)
+    assert decoded.current_player == ser_game.current_player
+    assert decoded.status == ser_game.status
+    assert decoded.players == ser_game.players
+    assert decoded.biggest_bid == ser_game.biggest_bid
+    assert decoded.bid_time_sec == ser_game.bid_time_sec
+    assert decoded.bidder_id == ser_game.bidder_id
+    assert decoded.rng_state == ser_game.rng_state
+
+
+def assert_same_game(left: Game, right: Game) -> None:
+    left_ser: SerGame = left.serialize()
+    right_ser: SerGame = right.serialize()
+    assert left_ser.current_player == right_ser.current_player
+    assert left_ser.status == right_ser.status
+    assert left_ser.players == right_ser.players
+    assert left_ser.biggest_bid == right_ser.biggest_bid
+    assert left_ser.bid_time_sec == right_ser.bid_time_sec
+    assert left_ser.bidder_id == right_ser.bidder_id
+    assert left_ser.rng_state == right_ser.rng_state
+
+
+def test_seeded_replay() -> None:
+    players: list[tuple[int, Optional[str]]] = [(1, "first"), (2, "second")]
+    # The same seed and the same moves roll the same dice
+    original = Game(players, seed=2**64 - 1)
+    replay = Game(players, seed=2**64 - 1)
+    for turn in range(100):
+        user_id: int = players[turn % 2][0]
+        assert original.roll(user_id)[0].out == replay.roll(user_id)[0].out
+        original.buy(user_id)
+        replay.buy(user_id)
+        if turn == 50:
+            # Stored and loaded mid-game it carries on rolling the same
+            replay, _maybe_auction = Game.deserialize(replay.serialize())
+    assert original.to_bytes() == replay.to_bytes()
+
+
+def test_simulate() -> None:
+    for policy in ("buy", "auction", "random"):
+        stats: SimStats = simulate(64, 4, policy, seed=7)
+        # Same seed same games, whichever thread played them
+        assert stats.turns == simulate(64, 4, policy, seed=7).turns
+        assert stats.games == 64
+        assert sum(stats.landings) == stats.turns
+        assert stats.landings[30] == 0, "Go to jail moves the player to 10"
+    assert simulate(8, 1).turns == 0
+    try:
+        simulate(1, 2, "sell")
+    except ValueError:
+        pass
+    else:
+        assert False, "unknown policy"
+
+
+def test_render() -> None:
+    game = Game([(1, "first"), (2, None)], seed=0)
+    output, maybe_change = game.roll(1)
+    assert maybe_change is not None
+    events: list = output.events
+    assert events[0].kind == "rolled" and events[-1].kind == "balance"
+    assert events[0].fields["user_id"] == 1
+    # English comes from the engine, with or without an empty template table
+    assert render.text(output, None) == output.out
+    assert render.text(output, {}) == " \n".join(map(str, events))
+    # Kinds without a template stay in English
+    lines: list[str] = render.text(output, {"rolled": "{name}: {tile}"}).split(" \n")
+    assert lines[0] == f"first: {events[0].fields['tile']}"
+    assert lines[1:] == output.out.split(" \n")[1:]
+    # A template with a field the event lacks or a bad format is English too
+    for broken in ("{nope}", "{0}", "{name:d}", "{"):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter("always")
+            lines = render.text(output, {"rolled": broken}).split(" \n")
+        assert lines == output.out.split(" \n")
+    # Nothing happened, nothing to render
+    output, maybe_bid = game.bid(2, 100)
+    assert maybe_bid is None and not output and output.out == ""
+
+
+def test_play_batch() -> None:
+    games: list[Game] = [
+        Game([(1, None), (2, "second")], seed=seed) for seed in range(8)
+    ]
+    played: list = play_batch([(game.to_bytes(), "roll", 1, None) for game in games])
+    assert len(played) == len(games)
+    # The same as one game at a time, the seed is in the bytes
+    for game, (data, output, result, maybe_auction) in zip(games, played):
+        expected_output, expected_result = game.roll(1)
+        assert output.out == expected_output.out
+        assert result == expected_result
+        assert data == game.to_bytes()
+        assert maybe_auction is None
+    for bad_move in (
+        (b"", "roll", 1, None),
+        (games[0].to_bytes(), "build", 1, TILE_COUNT),
+        (games[0].to_bytes(), "bid", 1, None),
+        (games[0].to_bytes(), "trade", 1, None),
+    ):
+        try:
+            play_batch([bad_move])
+        except ValueError:
+            pass
+        else:
+            assert False, bad_move
+
+
+def test_threads(seed: int = 0, games: int = 16, rolls: int = 50) -> None:
+    def replay(game: Game) -> list:
+        return [game.roll(user_id)[1] for _ in range(rolls) for user_id in (1, 2)]
+
+    def new_games() -> list[Game]:
+        return [Game([(1, None), (2, "b")], seed=seed + i) for i in range(games)]
+
+    # Games on worker threads play out as they do on the main thread
+    expected: list[list] = [replay(game) for game in new_games()]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert list(pool.map(replay, new_games())) == expected
+
+    # Threads sharing one game see whole moves, never half of one
+    shared: Game = Game([(1, None), (2, "b")], seed=seed)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for _ in pool.map(replay, [shared] * 8):
+            pass
+    assert Game.from_bytes(shared.to_bytes())[0].to_bytes() == shared.to_bytes()
+
+
+def test_settle() -> None:
+    game: Game = Game([(1, None), (2, "b")], seed=0)
+    while not game.is_auction():
+        for user_id in (1, 2):
+            game.roll(user_id)
+            game.auction(user_id)
+    data: bytearray = bytearray(game.to_bytes())
+    # bid_time_sec comes after version, status, current_player and biggest_bid
+    data[12:20] = (0).to_bytes(8, "little")
+
+    # Loading only reads, the auction stays open until settled
+    open_game, maybe_auction = Game.from_bytes(bytes(data), settle=False)
+    assert maybe_auction is None and open_game.get_bid_time_sec() == 0
+    output, maybe_settled = open_game.settle()
+    assert maybe_settled is not None
+    _user_id, money, tile_id = maybe_settled
+    assert [event.kind for event in output.events] == ["auction_won"]
+    assert open_game.settle()[1] is None and open_game.get_bid_time_sec() is None
+
+    # The same as settling on load
+    settled_game, expected = Game.from_bytes(bytes(data))
+    assert (money, tile_id) == expected
+    assert open_game.to_bytes() == settled_game.to_bytes()
+
+
+class FakeBot:
+    """Records what would be sent, the first message to a chat in `busy` fails
+
+    Messages to chats in `blocked` are refused for good
+    """
+
+    def __init__(
+        self,
+        busy: set[int],
+        blocked: frozenset[int] = frozenset(),
+        retry_after: int = 0,
+    ) -> None:
+        self.busy: set[int] = busy
+        self.blocked: frozenset[int] = blocked
+        self.retry_after: int = retry_after
+        self.sent: list[tuple[int, str]] = []
+
+    async def send_message(self, chat_id: int, text: str, **_kwargs: Any) -> None:
+        await asyncio.sleep(0)
+        if chat_id in self.blocked:
+            raise Forbidden("bot was blocked by the user")
+        if chat_id in self.busy:
+            self.busy.remove(chat_id)
+            raise RetryAfter(self.retry_after)
+        self.sent.append((chat_id, text))
+
+
+def put_tracked(box: outbox.Outbox, *messages: outbox.Message) -> list:
+    """Puts the messages as a batch would, returns what drain waits for"""
+    sends: list[asyncio.Future] = []
+    token = outbox.SENDS.set(sends)
+    for message in messages:
+        box.put(message)
+    outbox.SENDS.reset(token)
+    return sends
+
+
+def test_outbox() -> None:
+    async def run() -> FakeBot:
+        bot: FakeBot = FakeBot({3})
+        box: outbox.Outbox = outbox.Outbox(1000.0, 1.0, 1000.0)
+        # Chats compete for the global limit from the first message on
+        box.global_bucket.tokens = 0.0
+        sends: list = put_tracked(
+            box,
+            outbox.Message(bot, 2, "status", priority=outbox.INFO),
+            *(outbox.Message(bot, 1, text) for text in ("a", "b", "c")),
+            outbox.Message(bot, 3, "d"),
+        )
+        assert await box.drain(sends, 5.0) == 0
+        assert len(box) == 0
+        return bot
+
+    async def held_up() -> FakeBot:
+        bot: FakeBot = FakeBot({5}, retry_after=60)
+        box: outbox.Outbox = outbox.Outbox(1000.0, 5.0, 1000.0)
+        # Put by someone else, the chat is told to retry in a minute
+        box.put(outbox.Message(bot, 5, "late"))
+        sends: list = put_tracked(box, outbox.Message(bot, 6, "mine"))
+        assert await box.drain(sends, 5.0) == 0
+        # A batch with a reply to that chat waits until the deadline
+        sends = put_tracked(box, outbox.Message(bot, 5, "later"))
+        assert await box.drain(sends, 0.05) == 1
+        with warnings.catch_warnings(record=True):
+            assert box.drop(set(sends)) == 1
+        assert len(box) == 1 and sends[0].done()
+        return bot
+
+    async def refused() -> list[int]:
+        failed: list[int] = []
+        bot: FakeBot = FakeBot(set(), frozenset({4}))
+        box: outbox.Outbox = outbox.Outbox(1000.0, 5.0, 1000.0)
+        box.put(outbox.Message(bot, 4, "e", on_failed=partial(failed.append, 4)))
+        with warnings.catch_warnings(record=True):
+            await box.close(5.0)
+        return failed
+
+    bot: FakeBot = asyncio.run(run())
+    # Pending texts of a chat go as one, before the /status put earlier
+    assert bot.sent[0] == (1, "a\n\nb\n\nc")
+    # Told to retry, the chat got its message later instead of losing it
+    assert sorted(bot.sent) == [(1, "a\n\nb\n\nc"), (2, "status"), (3, "d")]
+    # Dropped for good, whoever put it is told
+    assert asyncio.run(refused()) == [4]
+    # Only the batch's own replies are waited for, and not past the deadline
+    assert asyncio.run(held_up()).sent == [(6, "mine")]
+
+
+def test_trace() -> None:
+    async def run() -> metrics.Trace:
+        box: outbox.Outbox = outbox.Outbox(1000.0, 5.0, 1000.0)
+        trace: metrics.Trace = metrics.Trace("roll", 1)
+        token = metrics.TRACE.set(trace)
+        with metrics.span("engine"):
+            box.put(outbox.Message(FakeBot(set()), 1, "rolled"))
+        metrics.TRACE.reset(token)
+        # Not written until the reply is sent
+        trace.handled(None)
+        assert trace.pending == 1
+        assert await box.close(5.0) == 0
+        return trace
+
+    output: StringIO = StringIO()
+    with redirect_stdout(output):
+        asyncio.run(run())
+    lines: list[str] = output.getvalue().splitlines()
+    assert len(lines) == 1
+    line: dict[str, Any] = json.loads(lines[0])
+    assert line["command"] == "roll" and line["error"] is None
+    assert line["calls"] == {"engine": 1, "reply": 1}
+    assert line["bytes"] == {"reply": len("rolled")}
+    assert line["ms"] >= line["handled_ms"] >= line["phases_ms"]["engine"]
+
+
+def test_route() -> None:
+    def route(body: dict, username: Optional[str] = "bot") -> Optional[tuple]:
+        return command_of(*body_request(body), username)
+
+    assert route({"message": {"text": "hi all"}}) is None
+    assert route({"message": {"photo": []}}) is None
+    assert route({"my_chat_member": {}}) is None
+    assert route({"message": {"text": "/nope"}}) is None
+    assert route({"message": {"text": "/Bid 120 now"}}) == ("bid", ["120", "now"])
+    assert route({"message": {"text": "/roll@Bot"}}) == ("roll", [])
+    # A command to another bot, taken while the bot's name isn't known
+    assert route({"message": {"text": "/roll@other"}}) is None
+    assert route({"message": {"text": "/roll@other"}}, None) == ("roll", [])
+    # And index skips it without loading lib once given the bot's name
+    name: Optional[str] = routes.BOT_USERNAME
+    routes.BOT_USERNAME = "bot"
+    try:
+        assert not routes.is_wanted({"message": {"text": "/roll@other"}})
+        assert routes.is_wanted({"message": {"text": "/roll@Bot"}})
+        assert routes.is_wanted({"message": {"text": "/roll"}})
+    finally:
+        routes.BOT_USERNAME = name
+    # Every button goes to the command it is named after
+    for button in INLINE_BUTTONS.values():
+        query: dict = {"callback_query": {"data": button.callback_data}}
+        assert route(query) == (button.text, [])
+    assert route({"callback_query": {"data": "99"}}) is None
+    # And every command has a handler
+    assert HANDLERS.keys() == COMMANDS
+    assert all(callable(getattr(App, method)) for method in HANDLERS.values())
+
+
+def test_board() -> None:
+    game: Game = Game([(1, None), (2, "b")], seed=0)
+    shown: board.Board = board.board_of(game, 2)
+    assert shown.names == ("1", "b") and shown.caller == 1
+    assert board.board_of(game, 2).key() == shown.key()
+    # Whoever asks is drawn differently, so is every move
+    assert board.board_of(game, 1).key() != shown.key()
+    game.roll(1)
+    assert board.board_of(game, 2).key() != shown.key()
+
+    boxes: set[tuple[int, int, int, int]] = set(map(board.tile_box, range(TILE_COUNT)))
+    assert len(boxes) == TILE_COUNT
+    assert all(0 <= edge <= board.BOARD_PX for box in boxes for edge in box)
+    png: bytes = board.draw(shown)
+    assert png.startswith(b"\x89PNG")
+    assert board.draw(board.board_of(None, None)).startswith(b"\x89PNG")
+
+    # PNGs are kept only while uploading, file_ids until pushed out
+    cache: board.BoardCache = board.BoardCache(1)
+    cache.upload("a", png)
+    assert cache.get("a") == png
+    cache.failed("a")
+    assert cache.get("a") is None
+    cache.upload("a", png)
+    cache.put("a", "file a")
+    assert cache.get("a") == "file a" and len(cache.uploads) == 0
+    cache.put("b", "file b")
+    assert cache.get("a") is None and cache.get("b") == "file b"
+
+
+# Cold start of the entry points on a fresh interpreter, raise for slow machines
+IMPORT_BUDGET_MS: dict[str, float] = {
+    "index": float(os.environ.get("INDEX_IMPORT_BUDGET_MS", "50")),
+    "lib": float(os.environ.get("LIB_IMPORT_BUDGET_MS", "800")),
+}
+# Loaded on first use, importing the module must not load any of them
+LAZY_IMPORTS: dict[str, tuple[str, ...]] = {
+    "index": ("lib", "telegram", "psycopg", "monopoly", "PIL"),
+    "lib": ("PIL",),
+}
+
+
+def import_time(module: str, runs: int = 3) -> tuple[float, set[str]]:
+    """Best milliseconds of `python -X importtime` and the modules it loaded"""
+    best_ms: float = float("inf")
+    loaded: set[str] = set()
+    for _ in range(runs):
+        result: subprocess.CompletedProcess = subprocess.run(
+            (sys.executable, "-X", "importtime", "-c", f"import {module}"),
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        # self [us] | cumulative [us] | name, the module itself comes last
+        rows: list[list[str]] = [
+            line.removeprefix("import time:").split("|")
+            for line in result.stderr.splitlines()
+            if line.startswith("import time:")
+        ]
+        rows = [row for row in rows if row[0].strip().isdigit()]
+        loaded = {row[2].strip() for row in rows}
+        best_ms = min(best_ms, int(rows[-1][1]) / 1000)
+    return best_ms, loaded
+
+
+def test_import_budget() -> None:
+    for module, budget_ms in IMPORT_BUDGET_MS.items():
+        took_ms, loaded = import_time(module)
+        print(f"import {module}: {took_ms:.1f} ms")
+        eager: list[str] = [name for name in LAZY_IMPORTS[module] if name in loaded]
+        assert len(eager) == 0, f"import {module} loads {eager}"
+        assert took_ms <= budget_ms, f"import {module} over {budget_ms} ms"
+    # A command to another bot is dropped before lib is imported
+    body: str = json.dumps({"message": {"text": "/roll@other"}})
+    event: dict = {"messages": [{"details": {"message": {"body": body}}}]}
+    subprocess.run(
+        (
+            sys.executable,
+            "-c",
+            "import asyncio, sys, index;"
+            f"asyncio.run(index.handler({event!r}, None));"
+            "assert 'lib' not in sys.modules, 'lib loaded'",
+        ),
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "BOT_USERNAME": "bot"},
+    )
+
+
+def test_bytes_round_trip(seed: int = 0, games: int = 200) -> None:
+    rng = random.Random(seed)
+    for _ in range(games):
+        user_ids: list[int] = rng.sample(range(1, 2**40), rng.randint(1, 8))
+        game = Game([(id_, rng.choice((None, f"user{id_}"))) for id_ in user_ids])
+        # Random moves by random players, most of them are rejected by the engine
+        for _ in range(rng.randint(0, 200)):
+            user_id: int = rng.choice(user_ids)
+            move: int = rng.randrange(5)
+            if move == 0:
+                game.roll(user_id)
+            elif move == 1:
+                game.buy(user_id)
+            elif move == 2:
+                game.rent(user_id)
+            elif move == 3:
+                game.build(user_id, rng.randrange(40))
+            else:
+                game.auction(user_id)
+                game.bid(rng.choice(user_ids), rng.randint(41, 400))
+
+        data: bytes = game.to_bytes()
+        decoded, _maybe_auction = Game.from_bytes(data)
+        if not game.is_auction():
+            assert_same_game(game, decoded)
+            assert decoded.to_bytes() == data
+
+        # Damaged input is an error, never a crash
+        for cut in range(len(data)):
+            try:
+                Game.from_bytes(data[:cut])
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"Truncated to {cut} bytes was accepted")
+        for _ in range(20):
+            damaged = bytearray(data)
+            damaged[rng.randrange(len(data))] ^= rng.randint(1, 255)
+            try:
+                Game.from_bytes(bytes(damaged))
+            except ValueError:
+                pass
+
+        # A game without players, the header is 36 bytes and player_count follows
+        empty: bytes = data[:2] + bytes(2) + data[4:36] + bytes(2)
+        try:
+            Game.from_bytes(empty)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("A game without players was accepted")
+
+    # Tiles nobody can own, houses off the streets and tiles owned twice
+    header: bytes = Game([(1, None), (2, None)], seed=seed).to_bytes()[:36]
+
+    def two_players(status: int, position: int, *tiles: bytes) -> bytes:
+        # Player 1 to move and the bidder, if there is an auction
+        data: bytes = header[:1] + bytes((status,)) + bytes(2) + header[4:20]
+        data += (1).to_bytes(8, "little") + header[28:36] + (2).to_bytes(2, "little")
+        for user_id, owned in zip((1, 2), tiles):
+            # No username, position, money, is_jailed, streak and the tile count
+            data += struct.pack(
+                "<QBBqBBB", user_id, 255, position, 1500, 0, 0, len(owned) // 2
+            )
+            data += owned
+        return data
+
+    # (tile_id, house_count) pairs, 1 and 3 are streets, 5 a railroad, 12 a utility
+    Game.from_bytes(two_players(0, 0, bytes((1, 2, 5, 0)), bytes((3, 0))))
+    Game.from_bytes(two_players(2, 1, b"", bytes((3, 0))))
+    for bad in (
+        two_players(0, 0, bytes((0, 0)), b""),
+        two_players(0, 0, bytes((4, 0)), b""),
+        two_players(0, 0, bytes((7, 0)), b""),
+        two_players(0, 0, bytes((10, 0)), b""),
+        two_players(0, 0, bytes((5, 1)), b""),
+        two_players(0, 0, bytes((12, 1)), b""),
+        two_players(0, 0, bytes((1, 0, 1, 0)), b""),
+        two_players(0, 0, bytes((1, 0)), bytes((1, 0))),
+        # An auction of an owned tile or of Go
+        two_players(2, 1, bytes((1, 0)), b""),
+        two_players(2, 0, b"", b""),
+    ):
+        try:
+            Game.from_bytes(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Invalid ownership was accepted: {bad.hex()}")
+
+
+async def test_db() -> None:
+    conn: AsyncConnection = await connect_to_db(None)
     chat_0: int = 0
-    maybe_game_0 = fetch_game(conn, chat_0)
+    maybe_game_0 = await fetch_game(conn, chat_0)
     assert isinstance(maybe_game_0, Game)
     output, _maybe_change = maybe_game_0.roll(0)
     print(output.out)
 
     chat_1: int = 1
-    maybe_game_1 = fetch_game(conn, chat_1)
+    maybe_game_1 = await fetch_game(conn, chat_1)
     assert isinstance(maybe_game_1, list)
     print(maybe_game_1)
 
 
+async def scratch_db(schema: str) -> AsyncConnection:
+    """A connection to a migrated schema of its own, see drop_scratch_db"""
+    with psycopg.connect(**db.connection_params(None)) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+        conn.execute(f"CREATE SCHEMA {schema};")
+        conn.execute(f"SET search_path TO {schema};")
+        migrate(conn)
+    aconn: AsyncConnection = await connect_to_db(None)
+    await aconn.execute(f"SET search_path TO {schema};")
+    await aconn.commit()
+    return aconn
+
+
+async def drop_scratch_db(conn: AsyncConnection, schema: str) -> None:
+    await conn.rollback()
+    await conn.execute(f"DROP SCHEMA {schema} CASCADE;")
+    await conn.commit()
+    await conn.close()
+
+
+async def test_stale_write() -> None:
+    conn: AsyncConnection = await scratch_db("stale_test")
+    try:
+        for user_id in (1, 2):
+            await db.add_user(conn, 7, user_id, f"p{user_id}")
+        read_at: int = await db.begin_game(conn, 7, (1, 2), 0)
+        moved: Optional[int] = await db.roll_user(
+            conn, 7, 1, 5, 1500, False, 0, False, 0, read_at
+        )
+        assert moved == read_at + 1
+        # Another instance read the same version, its move must not land
+        assert (
+            await db.roll_user(conn, 7, 1, 9, 1000, False, 0, True, 0, read_at) is None
+        )
+        assert await db.buy_user(conn, 7, 1, 1000, 5, read_at) is None
+        assert await db.rent_chat(conn, 7, 1, 0, 2, 0, 0, read_at) is None
+        assert await db.build_player(conn, 7, 1, 0, 5, read_at) is None
+        assert await db.auction_game(conn, 7, 1, 0, read_at) is None
+        assert await db.bid_game(conn, 7, 1, 0, 50, read_at) is None
+        rows: list[dict] = await (await conn.execute(db.SELECT_SQL, (7,))).fetchall()
+        assert {row["user_id"]: (row["position"], row["money"]) for row in rows} == {
+            1: (5, 1500),
+            2: (1, 1500),
+        }
+        assert all(row["tile_id"] is None and row["version"] == moved for row in rows)
+        assert rows[0]["status"] == "roll"
+    finally:
+        await drop_scratch_db(conn, "stale_test")
+
+
+async def test_settle_race() -> None:
+    if COMPACT_STORE:
+        # Written straight to the relational tables below
+        return
+    os.environ.setdefault("BOT_TOKEN", "1:test")
+    conn: AsyncConnection = await scratch_db("settle_race_test")
+    token = DB_CONN.set(conn)
+    app: App = App()
+    settle_auction = db.settle_auction
+    try:
+        for user_id in (1, 2):
+            await db.add_user(conn, 8, user_id, f"p{user_id}")
+        await db.begin_game(conn, 8, (1, 2), 0)
+        # An auction of the tile player 1 stands on, long over
+        await conn.execute(
+            """UPDATE game
+SET status = 'auction', biggest_bid = 40, bid_time_sec = 0, bidder_id = 1
+WHERE chat_id = 8;"""
+        )
+        await conn.commit()
+        read_at: Optional[int] = await db.fetch_version(conn, 8)
+        assert read_at is not None
+        await conn.commit()
+
+        async def settled_first(*args: Any, **kwargs: Any) -> Optional[int]:
+            # Another instance settles it right before this one writes
+            db.settle_auction = settle_auction
+            assert await settle_auction(conn, 8, 1, 1460, 1, read_at)
+            return await settle_auction(*args, **kwargs)
+
+        db.settle_auction = settled_first
+        # The move goes on the settled game instead of no game at all
+        await app.db_sync(8)
+        entry: Optional[CacheEntry] = app.games.lookup(8)
+        assert entry is not None and entry.version == read_at + 1
+        assert not entry.game.is_auction()
+        assert entry.game.serialize().players[0][2][1] == 1
+    finally:
+        db.settle_auction = settle_auction
+        app.games.pop(8, None)
+        DB_CONN.reset(token)
+        await drop_scratch_db(conn, "settle_race_test")
+
+
+# Enough games that the planner would rather not scan whole tables
+SEED_SQL: str = """
+INSERT INTO chat (chat_id, user_id, "position", money)
+SELECT chat_id, chat_id * 4 + seat, 0, 1500
+FROM generate_series(1, 50000) AS chat_id, generate_series(0, 3) AS seat;
+
+INSERT INTO game (chat_id, status, current_player)
+SELECT chat_id, 'roll', 0 FROM generate_series(1, 50000) AS chat_id;
+
+INSERT INTO meta (user_id, username)
+SELECT user_id, 'Player ' || user_id FROM chat;
+
+INSERT INTO player (player_id, tile_id, house_count)
+SELECT player_id, tile_id, 0
+FROM chat, generate_series(1, 5) AS tile_id;
+
+INSERT INTO game_state (chat_id, state)
+SELECT chat_id, '{"ready": []}' FROM generate_series(1, 50000) AS chat_id;
+
+ANALYZE chat, game, meta, player, game_state;
+"""
+
+HOT_QUERIES: tuple[tuple[str, dict[str, Any] | tuple], ...] = (
+    (db.SELECT_SQL, (25000,)),
+    (db.VERSION_SQL, (25000,)),
+    (db.ADD_USER_SQL, {"chat_id": 25000, "user_id": 1, "username": "Player 1"}),
+    (
+        db.BEGIN_GAME_SQL,
+        {"chat_id": 25000, "user_ids": [100000, 100001], "rng_state": 0},
+    ),
+    (
+        db.ROLL_USER_SQL,
+        {
+            "position": 1,
+            "money": 1500,
+            "is_jailed": False,
+            "streak": 0,
+            "user_id": 100000,
+            "chat_id": 25000,
+            "status": "roll",
+            "rng_state": 0,
+            "version": 0,
+        },
+    ),
+    (
+        db.BUY_USER_SQL,
+        {
+            "money": 1400,
+            "chat_id": 25000,
+            "user_id": 100000,
+            "tile_id": 6,
+            "version": 0,
+        },
+    ),
+    (db.FINISH_GAME_SQL, {"chat_id": 25000}),
+    (
+        db.AUCTION_GAME_SQL,
+        {"bid_time_sec": 0, "user_id": 100000, "chat_id": 25000, "version": 0},
+    ),
+    (
+        db.BID_GAME_SQL,
+        {
+            "price": 50,
+            "bid_time_sec": 0,
+            "user_id": 100000,
+            "chat_id": 25000,
+            "version": 0,
+        },
+    ),
+    (
+        db.RENT_CHAT_SQL,
+        {
+            "caller_money": 1500,
+            "chat_id": 25000,
+            "caller_id": 100000,
+            "rentee_money": 1500,
+            "rentee_id": 100001,
+            "rng_state": 0,
+            "version": 0,
+        },
+    ),
+    (
+        db.BUILD_PLAYER_SQL,
+        {
+            "chat_id": 25000,
+            "user_id": 100000,
+            "tile_id": 1,
+            "money": 1400,
+            "version": 0,
+        },
+    ),
+    (
+        db.SETTLE_AUCTION_SQL,
+        {
+            "money": 1400,
+            "chat_id": 25000,
+            "user_id": 100000,
+            "tile_id": 6,
+            "version": 0,
+        },
+    ),
+    (db.EXPIRED_AUCTIONS_SQL, {"before_sec": 0, "limit": 100}),
+    (db.BOARD_IMAGE_SQL, ("0" * 32,)),
+    (db.SAVE_BOARD_IMAGE_SQL, {"board_key": "0" * 32, "file_id": "a"}),
+    (compact.SELECT_STATE_SQL, (25000,)),
+    (compact.VERSION_SQL, (25000,)),
+    (
+        compact.ADD_USER_SQL,
+        {"chat_id": 25000, "user_id": 1, "user": Jsonb([1, "Player 1"])},
+    ),
+    (
+        compact.PUT_GAME_SQL,
+        {"chat_id": 25000, "game": b"game", "bid_time_sec": None},
+    ),
+    (
+        compact.SAVE_GAME_SQL,
+        {"chat_id": 25000, "game": b"game", "bid_time_sec": None, "version": 0},
+    ),
+    (compact.EXPIRED_AUCTIONS_SQL, {"before_sec": 0, "limit": 100}),
+    (compact.FINISH_GAME_SQL, {"chat_id": 25000}),
+)
+
+
+def find_seq_scans(plan: dict) -> list[str]:
+    scans: list[str] = (
+        [plan["Relation Name"]] if plan["Node Type"] == "Seq Scan" else []
+    )
+    for child in plan.get("Plans", []):
+        scans.extend(find_seq_scans(child))
+    return scans
+
+
+def test_query_plans() -> None:
+    conn: Connection = psycopg.connect(**db.connection_params(None))
+    try:
+        # A schema of its own that is rolled back, real games are never touched
+        conn.execute("CREATE SCHEMA plan_test;")
+        conn.execute("SET LOCAL search_path TO plan_test;")
+        migrate(conn)
+        conn.execute(SEED_SQL)
+
+        for query, params in HOT_QUERIES:
+            explain: str = "EXPLAIN (FORMAT JSON) " + query
+            plan: dict = conn.execute(explain, params).fetchone()[0][0]["Plan"]
+            scans: list[str] = find_seq_scans(plan)
+            assert len(scans) == 0, f"Full scan of {scans} in {query}"
+    finally:
+        conn.rollback()
+        conn.close()
+
+
 if __name__ == "__main__":
     asyncio.run(test_handler())
     test_game()
     test_serialize()
-    test_db()
+    test_compact_codec()
+    test_seeded_replay()
+    test_bytes_round_trip()
+    test_simulate()
+    test_render()
+    test_play_batch()
+    test_threads()
+    test_settle()
+    test_outbox()
+    test_trace()
+    test_route()
+    test_board()
+    test_import_budget()
+    asyncio.run(test_db())
+    asyncio.run(test_stale_write())
+    asyncio.run(test_settle_race())
+    test_query_plans()